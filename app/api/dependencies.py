@@ -0,0 +1,14 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.utils.document_loader import VectorStoreHandle
+
+def get_vector_store() -> "VectorStoreHandle":
+    """
+    Dependency providing the process-wide vector store handle.
+    
+    The document loader (and with it langchain and chromadb) is imported on
+    first use so routes that don't need the vector store stay lightweight.
+    """
+    from app.utils.document_loader import get_vector_store_handle
+    return get_vector_store_handle()
@@ -1,8 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import sys
+import json
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-from app.models.chat import ChatMessage, ChatResponse
-from app.utils.openai_utils import get_openai_response
+from app.models.chat import (
+    ChatMessage,
+    ChatResponse,
+    ConversationPage,
+    MessagePage,
+    RetrievalFilters,
+)
+from app.api.dependencies import get_vector_store
+from app.utils.embedding_cache import embedding_cache_stats
+from app.utils.knowledge_base import get_knowledge_base
+from app.utils.warmup import get_warmup
+from app.utils.conversation_store import new_conversation_id
+from app.utils.metadata_filter import MetadataFilter
+from app.utils.response_cache import response_cache_stats
+from app.utils.retrieval import retrieval_enabled
+from app.utils.openai_utils import (
+    get_openai_response,
+    stream_openai_response,
+    conversation_store,
+    request_coalescing_stats,
+)
 
 router = APIRouter()
 
@@ -10,6 +33,29 @@ class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
     user_id: Optional[str] = None
+    filters: Optional[RetrievalFilters] = None
+
+def _parse_filters(request: ChatRequest) -> Optional[MetadataFilter]:
+    """
+    Convert the request's retrieval filters, rejecting with a 400 invalid
+    ones and any filter when the prompt is not built by retrieval (in sample
+    mode every question gets the same knowledge, so nothing could be filtered)
+    """
+    if request.filters is None:
+        return None
+    try:
+        filters = MetadataFilter.from_dict(request.filters.model_dump(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid filters: {str(e)}"
+        )
+    if filters is not None and not retrieval_enabled():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Filters require retrieval; set RETRIEVAL_MODE to vector, lexical or hybrid"
+        )
+    return filters
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
@@ -20,15 +66,25 @@ async def chat(request: ChatRequest):
     - Maintain conversation context within a thread
     - Access the assistant's pre-configured knowledge
     - Leverage the assistant's capabilities
+    
+    Optional `filters` restrict the knowledge retrieved for the answer to
+    given files, pillars, document types or a date range. They need a
+    retrieval mode (RETRIEVAL_MODE vector, lexical or hybrid); otherwise the
+    request is rejected with a 400.
     """
+    filters = _parse_filters(request)
     try:
-        # Use the conversation_id if provided, otherwise create a new one
-        conversation_id = request.conversation_id or "new_conversation"
+        # Use the conversation_id if provided, otherwise start a new conversation
+        # (the generated id is returned so the client can continue it)
+        conversation_id = request.conversation_id or new_conversation_id()
         
         # Pass both the message and conversation_id to maintain thread context
         response = await get_openai_response(
             message=request.message,
-            conversation_id=conversation_id
+            conversation_id=conversation_id,
+            filters=filters,
+            new_conversation=not request.conversation_id,
+            user_id=request.user_id
         )
         
         # Create a response object
@@ -44,3 +100,135 @@ async def chat(request: ChatRequest):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing chat request: {str(e)}"
         )
+
+def _sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format a Server-Sent Event"""
+    payload = json.dumps(data, ensure_ascii=False)
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming chat endpoint using Server-Sent Events.
+    
+    Emits a `start` event with the conversation id (generated when the
+    request has none), one unnamed event per completion delta
+    (`{"delta": "..."}`), and a final `done` event (or an `error` event if
+    the upstream request fails). When the client
+    disconnects, Starlette cancels the response generator, which closes the
+    upstream request.
+    """
+    filters = _parse_filters(request)
+    conversation_id = request.conversation_id or new_conversation_id()
+    
+    async def event_stream():
+        yield _sse_event({"conversation_id": conversation_id}, event="start")
+        
+        stream = stream_openai_response(
+            message=request.message,
+            conversation_id=conversation_id,
+            filters=filters,
+            new_conversation=not request.conversation_id,
+            user_id=request.user_id
+        )
+        try:
+            async for delta in stream:
+                yield _sse_event({"delta": delta})
+            yield _sse_event({"conversation_id": conversation_id, "success": True}, event="done")
+        except Exception as e:
+            yield _sse_event({"detail": f"Error processing chat request: {str(e)}"}, event="error")
+        finally:
+            await stream.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/conversations", response_model=ConversationPage)
+async def list_conversations(
+    user_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """
+    List saved conversations, most recently updated first
+    
+    Pages are fetched with `cursor`, taken from `next_cursor` of the
+    previous page.
+    """
+    # Imported here so the database is only loaded when history is read
+    from app.db import repository
+    
+    await conversation_store.flush()
+    try:
+        page = await repository.list_conversations(user_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return ConversationPage(conversations=page.items, next_cursor=page.next_cursor)
+
+@router.get("/conversations/{conversation_id}/messages", response_model=MessagePage)
+async def list_messages(
+    conversation_id: str,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    newest_first: bool = False
+):
+    """
+    List the saved messages of a conversation, oldest first (or newest
+    first, to page back from the latest turns)
+    """
+    from app.db import repository
+    
+    await conversation_store.flush()
+    try:
+        page = await repository.list_messages(conversation_id, limit, cursor, newest_first)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not page.items and cursor is None and not await repository.conversation_exists(conversation_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found")
+    return MessagePage(conversation_id=conversation_id, messages=page.items, next_cursor=page.next_cursor)
+
+@router.get("/stats")
+async def stats():
+    """Runtime statistics for the in-process caches and stores"""
+    return {
+        "conversation_store": conversation_store.stats(),
+        "embedding_cache": embedding_cache_stats(),
+        "response_cache": response_cache_stats(),
+        "request_coalescing": request_coalescing_stats(),
+        "knowledge_base": get_knowledge_base().stats(),
+        "warmup": get_warmup().stats(),
+        "database_pool": _database_pool_stats()
+    }
+
+def _database_pool_stats():
+    # The engines are created when the database is first used; until then
+    # there is nothing to report (and no reason to import SQLAlchemy)
+    engine_module = sys.modules.get("app.db.engine")
+    return engine_module.pool_stats() if engine_module else {}
+
+@router.post("/vector-store/reload")
+async def reload_vector_store(handle=Depends(get_vector_store)):
+    """Reopen the vector store after the index on disk was rebuilt"""
+    vector_store = await asyncio.to_thread(handle.reload)
+    return {
+        "persist_directory": handle.persist_directory,
+        "loaded": vector_store is not None
+    }
+
+@router.post("/knowledge/reload")
+async def reload_knowledge():
+    """Build a new knowledge snapshot now instead of waiting for the watcher"""
+    knowledge_base = get_knowledge_base()
+    try:
+        await asyncio.to_thread(knowledge_base.refresh, True)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error reloading the knowledge base: {str(e)}"
+        )
+    return knowledge_base.stats()
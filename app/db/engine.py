@@ -0,0 +1,220 @@
+"""
+Database Engines
+
+This module creates the synchronous and asynchronous engines for a database
+URL with the connection pool and SQLite settings taken from environment
+variables:
+
+- Server databases (PostgreSQL) get a bounded pool whose size, overflow,
+  checkout timeout and recycle time are configurable.
+- File-based SQLite databases are switched to write-ahead logging (WAL),
+  where readers keep reading the last committed data while a transaction is
+  writing instead of waiting for it, and writers wait for each other up to a
+  busy timeout instead of failing with "database is locked". Since WAL only
+  flushes to disk at checkpoints, synchronous=NORMAL is safe and avoids a
+  sync on every commit.
+
+Every pool records how many connections were checked out and how long
+callers waited for them; pool_stats() reports them for /api/stats.
+"""
+
+import os
+import time
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Type
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine, URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+# Load environment variables
+load_dotenv()
+
+# Connections kept open in each pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+
+# Connections opened beyond DB_POOL_SIZE under load (closed when returned)
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+
+# Seconds to wait for a connection when the pool is exhausted
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+
+# Seconds after which a connection is replaced (-1 to keep connections open)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+
+# Test connections with a round trip before using them
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+
+# SQLite journal mode (WAL lets readers run while a transaction writes)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+
+# SQLite synchronous setting (NORMAL is safe with WAL)
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+
+# Milliseconds a SQLite connection waits for a lock held by another writer
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+SQLITE_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SQLITE_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+@dataclass
+class PoolStats:
+    """Counters describing how a pool hands out connections"""
+    checkouts: int = 0
+    # Checkouts that found no idle connection, and had to open one or wait
+    exhausted_checkouts: int = 0
+    timeouts: int = 0
+    connections_opened: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def record_checkout(self, seconds: float, exhausted: bool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.exhausted_checkouts += exhausted
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self) -> None:
+        with self._lock:
+            self.connections_opened += 1
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "checkouts": self.checkouts,
+            "exhausted_checkouts": self.exhausted_checkouts,
+            "timeouts": self.timeouts,
+            "connections_opened": self.connections_opened,
+            "avg_wait_ms": round(self.wait_seconds / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+        }
+
+class _MeteredPool:
+    """Mixin timing how long each checkout waits for a connection"""
+    stats: PoolStats
+
+    def _do_get(self):
+        exhausted = self.checkedin() == 0
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        self.stats.record_checkout(time.perf_counter() - start, exhausted)
+        return record
+
+def _metered_pool_class(pool_class: Type[Pool], stats: PoolStats) -> Type[Pool]:
+    # A class per engine, since pools are recreated from their class on dispose()
+    return type(f"Metered{pool_class.__name__}", (_MeteredPool, pool_class), {"stats": stats})
+
+def _is_sqlite_memory(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and (
+        url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+    )
+
+def _set_sqlite_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    finally:
+        cursor.close()
+
+# Engines created by this module, by driver (e.g. sqlite, sqlite+aiosqlite)
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+def _engine_options(url: URL, queue_pool_class: Type[Pool]) -> Dict[str, Any]:
+    """Pool arguments for create_engine/create_async_engine"""
+    if SQLITE_JOURNAL_MODE not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f"Invalid SQLITE_JOURNAL_MODE: {SQLITE_JOURNAL_MODE}")
+    if SQLITE_SYNCHRONOUS not in SQLITE_SYNCHRONOUS_MODES:
+        raise ValueError(f"Invalid SQLITE_SYNCHRONOUS: {SQLITE_SYNCHRONOUS}")
+    # An in-memory SQLite database lives in a single connection, so it keeps
+    # SQLAlchemy's default single-connection pool
+    if _is_sqlite_memory(url):
+        return {}
+    return {
+        "poolclass": _metered_pool_class(queue_pool_class, PoolStats()),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+def _configure(engine: Engine) -> None:
+    """Register the connection listeners and the engine for pool_stats()"""
+    if engine.url.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    if isinstance(engine.pool, _MeteredPool):
+        stats = engine.pool.stats
+        event.listen(engine, "connect", lambda dbapi_connection, connection_record: stats.record_connect())
+    with _engines_lock:
+        _engines[engine.url.drivername] = engine
+
+def create_db_engine(url: str) -> Engine:
+    """
+    Create a synchronous engine
+
+    Args:
+        url: Database URL, e.g. sqlite:///./app.db
+
+    Returns:
+        Engine with the configured pool and SQLite settings
+    """
+    parsed = make_url(url)
+    engine = create_engine(parsed, **_engine_options(parsed, QueuePool))
+    _configure(engine)
+    return engine
+
+def create_async_db_engine(url: str) -> AsyncEngine:
+    """
+    Create an asynchronous engine
+
+    Args:
+        url: Database URL with an async driver, e.g. sqlite+aiosqlite:///./app.db
+
+    Returns:
+        AsyncEngine with the configured pool and SQLite settings
+    """
+    parsed = make_url(url)
+    engine = create_async_engine(parsed, **_engine_options(parsed, AsyncAdaptedQueuePool))
+    _configure(engine.sync_engine)
+    return engine
+
+def pool_stats() -> Dict[str, Optional[Dict[str, float]]]:
+    """
+    Get the pool statistics of the engines created so far
+
+    Returns:
+        Mapping of driver to its pool's counters and current size (None for
+        engines without a metered pool, such as in-memory SQLite)
+    """
+    with _engines_lock:
+        engines = list(_engines.items())
+    result = {}
+    for driver, engine in engines:
+        pool = engine.pool
+        if not isinstance(pool, _MeteredPool):
+            result[driver] = None
+            continue
+        result[driver] = {
+            **pool.stats.as_dict(),
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+        }
+    return result
@@ -0,0 +1,97 @@
+"""
+Database Migrations
+
+`Base.metadata.create_all` creates missing tables but never changes tables
+that already exist, so databases created by an earlier version need their
+schema brought up to date. Each migration here runs once, in order, and the
+versions applied are recorded in the `schema_version` table. Migrations are
+written to be safe to repeat, since several workers may start at once.
+
+Run them with `python -m app.db.models`; the application also applies them
+when it first uses the database.
+"""
+
+from typing import Callable, List, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateIndex
+from app.db.models import Base
+
+def _add_history_indexes(conn: Connection) -> None:
+    """Index conversations by user and update time, and messages by conversation and time"""
+    for table in ("conversations", "messages"):
+        for index in Base.metadata.tables[table].indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+def _rebuild_sqlite_conversations(conn: Connection) -> None:
+    """Recreate the conversations table from the model, keeping its rows"""
+    table = Base.metadata.tables["conversations"]
+    columns = ", ".join(column.name for column in table.columns)
+    # SQLite cannot alter a column. The savepoint opens a transaction (pysqlite
+    # only starts one before DML), within which the messages referencing the
+    # conversations are only checked at commit, once the rows are back
+    with conn.begin_nested():
+        conn.execute(text("PRAGMA defer_foreign_keys=ON"))
+        conn.execute(text("CREATE TEMP TABLE conversations_backup AS SELECT * FROM conversations"))
+        conn.execute(text("DROP TABLE conversations"))
+        table.create(conn)
+        conn.execute(text(f"INSERT INTO conversations ({columns}) SELECT {columns} FROM conversations_backup"))
+        conn.execute(text("DROP TABLE conversations_backup"))
+
+def _relax_conversation_user(conn: Connection) -> None:
+    """Make conversations.user_id nullable and drop its foreign key to users"""
+    inspector = inspect(conn)
+    user_id = next(c for c in inspector.get_columns("conversations") if c["name"] == "user_id")
+    foreign_keys = [
+        fk for fk in inspector.get_foreign_keys("conversations")
+        if fk["constrained_columns"] == ["user_id"]
+    ]
+    if user_id["nullable"] and not foreign_keys:
+        return
+
+    if conn.dialect.name == "sqlite":
+        _rebuild_sqlite_conversations(conn)
+        return
+    for fk in foreign_keys:
+        conn.execute(text(f'ALTER TABLE conversations DROP CONSTRAINT IF EXISTS "{fk["name"]}"'))
+    conn.execute(text("ALTER TABLE conversations ALTER COLUMN user_id DROP NOT NULL"))
+
+# (version, description, migration) in the order they are applied
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Add indexes for listing conversations and messages", _add_history_indexes),
+    (2, "Allow conversations without a registered user", _relax_conversation_user),
+]
+
+def schema_version(conn: Connection) -> int:
+    """
+    Get the version of the database schema
+
+    Args:
+        conn: Database connection
+
+    Returns:
+        Last migration applied (0 if none)
+    """
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+def run_migrations(conn: Connection) -> List[int]:
+    """
+    Apply the migrations newer than the database schema
+
+    Args:
+        conn: Database connection, in a transaction
+
+    Returns:
+        Versions applied
+    """
+    current = schema_version(conn)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"Applying database migration {version}: {description}")
+        migrate(conn)
+        conn.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": version})
+        applied.append(version)
+    return applied
@@ -5,12 +5,13 @@ This module defines the database models for storing conversation history.
 These models will be used when implementing Step 3 of the development process.
 """
 
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, create_engine
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from app.db.engine import create_db_engine
 
 # Load environment variables
 load_dotenv()
@@ -18,8 +19,8 @@ load_dotenv()
 # Get database URL from environment variables
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
 
-# Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+# Create SQLAlchemy engine (pool and SQLite settings from app.db.engine)
+engine = create_db_engine(DATABASE_URL)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -37,7 +38,11 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
-    conversations = relationship("Conversation", back_populates="user")
+    conversations = relationship(
+        "Conversation",
+        back_populates="user",
+        primaryjoin="User.id == foreign(Conversation.user_id)"
+    )
     
     def __repr__(self):
         return f"<User {self.name}>"
@@ -45,15 +50,26 @@ class User(Base):
 class Conversation(Base):
     """Conversation model for storing chat threads"""
     __tablename__ = "conversations"
+    __table_args__ = (
+        # Conversation lists, most recently updated first (per user, and overall)
+        Index("ix_conversations_user_updated", "user_id", "updated_at", "id"),
+        Index("ix_conversations_updated", "updated_at", "id"),
+    )
     
     id = Column(String, primary_key=True)
-    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    # The user id sent by the client, which need not have a `users` row (so
+    # not a foreign key); None for anonymous chats
+    user_id = Column(String, nullable=True)
     title = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    user = relationship("User", back_populates="conversations")
+    user = relationship(
+        "User",
+        back_populates="conversations",
+        primaryjoin="User.id == foreign(Conversation.user_id)"
+    )
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
     
     def __repr__(self):
@@ -62,6 +78,10 @@ class Conversation(Base):
 class Message(Base):
     """Message model for storing individual chat messages"""
     __tablename__ = "messages"
+    __table_args__ = (
+        # The messages of a conversation, in order
+        Index("ix_messages_conversation_created", "conversation_id", "created_at", "id"),
+    )
     
     id = Column(String, primary_key=True)
     conversation_id = Column(String, ForeignKey("conversations.id"), nullable=False)
@@ -76,8 +96,12 @@ class Message(Base):
         return f"<Message {self.id[:8]}...>"
 
 def init_db():
-    """Initialize the database by creating all tables"""
+    """Initialize the database by creating all tables and applying migrations"""
+    from app.db.migrations import run_migrations
+    
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        run_migrations(conn)
 
 def get_db():
     """Get a database session"""
@@ -88,7 +112,5 @@ def get_db():
         db.close()
 
 if __name__ == "__main__":
-    # This will be implemented in Step 3
-    # Example usage:
-    # init_db()
-    pass
+    # Create the tables and bring an existing database up to date
+    init_db()
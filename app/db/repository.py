@@ -0,0 +1,153 @@
+"""
+Conversation History Queries
+
+This module lists conversations and their messages with keyset (cursor)
+pagination. A page holds the rows that follow, in sort order, the last row
+of the previous page; they are found by seeking the composite indexes
+declared in app.db.models, so a page costs the same no matter how much
+history has accumulated, and rows added meanwhile never shift a page the way
+they would with an offset. Cursors are opaque strings holding the sort key
+of the last row of a page.
+"""
+
+import json
+import base64
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import select, tuple_
+from app.db.models import Conversation, Message
+from app.db.session import get_async_engine, init_async_db
+
+# Maximum number of rows per page
+MAX_PAGE_SIZE = 100
+
+@dataclass
+class Page:
+    """A page of rows and the cursor of the next one"""
+    items: List[Dict[str, Any]]
+    # None when this is the last page
+    next_cursor: Optional[str] = None
+
+def encode_cursor(timestamp: datetime, row_id: str) -> str:
+    """
+    Encode the sort key of a row as a cursor
+
+    Args:
+        timestamp: The row's sort timestamp
+        row_id: The row's id (breaks ties between equal timestamps)
+
+    Returns:
+        Opaque URL-safe cursor
+    """
+    payload = json.dumps([timestamp.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """
+    Decode a cursor made by encode_cursor
+
+    Args:
+        cursor: The cursor
+
+    Returns:
+        Tuple of (timestamp, row id)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(timestamp), str(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _page(rows: List[Any], limit: int, timestamp_field: str) -> Page:
+    """Build a page from up to limit + 1 rows (the extra row tells whether more follow)"""
+    items = [dict(row._mapping) for row in rows[:limit]]
+    if len(rows) <= limit:
+        return Page(items)
+    last = items[-1]
+    return Page(items, encode_cursor(last[timestamp_field], last["id"]))
+
+async def list_conversations(
+    user_id: Optional[str] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> Page:
+    """
+    List conversations, most recently updated first
+
+    Args:
+        user_id: Only list the conversations of this user
+        limit: Maximum number of conversations (at most MAX_PAGE_SIZE)
+        cursor: Cursor of the page to return (None for the first page)
+
+    Returns:
+        Page of conversations (id, title, created_at, updated_at)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = select(Conversation.id, Conversation.title, Conversation.created_at, Conversation.updated_at)
+    if user_id is not None:
+        query = query.where(Conversation.user_id == user_id)
+    if cursor is not None:
+        updated_at, conversation_id = decode_cursor(cursor)
+        query = query.where(tuple_(Conversation.updated_at, Conversation.id) < tuple_(updated_at, conversation_id))
+    query = query.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit + 1)
+
+    await init_async_db()
+    async with get_async_engine().connect() as conn:
+        rows = (await conn.execute(query)).all()
+    return _page(rows, limit, "updated_at")
+
+async def list_messages(
+    conversation_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    newest_first: bool = False
+) -> Page:
+    """
+    List the messages of a conversation
+
+    Args:
+        conversation_id: The conversation ID
+        limit: Maximum number of messages (at most MAX_PAGE_SIZE)
+        cursor: Cursor of the page to return (None for the first page)
+        newest_first: Start from the latest message and go back in time
+
+    Returns:
+        Page of messages (id, role, content, created_at)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    key = tuple_(Message.created_at, Message.id)
+    query = (
+        select(Message.id, Message.role, Message.content, Message.created_at)
+        .where(Message.conversation_id == conversation_id)
+    )
+    if cursor is not None:
+        created_at, message_id = decode_cursor(cursor)
+        after = tuple_(created_at, message_id)
+        query = query.where(key < after if newest_first else key > after)
+    if newest_first:
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+    else:
+        query = query.order_by(Message.created_at, Message.id)
+    query = query.limit(limit + 1)
+
+    await init_async_db()
+    async with get_async_engine().connect() as conn:
+        rows = (await conn.execute(query)).all()
+    return _page(rows, limit, "created_at")
+
+async def conversation_exists(conversation_id: str) -> bool:
+    """Check whether a conversation was saved"""
+    await init_async_db()
+    async with get_async_engine().connect() as conn:
+        result = await conn.execute(select(Conversation.id).where(Conversation.id == conversation_id))
+        return result.first() is not None
@@ -0,0 +1,85 @@
+"""
+Async Database Sessions
+
+This module provides the asynchronous engine used on the request path.
+DATABASE_URL is shared with the synchronous engine in app.db.models; its
+driver is swapped for an async one (aiosqlite for SQLite, asyncpg for
+PostgreSQL), so the same URL works for both. The engine is created on first
+use, so the async drivers are only needed when conversations are persisted.
+Its pool and SQLite settings are those of app.db.engine.
+"""
+
+import asyncio
+import threading
+from typing import Optional
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+from app.db.engine import create_async_db_engine
+from app.db.models import Base, DATABASE_URL
+
+# Async driver for each database backend
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+
+def async_database_url(url: str) -> str:
+    """
+    Convert a database URL to use an async driver
+
+    Args:
+        url: Database URL, e.g. sqlite:///./app.db or postgresql://user@host/db
+
+    Returns:
+        The URL with its async driver, e.g. sqlite+aiosqlite:///./app.db
+
+    Raises:
+        ValueError: If there is no async driver for the backend
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend} databases")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+_engine: Optional[AsyncEngine] = None
+_engine_lock = threading.Lock()
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Get the process-wide async engine, creating it on first use
+
+    Returns:
+        AsyncEngine for DATABASE_URL
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_async_db_engine(async_database_url(DATABASE_URL))
+        return _engine
+
+_initialized = False
+_init_lock: Optional[asyncio.Lock] = None
+
+async def init_async_db() -> None:
+    """Create any missing tables and apply the migrations, once per process"""
+    global _initialized, _init_lock
+    if _initialized:
+        return
+    if _init_lock is None:
+        _init_lock = asyncio.Lock()
+    async with _init_lock:
+        if not _initialized:
+            from app.db.migrations import run_migrations
+            async with get_async_engine().begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+                await conn.run_sync(run_migrations)
+            _initialized = True
+
+async def close_async_engine() -> None:
+    """Close the connections of the async engine"""
+    global _engine, _initialized
+    engine, _engine = _engine, None
+    _initialized = False
+    if engine is not None:
+        await engine.dispose()
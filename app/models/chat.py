@@ -21,3 +21,36 @@ class ChatResponse(BaseModel):
     conversation_id: str
     success: bool
     timestamp: datetime = Field(default_factory=datetime.now)
+
+class RetrievalFilters(BaseModel):
+    """Restriction of the knowledge retrieved for a chat request"""
+    file_name: Optional[List[str]] = None
+    pillar: Optional[List[str]] = None
+    document_type: Optional[List[str]] = None
+    date_from: Optional[str] = None  # ISO date, e.g. "2021-01-31"
+    date_to: Optional[str] = None
+
+class ConversationSummary(BaseModel):
+    """A saved conversation"""
+    id: str
+    title: str
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+class ConversationPage(BaseModel):
+    """A page of conversations, most recently updated first"""
+    conversations: List[ConversationSummary]
+    next_cursor: Optional[str] = None  # None on the last page
+
+class HistoryMessage(BaseModel):
+    """A saved message of a conversation"""
+    id: str
+    role: str  # 'user' or 'assistant'
+    content: str
+    created_at: datetime
+
+class MessagePage(BaseModel):
+    """A page of the messages of a conversation"""
+    conversation_id: str
+    messages: List[HistoryMessage]
+    next_cursor: Optional[str] = None  # None on the last page
@@ -25,6 +25,8 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Scroll to bottom
         chatContainer.scrollTop = chatContainer.scrollHeight;
+        
+        return messageContent;
     }
     
     // Function to show typing indicator
@@ -50,12 +52,51 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
-    // Function to send message to API
+    // Function to handle a single Server-Sent Event from the stream
+    function handleStreamEvent(rawEvent, state) {
+        let eventName = 'message';
+        let data = '';
+        
+        rawEvent.split('\n').forEach(function(line) {
+            if (line.startsWith('event:')) {
+                eventName = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                data += line.slice(5).trim();
+            }
+        });
+        
+        if (!data) {
+            return;
+        }
+        
+        const payload = JSON.parse(data);
+        
+        if (eventName === 'start') {
+            // Update conversation ID if this is a new conversation
+            if (!conversationId) {
+                conversationId = payload.conversation_id;
+            }
+        } else if (eventName === 'error') {
+            throw new Error(payload.detail);
+        } else if (eventName === 'message' && payload.delta) {
+            // Replace the typing indicator with the message on the first token
+            if (!state.content) {
+                removeTypingIndicator();
+                state.content = addMessage('', 'assistant');
+            }
+            state.content.textContent += payload.delta;
+            chatContainer.scrollTop = chatContainer.scrollHeight;
+        }
+    }
+    
+    // Function to send message to API and stream the response
     async function sendMessage(message) {
+        const state = { content: null };
+        
         try {
             showTypingIndicator();
             
-            const response = await fetch('/api/chat', {
+            const response = await fetch('/api/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -66,18 +107,33 @@ document.addEventListener('DOMContentLoaded', function() {
                 })
             });
             
-            const data = await response.json();
+            if (!response.ok) {
+                throw new Error('Request failed with status ' + response.status);
+            }
             
-            // Remove typing indicator
-            removeTypingIndicator();
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
             
-            // Update conversation ID if this is a new conversation
-            if (!conversationId) {
-                conversationId = data.conversation_id;
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) {
+                    break;
+                }
+                
+                buffer += decoder.decode(value, { stream: true });
+                
+                // Events are separated by a blank line
+                let boundary = buffer.indexOf('\n\n');
+                while (boundary !== -1) {
+                    handleStreamEvent(buffer.slice(0, boundary), state);
+                    buffer = buffer.slice(boundary + 2);
+                    boundary = buffer.indexOf('\n\n');
+                }
             }
             
-            // Add assistant's response to chat
-            addMessage(data.message, 'assistant');
+            // Remove typing indicator
+            removeTypingIndicator();
             
         } catch (error) {
             console.error('Error sending message:', error);
@@ -0,0 +1,169 @@
+"""
+Context Window
+
+This module keeps the messages sent to the Chat Completions API within a
+token budget. Each message counts its tokens once (the count is cached on the
+message), and the request is built from the system message plus the most
+recent turns that fit the budget. Turns that no longer fit can be replaced in
+the stored history by a rolling summary.
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.utils.prompts import count_tokens, encoding_loaded
+
+# Load environment variables
+load_dotenv()
+
+# Maximum number of prompt tokens sent per request (system + history + question)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 8000))
+
+# Replace turns that fall out of the window with a rolling summary
+CONTEXT_SUMMARY_ENABLED = os.getenv("CONTEXT_SUMMARY_ENABLED", "false").lower() == "true"
+
+# Tokens used by the chat format around each message and to prime the reply
+TOKENS_PER_MESSAGE = 4
+REPLY_PRIMING_TOKENS = 3
+
+# Prefix identifying summary messages in the history
+SUMMARY_PREFIX = "Resumen de la conversación anterior:\n"
+
+class CountedMessage(dict):
+    """Chat message dict that caches its token count"""
+
+    __slots__ = ("token_count",)
+
+    def __init__(self, role: str, content: str):
+        dict.__init__(self, role=role, content=content)
+        self.token_count = None
+
+def make_message(role: str, content: str) -> CountedMessage:
+    """
+    Create a chat message
+
+    Args:
+        role: 'system', 'user' or 'assistant'
+        content: Message text
+
+    Returns:
+        CountedMessage
+    """
+    return CountedMessage(role, content)
+
+def count_message_tokens(message: Dict[str, str]) -> int:
+    """
+    Count the tokens of a message, using the cached count when available
+
+    Args:
+        message: Chat message dict
+
+    Returns:
+        Number of tokens including the chat format overhead
+    """
+    cached = getattr(message, "token_count", None)
+    if cached is not None:
+        return cached + TOKENS_PER_MESSAGE
+
+    # An estimate made while the encoding loads is not cached
+    final = encoding_loaded()
+    tokens = count_tokens(message["content"])
+    if final and isinstance(message, CountedMessage):
+        message.token_count = tokens
+    return tokens + TOKENS_PER_MESSAGE
+
+def is_summary(message: Dict[str, str]) -> bool:
+    """Check whether a history message is a rolling summary"""
+    return message["role"] == "system" and message["content"].startswith(SUMMARY_PREFIX)
+
+def fit_to_budget(
+    system_message: Dict[str, str],
+    history: List[Dict[str, str]],
+    user_message: Dict[str, str],
+    budget: Optional[int] = None,
+) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    """
+    Build the request messages from the most recent turns that fit the budget
+
+    The system message and the user's message are always included. A summary
+    at the start of the history is kept in preference to older turns, and the
+    window never starts with an assistant reply.
+
+    Args:
+        system_message: The system message
+        history: Stored conversation turns (oldest first)
+        user_message: The user's new message
+        budget: Token budget (defaults to CONTEXT_TOKEN_BUDGET)
+
+    Returns:
+        Tuple of (messages to send, oldest history messages to fold into the
+        next summary: the turns left out of the window plus any previous summary)
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    used = (
+        count_message_tokens(system_message)
+        + count_message_tokens(user_message)
+        + REPLY_PRIMING_TOKENS
+    )
+
+    summary = history[0] if history and is_summary(history[0]) else None
+    turns = history[1:] if summary is not None else history
+    if summary is not None:
+        summary_tokens = count_message_tokens(summary)
+        if used + summary_tokens <= budget:
+            used += summary_tokens
+        else:
+            summary = None
+
+    # Walk back from the most recent turn until the budget is spent
+    start = len(turns)
+    while start > 0:
+        tokens = count_message_tokens(turns[start - 1])
+        if used + tokens > budget:
+            break
+        used += tokens
+        start -= 1
+    while start < len(turns) and turns[start]["role"] == "assistant":
+        start += 1
+
+    kept = turns[start:]
+    dropped = turns[:start]
+    if history and is_summary(history[0]) and (summary is None or dropped):
+        # A previous summary is folded into the next one (rolling summary)
+        dropped = [history[0]] + dropped
+
+    messages = [system_message]
+    if summary is not None:
+        messages.append(summary)
+    messages.extend(kept)
+    messages.append(user_message)
+    return messages, dropped
+
+def build_summary_request(dropped: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Build the messages asking the model to summarize turns that left the window
+
+    Args:
+        dropped: History messages to summarize (may start with a previous summary)
+
+    Returns:
+        Messages for a Chat Completions request
+    """
+    transcript = "\n\n".join(
+        f"{message['role']}: {message['content']}" for message in dropped
+    )
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Resume de forma concisa la siguiente conversación entre un profesor y "
+                "el asistente educativo. Conserva los datos, decisiones y preguntas "
+                "pendientes que sean necesarios para continuar la conversación."
+            )
+        },
+        {"role": "user", "content": transcript}
+    ]
+
+def make_summary_message(summary: str) -> CountedMessage:
+    """Wrap a summary text as a history message"""
+    return make_message("system", SUMMARY_PREFIX + summary.strip())
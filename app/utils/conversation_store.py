@@ -0,0 +1,422 @@
+"""
+Conversation Store
+
+This module keeps the conversation history used to build chat requests.
+Only the user and assistant turns are stored; the shared system message is
+added when a request is built.
+
+The in-memory store is bounded by a maximum number of conversations and a
+maximum number of bytes, evicting the least recently used conversations and
+those idle for longer than a TTL. Every turn is also persisted to the
+`Conversation`/`Message` tables in the background (see
+app.utils.conversation_writer), so evicted conversations, and those of a
+previous run, are rehydrated from the database on demand.
+
+Conversations are spread over independent shards (each with its own LRU,
+budget and locks), and each conversation has a lock so that its turns are
+processed one at a time.
+"""
+
+import os
+import time
+import asyncio
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, fields
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional
+from uuid import uuid4
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from app.utils.conversation_writer import ConversationWriter
+
+# Load environment variables
+load_dotenv()
+
+# Store budget and eviction settings
+CONVERSATION_MAX_COUNT = int(os.getenv("CONVERSATION_MAX_COUNT", 1000))
+CONVERSATION_MAX_BYTES = int(os.getenv("CONVERSATION_MAX_BYTES", 50 * 1024 * 1024))
+CONVERSATION_TTL_SECONDS = float(os.getenv("CONVERSATION_TTL_SECONDS", 6 * 60 * 60))
+
+# Number of independent shards the conversations are spread over
+CONVERSATION_SHARDS = int(os.getenv("CONVERSATION_SHARDS", 16))
+
+# Persist every turn to the database (written in the background)
+CONVERSATION_PERSIST_ENABLED = os.getenv("CONVERSATION_PERSIST_ENABLED", "true").lower() == "true"
+
+# Approximate per-message overhead of the dict holding it (bytes)
+MESSAGE_OVERHEAD_BYTES = 232
+
+def new_conversation_id() -> str:
+    """Generate the id of a new conversation"""
+    return str(uuid4())
+
+def message_size(message: Dict[str, str]) -> int:
+    """
+    Estimate the memory held by a message
+
+    Args:
+        message: Chat message dict
+
+    Returns:
+        Approximate size in bytes
+    """
+    return MESSAGE_OVERHEAD_BYTES + len(message["content"].encode("utf-8"))
+
+@dataclass
+class ConversationStats:
+    """Counters describing the store's behaviour"""
+    hits: int = 0
+    misses: int = 0
+    rehydrations: int = 0
+    lru_evictions: int = 0
+    ttl_evictions: int = 0
+    conversations: int = 0
+    bytes_held: int = 0
+    lock_waits: int = 0
+
+    @property
+    def evictions(self) -> int:
+        return self.lru_evictions + self.ttl_evictions
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "rehydrations": self.rehydrations,
+            "evictions": self.evictions,
+            "lru_evictions": self.lru_evictions,
+            "ttl_evictions": self.ttl_evictions,
+            "conversations": self.conversations,
+            "bytes_held": self.bytes_held,
+            "lock_waits": self.lock_waits,
+        }
+
+class ConversationStore:
+    """Interface for conversation history stores"""
+
+    async def get(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        """
+        Get the turns of a conversation
+
+        Args:
+            conversation_id: The conversation ID
+
+        Returns:
+            List of messages (oldest first) or None if the conversation is unknown
+        """
+        raise NotImplementedError
+
+    async def append(self, conversation_id: str, *messages: Dict[str, str], user_id: Optional[str] = None) -> None:
+        """
+        Append turns to a conversation, creating it if needed
+
+        Args:
+            conversation_id: The conversation ID
+            messages: Messages to append
+            user_id: Optional user the conversation is saved under (when it
+                is created in the database)
+        """
+        raise NotImplementedError
+
+    async def compact(
+        self,
+        conversation_id: str,
+        replaced: List[Dict[str, str]],
+        summary: Dict[str, str],
+    ) -> bool:
+        """
+        Replace the oldest turns of a conversation with a summary message
+
+        Args:
+            conversation_id: The conversation ID
+            replaced: The oldest messages being summarized
+            summary: Summary message replacing them
+
+        Returns:
+            True if the history was compacted, False if it changed meanwhile
+        """
+        raise NotImplementedError
+
+    async def delete(self, conversation_id: str) -> None:
+        """Forget a conversation"""
+        raise NotImplementedError
+
+    def lock(self, conversation_id: str):
+        """
+        Hold a conversation's lock, so its turns are processed one at a time
+
+        Args:
+            conversation_id: The conversation ID
+
+        Returns:
+            Async context manager
+        """
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, float]:
+        """Get the store's counters"""
+        raise NotImplementedError
+
+    async def flush(self) -> None:
+        """Wait until the turns appended so far are persisted"""
+
+    async def close(self) -> None:
+        """Finish writing the turns waiting to be persisted"""
+
+@dataclass
+class _Entry:
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    size: int = 0
+    last_access: float = field(default_factory=time.monotonic)
+
+class MemoryConversationStore(ConversationStore):
+    """Bounded in-memory store with LRU and idle-TTL eviction"""
+
+    def __init__(
+        self,
+        max_conversations: int = CONVERSATION_MAX_COUNT,
+        max_bytes: int = CONVERSATION_MAX_BYTES,
+        ttl_seconds: float = CONVERSATION_TTL_SECONDS,
+        database: Optional["ConversationWriter"] = None,
+    ):
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.database = database
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._stats = ConversationStats()
+        # Locks of the conversations with a turn in progress, with their number of holders and waiters
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+
+    def _remove(self, conversation_id: str) -> None:
+        entry = self._entries.pop(conversation_id)
+        self._stats.bytes_held -= entry.size
+        self._stats.conversations = len(self._entries)
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.last_access > self.ttl_seconds
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Evict idle conversations, then least recently used ones over budget"""
+        now = time.monotonic()
+
+        # Entries are ordered by last access, so idle ones are at the front
+        while self._entries:
+            conversation_id, entry = next(iter(self._entries.items()))
+            if conversation_id == keep or not self._expired(entry, now):
+                break
+            self._remove(conversation_id)
+            self._stats.ttl_evictions += 1
+
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_conversations
+            or self._stats.bytes_held > self.max_bytes
+        ):
+            conversation_id = next(iter(self._entries))
+            if conversation_id == keep:
+                self._entries.move_to_end(conversation_id)
+                conversation_id = next(iter(self._entries))
+            self._remove(conversation_id)
+            self._stats.lru_evictions += 1
+
+    def _insert(self, conversation_id: str, messages: List[Dict[str, str]]) -> _Entry:
+        entry = _Entry(messages=messages, size=sum(message_size(m) for m in messages))
+        self._entries[conversation_id] = entry
+        self._stats.bytes_held += entry.size
+        self._stats.conversations = len(self._entries)
+        return entry
+
+    async def get(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        now = time.monotonic()
+        entry = self._entries.get(conversation_id)
+
+        if entry is not None and self._expired(entry, now):
+            self._remove(conversation_id)
+            self._stats.ttl_evictions += 1
+            entry = None
+
+        if entry is not None:
+            self._stats.hits += 1
+            entry.last_access = now
+            self._entries.move_to_end(conversation_id)
+            return entry.messages
+
+        self._stats.misses += 1
+        if self.database is None:
+            return None
+
+        # Rehydrate an evicted (or never cached) conversation from the database
+        messages = await self.database.load(conversation_id)
+        if conversation_id in self._entries:
+            # Another request cached it while we were loading
+            return self._entries[conversation_id].messages
+        if messages is None:
+            return None
+        self._insert(conversation_id, messages)
+        self._stats.rehydrations += 1
+        self._evict(keep=conversation_id)
+        return messages
+
+    async def append(self, conversation_id: str, *messages: Dict[str, str], user_id: Optional[str] = None) -> None:
+        if self.database is not None:
+            self.database.save(conversation_id, list(messages), user_id)
+
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            entry = self._insert(conversation_id, [])
+
+        added = sum(message_size(m) for m in messages)
+        entry.messages.extend(messages)
+        entry.size += added
+        entry.last_access = time.monotonic()
+        self._stats.bytes_held += added
+        self._entries.move_to_end(conversation_id)
+        self._evict(keep=conversation_id)
+
+    async def compact(
+        self,
+        conversation_id: str,
+        replaced: List[Dict[str, str]],
+        summary: Dict[str, str],
+    ) -> bool:
+        entry = self._entries.get(conversation_id)
+        if entry is None or len(entry.messages) < len(replaced):
+            return False
+        if any(a is not b for a, b in zip(entry.messages, replaced)):
+            return False
+
+        # The database keeps the full history; only the cached copy shrinks
+        removed = sum(message_size(m) for m in replaced)
+        added = message_size(summary)
+        entry.messages[:len(replaced)] = [summary]
+        entry.size += added - removed
+        self._stats.bytes_held += added - removed
+        return True
+
+    async def delete(self, conversation_id: str) -> None:
+        if conversation_id in self._entries:
+            self._remove(conversation_id)
+        if self.database is not None:
+            await self.database.delete(conversation_id)
+
+    @asynccontextmanager
+    async def lock(self, conversation_id: str) -> AsyncIterator[None]:
+        lock = self._locks.get(conversation_id)
+        if lock is None:
+            lock = self._locks[conversation_id] = asyncio.Lock()
+        if lock.locked():
+            self._stats.lock_waits += 1
+        self._lock_users[conversation_id] = self._lock_users.get(conversation_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            # Locks are dropped once nobody holds or waits for them
+            self._lock_users[conversation_id] -= 1
+            if self._lock_users[conversation_id] == 0:
+                del self._lock_users[conversation_id]
+                del self._locks[conversation_id]
+
+    def stats(self) -> Dict[str, float]:
+        stats = self._stats.as_dict()
+        if self.database is not None:
+            stats["database"] = self.database.stats()
+        return stats
+
+    async def flush(self) -> None:
+        if self.database is not None:
+            await self.database.flush()
+
+    async def close(self) -> None:
+        if self.database is not None:
+            await self.database.close()
+
+class ShardedConversationStore(ConversationStore):
+    """
+    Conversations spread over independent in-memory stores by a hash of
+    their id, so unrelated conversations never share an LRU, budget or lock
+    table
+    """
+
+    def __init__(self, shards: List[ConversationStore], database: Optional["ConversationWriter"] = None):
+        self.shards = shards
+        # Writer shared by the shards
+        self.database = database
+
+    def _shard(self, conversation_id: str) -> ConversationStore:
+        # crc32 is stable across processes, unlike hash()
+        return self.shards[zlib.crc32(conversation_id.encode("utf-8")) % len(self.shards)]
+
+    async def get(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        return await self._shard(conversation_id).get(conversation_id)
+
+    async def append(self, conversation_id: str, *messages: Dict[str, str], user_id: Optional[str] = None) -> None:
+        await self._shard(conversation_id).append(conversation_id, *messages, user_id=user_id)
+
+    async def compact(
+        self,
+        conversation_id: str,
+        replaced: List[Dict[str, str]],
+        summary: Dict[str, str],
+    ) -> bool:
+        return await self._shard(conversation_id).compact(conversation_id, replaced, summary)
+
+    async def delete(self, conversation_id: str) -> None:
+        await self._shard(conversation_id).delete(conversation_id)
+
+    def lock(self, conversation_id: str):
+        return self._shard(conversation_id).lock(conversation_id)
+
+    def stats(self) -> Dict[str, float]:
+        totals = [shard.stats() for shard in self.shards]
+        total = ConversationStats(**{
+            f.name: sum(stats[f.name] for stats in totals)
+            for f in fields(ConversationStats)
+        })
+        stats = {**total.as_dict(), "shards": len(self.shards)}
+        if self.database is not None:
+            stats["database"] = self.database.stats()
+        return stats
+
+    async def flush(self) -> None:
+        if self.database is not None:
+            await self.database.flush()
+
+    async def close(self) -> None:
+        if self.database is not None:
+            await self.database.close()
+
+def create_conversation_store() -> ConversationStore:
+    """
+    Create the conversation store configured by the environment
+
+    Returns:
+        ConversationStore instance
+    """
+    database = None
+    if CONVERSATION_PERSIST_ENABLED:
+        # Imported here so the store works without the database dependencies
+        from app.utils.conversation_writer import ConversationWriter
+        database = ConversationWriter()
+    shards = max(1, CONVERSATION_SHARDS)
+    if shards == 1:
+        return MemoryConversationStore(database=database)
+
+    # The budget is split evenly between the shards
+    return ShardedConversationStore([
+        MemoryConversationStore(
+            max_conversations=max(1, CONVERSATION_MAX_COUNT // shards),
+            max_bytes=max(1, CONVERSATION_MAX_BYTES // shards),
+            database=database,
+        )
+        for _ in range(shards)
+    ], database)
@@ -0,0 +1,300 @@
+"""
+Conversation Writer
+
+This module persists conversation turns to the `Conversation`/`Message`
+tables without making requests wait for the database. Turns are put on a
+bounded in-memory queue; a background task takes everything queued (waiting
+a moment for more to accumulate), and inserts it with one statement per
+table in a single transaction. Reads and deletes of a conversation with
+turns still waiting to be written first wait for them, so a conversation is
+always read back complete; other reads go straight to the database.
+SQLAlchemy and the models are imported in a worker thread the first time
+they are needed, since importing them would block the event loop.
+
+If the database is unavailable, a batch is retried a few times and then
+dropped (and counted); when the queue is full, new turns are dropped rather
+than delaying responses. The answers are never affected, only what can be
+reloaded after a restart.
+"""
+
+import os
+import asyncio
+import importlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Union
+from uuid import uuid4
+from dotenv import load_dotenv
+from app.utils.context_window import make_message
+
+# Load environment variables
+load_dotenv()
+
+# Maximum number of messages inserted per transaction
+CONVERSATION_WRITE_BATCH_SIZE = int(os.getenv("CONVERSATION_WRITE_BATCH_SIZE", 500))
+
+# Seconds to wait for more turns before writing a batch
+CONVERSATION_WRITE_INTERVAL = float(os.getenv("CONVERSATION_WRITE_INTERVAL", 0.05))
+
+# Maximum number of turns waiting to be written
+CONVERSATION_WRITE_QUEUE_SIZE = int(os.getenv("CONVERSATION_WRITE_QUEUE_SIZE", 10000))
+
+# Attempts to write a batch before dropping it
+CONVERSATION_WRITE_RETRIES = int(os.getenv("CONVERSATION_WRITE_RETRIES", 3))
+
+# Database modules, imported off the event loop before the first access
+DATABASE_MODULES = ("app.db.models", "app.db.session")
+_database_imported = False
+
+async def import_database_modules() -> None:
+    """Import SQLAlchemy and the models in a worker thread, once"""
+    global _database_imported
+    if not _database_imported:
+        await asyncio.to_thread(lambda: [importlib.import_module(name) for name in DATABASE_MODULES])
+        _database_imported = True
+
+@dataclass
+class _Turn:
+    conversation_id: str
+    messages: List[Dict[str, str]]
+    user_id: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+
+@dataclass
+class _Flush:
+    """Marker resolved once every turn queued before it was written"""
+    done: asyncio.Future
+
+@dataclass
+class ConversationWriterStats:
+    """Counters describing the writer's behaviour"""
+    queued_messages: int = 0
+    written_messages: int = 0
+    dropped_messages: int = 0
+    batches: int = 0
+    retries: int = 0
+    queue_depth: int = 0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "queued_messages": self.queued_messages,
+            "written_messages": self.written_messages,
+            "dropped_messages": self.dropped_messages,
+            "batches": self.batches,
+            "messages_per_batch": round(self.written_messages / self.batches, 2) if self.batches else 0.0,
+            "retries": self.retries,
+            "queue_depth": self.queue_depth,
+        }
+
+class ConversationWriter:
+    """Write-behind persistence of conversation turns through the async engine"""
+
+    def __init__(
+        self,
+        batch_size: int = CONVERSATION_WRITE_BATCH_SIZE,
+        interval: float = CONVERSATION_WRITE_INTERVAL,
+        queue_size: int = CONVERSATION_WRITE_QUEUE_SIZE,
+        retries: int = CONVERSATION_WRITE_RETRIES,
+    ):
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.queue_size = queue_size
+        self.retries = max(1, retries)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = ConversationWriterStats()
+        # Number of turns of each conversation queued or being written
+        self._pending: Dict[str, int] = {}
+
+    def _ensure_started(self) -> asyncio.Queue:
+        # The queue and task belong to the event loop of the first request
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(self.queue_size)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._queue
+
+    def save(self, conversation_id: str, messages: List[Dict[str, str]], user_id: Optional[str] = None) -> None:
+        """
+        Queue messages to be written, without waiting for the database
+
+        Args:
+            conversation_id: Conversation the messages belong to
+            messages: Messages of the turn, in order
+            user_id: Optional user a new conversation is saved under
+        """
+        queue = self._ensure_started()
+        try:
+            queue.put_nowait(_Turn(conversation_id, list(messages), user_id))
+            self._stats.queued_messages += len(messages)
+            self._pending[conversation_id] = self._pending.get(conversation_id, 0) + 1
+        except asyncio.QueueFull:
+            self._stats.dropped_messages += len(messages)
+            print(f"Conversation write queue is full, dropping {len(messages)} messages of {conversation_id}")
+        self._stats.queue_depth = queue.qsize()
+
+    async def flush(self) -> None:
+        """Wait until every turn queued so far has been written (or dropped)"""
+        if self._task is None or self._task.done():
+            return
+        done = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Flush(done))
+        await done
+
+    async def _run(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if isinstance(item, _Turn):
+                # Let concurrent turns join the batch
+                await asyncio.sleep(self.interval)
+            batch: List[Union[_Turn, _Flush]] = [item]
+            count = len(item.messages) if isinstance(item, _Turn) else 0
+            while count < self.batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                batch.append(item)
+                if isinstance(item, _Turn):
+                    count += len(item.messages)
+            self._stats.queue_depth = self._queue.qsize()
+
+            turns = [item for item in batch if isinstance(item, _Turn)]
+            if turns:
+                await self._write_with_retries(turns)
+                for turn in turns:
+                    self._pending[turn.conversation_id] -= 1
+                    if self._pending[turn.conversation_id] == 0:
+                        del self._pending[turn.conversation_id]
+            for item in batch:
+                if isinstance(item, _Flush) and not item.done.done():
+                    item.done.set_result(None)
+
+    async def _write_with_retries(self, turns: List[_Turn]) -> None:
+        count = sum(len(turn.messages) for turn in turns)
+        for attempt in range(self.retries):
+            try:
+                await import_database_modules()
+                from app.db.session import init_async_db
+                await init_async_db()
+                await self._write(turns)
+                self._stats.written_messages += count
+                self._stats.batches += 1
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt + 1 < self.retries:
+                    self._stats.retries += 1
+                    print(f"Error writing {count} conversation messages, retrying: {str(e)}")
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                else:
+                    self._stats.dropped_messages += count
+                    print(f"Error writing {count} conversation messages, dropping them: {str(e)}")
+
+    async def _write(self, turns: List[_Turn]) -> None:
+        """Insert the turns of a batch in one transaction"""
+        from sqlalchemy import bindparam, select, update
+        from app.db.models import Conversation, Message
+        from app.db.session import get_async_engine
+
+        conversations: Dict[str, Dict] = {}
+        rows = []
+        for turn in turns:
+            if turn.conversation_id not in conversations:
+                title = turn.messages[0]["content"][:60] if turn.messages else "Conversation"
+                conversations[turn.conversation_id] = {
+                    "id": turn.conversation_id,
+                    "user_id": turn.user_id,
+                    "title": title,
+                    "created_at": turn.created_at,
+                }
+            elif conversations[turn.conversation_id]["user_id"] is None:
+                conversations[turn.conversation_id]["user_id"] = turn.user_id
+            conversations[turn.conversation_id]["updated_at"] = turn.created_at
+            # Spread the timestamps so the turn order survives a reload
+            for i, message in enumerate(turn.messages):
+                rows.append({
+                    "id": str(uuid4()),
+                    "conversation_id": turn.conversation_id,
+                    "role": message["role"],
+                    "content": message["content"],
+                    "created_at": turn.created_at + timedelta(microseconds=i),
+                })
+
+        async with get_async_engine().begin() as conn:
+            result = await conn.execute(
+                select(Conversation.id).where(Conversation.id.in_(list(conversations)))
+            )
+            existing = set(result.scalars())
+            new = [values for cid, values in conversations.items() if cid not in existing]
+            if new:
+                await conn.execute(Conversation.__table__.insert(), new)
+            if existing:
+                await conn.execute(
+                    update(Conversation.__table__)
+                    .where(Conversation.__table__.c.id == bindparam("conversation_id"))
+                    .values(updated_at=bindparam("updated_at")),
+                    [
+                        {"conversation_id": cid, "updated_at": conversations[cid]["updated_at"]}
+                        for cid in existing
+                    ]
+                )
+            await conn.execute(Message.__table__.insert(), rows)
+
+    async def load(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        """
+        Load the turns of a conversation, including those still queued
+
+        Args:
+            conversation_id: Conversation to load
+
+        Returns:
+            Messages in order, or None if the conversation was never saved
+        """
+        if conversation_id in self._pending:
+            await self.flush()
+        await import_database_modules()
+
+        from sqlalchemy import select
+        from app.db.models import Message
+        from app.db.session import get_async_engine, init_async_db
+
+        await init_async_db()
+        async with get_async_engine().connect() as conn:
+            result = await conn.execute(
+                select(Message.role, Message.content)
+                .where(Message.conversation_id == conversation_id)
+                .order_by(Message.created_at)
+            )
+            rows = result.all()
+        return [make_message(role, content) for role, content in rows] or None
+
+    async def delete(self, conversation_id: str) -> None:
+        """Delete a conversation and its messages, after its queued turns"""
+        if conversation_id in self._pending:
+            await self.flush()
+        await import_database_modules()
+
+        from sqlalchemy import delete
+        from app.db.models import Conversation, Message
+        from app.db.session import get_async_engine, init_async_db
+
+        await init_async_db()
+        async with get_async_engine().begin() as conn:
+            await conn.execute(delete(Message).where(Message.conversation_id == conversation_id))
+            await conn.execute(delete(Conversation).where(Conversation.id == conversation_id))
+
+    async def close(self) -> None:
+        """Write the queued turns and stop the background task"""
+        task, self._task = self._task, None
+        if task is None or task.done():
+            return
+        done = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Flush(done))
+        await done
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self) -> Dict[str, float]:
+        """Get the writer's counters"""
+        return self._stats.as_dict()
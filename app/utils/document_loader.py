@@ -6,151 +6,265 @@ for the Teacher's AI Assistant application.
 """
 
 import os
+import sys
 import json
-from typing import List, Optional, Dict, Any
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Iterator, List, Optional, Dict, Any
 from dotenv import load_dotenv
-from langchain_community.document_loaders import (
-    DirectoryLoader,
-    TextLoader,
-    PyPDFLoader,
-    CSVLoader,
-    UnstructuredExcelLoader,
-    UnstructuredWordDocumentLoader,
-)
-from langchain_community.document_loaders.base import BaseLoader
-from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import OpenAIEmbeddings
+from app.utils.embedding_cache import get_embedding_cache
+from app.utils.pipeline import Pipeline, Stage
+from app.utils.metadata_filter import MetadataFilter, load_document_attributes
+from app.utils.json_stream import iter_json, flatten_json
+from app.utils.ingest_manifest import IngestManifest, IngestJournal, chunk_id, scan_documents, settings_changed
+
+# langchain, its document loaders and chromadb take seconds to import, so
+# they are imported where they are used: answering questions from the vector
+# store does not need the loaders or the text splitter
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+    from langchain_core.vectorstores import VectorStore
+    from app.utils.lexical_index import LexicalIndex
 
 # Load environment variables
 load_dotenv()
 
-# Define document loaders for different file types
+logger = logging.getLogger(__name__)
+
+# Number of processes used to load documents in parallel
+DOCUMENT_LOADER_WORKERS = int(os.getenv("DOCUMENT_LOADER_WORKERS", os.cpu_count() or 1))
+
+# Default directory where the vector store is persisted
+CHROMA_DB_DIR = os.getenv("CHROMA_DB_DIR", "./chroma_db")
+
+# Build a keyword (BM25) index of the chunks alongside the vectors
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+
+# Vector store implementation: "chroma" or "local" (memory-mapped NumPy index)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma").lower()
+
+# Number of chunks embedded and written to (or deleted from) the vector store together
+UPSERT_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 500))
+
+# Model used to embed chunks and queries
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+
+# Minimum number of seconds between checks for a changed index on disk
+VECTOR_STORE_CHECK_INTERVAL = float(os.getenv("VECTOR_STORE_CHECK_INTERVAL", 10))
+
+# Loader for each file type, by class name in langchain_community.document_loaders
+# (JSONLoader is defined here); the classes are imported on first use
 LOADER_MAPPING = {
-    ".txt": TextLoader,
-    ".pdf": PyPDFLoader,
-    ".csv": CSVLoader,
-    ".xlsx": UnstructuredExcelLoader,
-    ".xls": UnstructuredExcelLoader,
-    ".docx": UnstructuredWordDocumentLoader,
-    ".doc": UnstructuredWordDocumentLoader,
+    ".txt": "TextLoader",
+    ".pdf": "PyPDFLoader",
+    ".csv": "CSVLoader",
+    ".xlsx": "UnstructuredExcelLoader",
+    ".xls": "UnstructuredExcelLoader",
+    ".docx": "UnstructuredWordDocumentLoader",
+    ".doc": "UnstructuredWordDocumentLoader",
+    ".json": "JSONLoader",
 }
 
-class JSONLoader(BaseLoader):
-    """Custom loader for JSON files"""
+def create_json_loader_class() -> type:
+    """
+    Create the loader class for JSON files
     
-    def __init__(self, file_path: str):
-        self.file_path = file_path
+    Returns:
+        JSONLoader class
+    """
+    from langchain_community.document_loaders.base import BaseLoader
+    from langchain.docstore.document import Document
     
-    def load(self) -> List[Document]:
-        """Load and process JSON file"""
-        with open(self.file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+    class JSONLoader(BaseLoader):
+        """Custom loader for JSON files"""
         
-        documents = []
+        def __init__(self, file_path: str):
+            self.file_path = file_path
         
-        # Process the JSON data based on its structure
-        # Assuming the JSON contains an array of objects with text content
-        if isinstance(data, list):
-            for i, item in enumerate(data):
-                if isinstance(item, dict):
-                    # Extract text content from the item
-                    # Adjust this based on your JSON structure
+        def lazy_load(self) -> Iterator[Document]:
+            """Load and process JSON file one record at a time"""
+            file_name = os.path.basename(self.file_path)
+            
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                # A top-level array is decoded element by element; a single object whole
+                for i, (in_array, item) in enumerate(iter_json(f)):
+                    if not isinstance(item, dict):
+                        continue
                     content = self._extract_text_from_dict(item)
-                    if content:
-                        doc = Document(
-                            page_content=content,
-                            metadata={
-                                "source": self.file_path,
-                                "index": i,
-                                "file_name": os.path.basename(self.file_path)
-                            }
-                        )
-                        documents.append(doc)
-        elif isinstance(data, dict):
-            # If the JSON is a single object
-            content = self._extract_text_from_dict(data)
-            if content:
-                doc = Document(
-                    page_content=content,
-                    metadata={
-                        "source": self.file_path,
-                        "file_name": os.path.basename(self.file_path)
-                    }
-                )
-                documents.append(doc)
-        
-        return documents
-    
-    def _extract_text_from_dict(self, item: Dict[str, Any]) -> str:
-        """Extract text content from a dictionary"""
-        # Adjust this method based on your JSON structure
-        texts = []
-        
-        # Recursively extract text from nested dictionaries and lists
-        for key, value in item.items():
-            if isinstance(value, str):
-                texts.append(f"{key}: {value}")
-            elif isinstance(value, (int, float, bool)):
-                texts.append(f"{key}: {str(value)}")
-            elif isinstance(value, dict):
-                nested_text = self._extract_text_from_dict(value)
-                if nested_text:
-                    texts.append(f"{key}: {nested_text}")
-            elif isinstance(value, list):
-                for i, list_item in enumerate(value):
-                    if isinstance(list_item, str):
-                        texts.append(f"{key}[{i}]: {list_item}")
-                    elif isinstance(list_item, dict):
-                        nested_text = self._extract_text_from_dict(list_item)
-                        if nested_text:
-                            texts.append(f"{key}[{i}]: {nested_text}")
-        
-        return "\n".join(texts)
-
-# Add JSON loader to the mapping
-LOADER_MAPPING[".json"] = JSONLoader
-
-def load_documents(directory_path: str) -> List[Document]:
+                    if not content:
+                        continue
+                    metadata = {"source": self.file_path, "file_name": file_name}
+                    if in_array:
+                        metadata = {"source": self.file_path, "index": i, "file_name": file_name}
+                    yield Document(page_content=content, metadata=metadata)
+        
+        def load(self) -> List[Document]:
+            """Load and process JSON file"""
+            return list(self.lazy_load())
+        
+        def _extract_text_from_dict(self, item: Dict[str, Any]) -> str:
+            """Extract text content from a dictionary"""
+            return flatten_json(item)
+    
+    return JSONLoader
+
+_loader_classes: Dict[str, type] = {}
+
+def get_loader_class(extension: str) -> type:
     """
-    Load documents from a directory
+    Get the loader class for a file extension, importing it on first use
     
     Args:
-        directory_path: Path to the directory containing documents
+        extension: Lowercase file extension, with the dot
+        
+    Returns:
+        Loader class
+    """
+    name = LOADER_MAPPING[extension]
+    if name not in _loader_classes:
+        if name == "JSONLoader":
+            _loader_classes[name] = create_json_loader_class()
+        else:
+            import langchain_community.document_loaders as loaders
+            _loader_classes[name] = getattr(loaders, name)
+    return _loader_classes[name]
+
+def load_file(file_path: str) -> List["Document"]:
+    """
+    Load a single file with the loader for its extension
+    
+    Args:
+        file_path: Path to the file
         
     Returns:
         List of loaded documents
     """
-    documents = []
+    loader_class = get_loader_class(os.path.splitext(file_path)[1].lower())
+    return loader_class(file_path).load()
+
+@dataclass
+class LoadError:
+    """A file that could not be loaded"""
+    path: str
+    error_type: str
+    message: str
+
+@dataclass
+class LoadResult:
+    """Documents loaded from one file, or the error that prevented it"""
+    path: str
+    documents: List["Document"] = field(default_factory=list)
+    error: Optional[LoadError] = None
+    seconds: float = 0.0
+
+@dataclass
+class LoadReport:
+    """Outcome of loading a directory"""
+    documents: List["Document"] = field(default_factory=list)
+    errors: List[LoadError] = field(default_factory=list)
+    files_loaded: int = 0
+    seconds: float = 0.0
+
+def _load_file_result(file_path: str) -> LoadResult:
+    """Load a file, capturing any failure (runs in a worker process)"""
+    start = time.perf_counter()
+    try:
+        documents = load_file(file_path)
+        return LoadResult(file_path, documents, seconds=time.perf_counter() - start)
+    except Exception as e:
+        error = LoadError(file_path, type(e).__name__, str(e))
+        return LoadResult(file_path, error=error, seconds=time.perf_counter() - start)
+
+def iter_load_files(file_paths: List[str], max_workers: Optional[int] = None) -> Iterator[LoadResult]:
+    """
+    Load files in parallel across a process pool, yielding results in the
+    order of `file_paths` as soon as each one (and those before it) is done
+    
+    At most a few files per worker are in flight at once, so results are
+    streamed instead of accumulated. A failure only affects its own file.
+    
+    Args:
+        file_paths: Files to load
+        max_workers: Number of worker processes (defaults to DOCUMENT_LOADER_WORKERS)
+        
+    Yields:
+        LoadResult for each file, in input order
+    """
+    max_workers = max_workers or DOCUMENT_LOADER_WORKERS
+    if max_workers <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            yield _load_file_result(file_path)
+        return
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        paths = iter(file_paths)
+        for file_path in paths:
+            pending.append(executor.submit(_load_file_result, file_path))
+            if len(pending) >= max_workers * 2:
+                break
+        
+        while pending:
+            result = pending.popleft().result()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append(executor.submit(_load_file_result, next_path))
+            yield result
+
+def load_directory(directory_path: str, max_workers: Optional[int] = None) -> LoadReport:
+    """
+    Load every supported file of a directory, in parallel
+    
+    Args:
+        directory_path: Path to the directory containing documents
+        max_workers: Number of worker processes (defaults to DOCUMENT_LOADER_WORKERS)
+        
+    Returns:
+        LoadReport with the documents (in a deterministic order) and the errors
+    """
+    report = LoadReport()
     
     # Check if directory exists
     if not os.path.exists(directory_path):
-        print(f"Directory {directory_path} does not exist.")
-        return documents
-    
-    # Walk through directory
-    for root, _, files in os.walk(directory_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            file_extension = os.path.splitext(file_path)[1].lower()
-            
-            # Skip files with unsupported extensions
-            if file_extension not in LOADER_MAPPING:
-                continue
-            
-            # Load document using appropriate loader
-            loader_class = LOADER_MAPPING[file_extension]
-            try:
-                loader = loader_class(file_path)
-                documents.extend(loader.load())
-                print(f"Loaded {file_path}")
-            except Exception as e:
-                print(f"Error loading {file_path}: {str(e)}")
+        logger.warning("Directory %s does not exist.", directory_path)
+        return report
     
-    return documents
+    start = time.perf_counter()
+    files = scan_documents(directory_path, LOADER_MAPPING)
+    for result in iter_load_files([files[rel_path] for rel_path in sorted(files)], max_workers):
+        if result.error is not None:
+            report.errors.append(result.error)
+            logger.warning(
+                "Error loading %s: %s: %s",
+                result.error.path, result.error.error_type, result.error.message
+            )
+            continue
+        report.documents.extend(result.documents)
+        report.files_loaded += 1
+        logger.info("Loaded %s (%d documents, %.2fs)", result.path, len(result.documents), result.seconds)
+    report.seconds = time.perf_counter() - start
+    return report
 
-def split_documents(documents: List[Document], chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Document]:
+def load_documents(directory_path: str, max_workers: Optional[int] = None) -> List["Document"]:
+    """
+    Load documents from a directory
+    
+    Args:
+        directory_path: Path to the directory containing documents
+        max_workers: Number of worker processes (defaults to DOCUMENT_LOADER_WORKERS)
+        
+    Returns:
+        List of loaded documents
+    """
+    report = load_directory(directory_path, max_workers)
+    print(f"Loaded {report.files_loaded} files in {report.seconds:.2f}s ({len(report.errors)} errors)")
+    return report.documents
+
+def split_documents(documents: List["Document"], chunk_size: int = 1000, chunk_overlap: int = 200) -> List["Document"]:
     """
     Split documents into chunks
     
@@ -162,6 +276,8 @@ def split_documents(documents: List[Document], chunk_size: int = 1000, chunk_ove
     Returns:
         List of document chunks
     """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
@@ -177,53 +293,50 @@ def create_openai_embeddings():
     Returns:
         OpenAI embeddings
     """
-    import requests
     from langchain_core.embeddings import Embeddings
+    from app.utils.embedding_engine import EmbeddingEngine
     
     class DirectOpenAIEmbeddings(Embeddings):
         """OpenAI embeddings using direct API access"""
         
-        def __init__(self, api_key=None):
+        def __init__(self, api_key=None, model=EMBEDDING_MODEL):
             self.api_key = api_key or os.getenv("OPENAI_API_KEY")
             if not self.api_key:
                 raise ValueError("OpenAI API key is required")
+            self.model = model
+            self.cache = get_embedding_cache()
+            self.engine = EmbeddingEngine(self.api_key, model)
         
         def embed_documents(self, texts):
-            """Embed documents using OpenAI API"""
-            results = []
-            # Process in batches to avoid API limits
-            batch_size = 16
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i+batch_size]
-                batch_results = self._embed_batch(batch)
-                results.extend(batch_results)
+            """Embed documents using OpenAI API, skipping texts already in the cache"""
+            texts = list(texts)
+            if self.cache is None:
+                return self._embed_uncached(texts)
+            
+            results = self.cache.get_many(self.model, texts)
+            
+            # Embed each distinct missing text once
+            missing = list(dict.fromkeys(text for text, vector in zip(texts, results) if vector is None))
+            if missing:
+                embedded = dict(zip(missing, self._embed_uncached(missing)))
+                self.cache.put_many(self.model, missing, [embedded[text] for text in missing])
+                results = [
+                    vector if vector is not None else embedded[text]
+                    for text, vector in zip(texts, results)
+                ]
             return results
         
         def embed_query(self, text):
             """Embed query using OpenAI API"""
-            return self._embed_batch([text])[0]
-        
-        def _embed_batch(self, texts):
-            """Embed a batch of texts using OpenAI API"""
-            url = "https://api.openai.com/v1/embeddings"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            data = {
-                "model": "text-embedding-ada-002",
-                "input": texts
-            }
-            
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            
-            result = response.json()
-            return [item["embedding"] for item in result["data"]]
+            return self.embed_documents([text])[0]
+        
+        def _embed_uncached(self, texts):
+            """Embed texts with the API (batched, concurrent, with retries)"""
+            return self.engine.embed(texts)
     
     return DirectOpenAIEmbeddings()
 
-def create_vector_store(documents: List[Document], persist_directory: Optional[str] = None) -> Chroma:
+def create_vector_store(documents: List["Document"], persist_directory: Optional[str] = None) -> "VectorStore":
     """
     Create a vector store from documents
     
@@ -232,12 +345,22 @@ def create_vector_store(documents: List[Document], persist_directory: Optional[s
         persist_directory: Directory to persist the vector store
         
     Returns:
-        Chroma vector store
+        Vector store (Chroma or local index, depending on VECTOR_STORE_BACKEND)
     """
     # Get embeddings using direct API access
     embeddings = create_openai_embeddings()
     
     # Create vector store
+    if VECTOR_STORE_BACKEND == "local":
+        from app.utils.local_index import LocalVectorStore
+        vector_store = LocalVectorStore.from_documents(
+            documents=documents,
+            embedding=embeddings,
+            persist_directory=persist_directory or CHROMA_DB_DIR
+        )
+        return vector_store
+    
+    from langchain_community.vectorstores import Chroma
     if persist_directory:
         vector_store = Chroma.from_documents(
             documents=documents,
@@ -254,7 +377,7 @@ def create_vector_store(documents: List[Document], persist_directory: Optional[s
     
     return vector_store
 
-def get_vector_store(persist_directory: str) -> Optional[Chroma]:
+def get_vector_store(persist_directory: str) -> Optional["VectorStore"]:
     """
     Get an existing vector store
     
@@ -262,7 +385,7 @@ def get_vector_store(persist_directory: str) -> Optional[Chroma]:
         persist_directory: Directory where the vector store is persisted
         
     Returns:
-        Chroma vector store or None if it doesn't exist
+        Vector store or None if it doesn't exist
     """
     if not os.path.exists(persist_directory):
         return None
@@ -272,6 +395,13 @@ def get_vector_store(persist_directory: str) -> Optional[Chroma]:
         embeddings = create_openai_embeddings()
         
         # Load the vector store
+        if VECTOR_STORE_BACKEND == "local":
+            from app.utils.local_index import LocalVectorStore, local_index_exists
+            if not local_index_exists(persist_directory):
+                return None
+            return LocalVectorStore(persist_directory, embeddings)
+        
+        from langchain_community.vectorstores import Chroma
         vector_store = Chroma(
             persist_directory=persist_directory,
             embedding_function=embeddings
@@ -282,7 +412,118 @@ def get_vector_store(persist_directory: str) -> Optional[Chroma]:
         print(f"Error loading vector store: {str(e)}")
         return None
 
-def query_vector_store(query: str, persist_directory: str, num_results: int = 5) -> List[Document]:
+class VectorStoreHandle:
+    """
+    Long-lived, thread-safe handle to a persisted vector store
+    
+    The store (and its embeddings client) is opened on first use and then
+    shared by every query. It is reopened when the index files on disk
+    change (checked at most every VECTOR_STORE_CHECK_INTERVAL seconds) or
+    when `reload` is called explicitly.
+    """
+    
+    def __init__(self, persist_directory: str):
+        self.persist_directory = persist_directory
+        self._lock = threading.Lock()
+        self._store: Optional["VectorStore"] = None
+        self._signature: Optional[tuple] = None
+        self._last_check = 0.0
+    
+    def _index_signature(self) -> tuple:
+        """Fingerprint the files backing the index by size and modification time"""
+        if not os.path.exists(self.persist_directory):
+            return ()
+        
+        entries = []
+        for root, _, files in os.walk(self.persist_directory):
+            for file in files:
+                stat = os.stat(os.path.join(root, file))
+                entries.append((os.path.join(root, file), stat.st_size, stat.st_mtime_ns))
+        return tuple(sorted(entries))
+    
+    def _open(self) -> Optional["VectorStore"]:
+        """Open the store, dropping any client chromadb cached for the directory"""
+        if VECTOR_STORE_BACKEND == "chroma":
+            try:
+                from chromadb.api.client import SharedSystemClient
+                SharedSystemClient.clear_system_cache()
+            except ImportError:
+                pass
+        
+        self._signature = self._index_signature()
+        self._last_check = time.monotonic()
+        self._store = get_vector_store(self.persist_directory)
+        if self._store is not None:
+            print(f"Opened vector store at {self.persist_directory}")
+        return self._store
+    
+    def get(self) -> Optional["VectorStore"]:
+        """
+        Get the open vector store, opening or reopening it if needed
+        
+        Returns:
+            Vector store or None if it doesn't exist
+        """
+        now = time.monotonic()
+        if self._store is not None and now - self._last_check < VECTOR_STORE_CHECK_INTERVAL:
+            return self._store
+        
+        with self._lock:
+            if self._store is None:
+                return self._open()
+            if now - self._last_check >= VECTOR_STORE_CHECK_INTERVAL:
+                self._last_check = now
+                if self._index_signature() != self._signature:
+                    print(f"Vector store at {self.persist_directory} changed on disk, reloading")
+                    return self._open()
+            return self._store
+    
+    def reload(self) -> Optional["VectorStore"]:
+        """
+        Reopen the vector store (e.g. after ingesting new documents)
+        
+        Returns:
+            Vector store or None if it doesn't exist
+        """
+        with self._lock:
+            return self._open()
+    
+    @property
+    def is_open(self) -> bool:
+        return self._store is not None
+
+_handles: Dict[str, VectorStoreHandle] = {}
+_handles_lock = threading.Lock()
+
+def get_vector_store_handle(persist_directory: Optional[str] = None) -> VectorStoreHandle:
+    """
+    Get the process-wide handle for a persisted vector store
+    
+    Args:
+        persist_directory: Directory where the vector store is persisted
+            (defaults to CHROMA_DB_DIR)
+        
+    Returns:
+        VectorStoreHandle shared by all callers
+    """
+    persist_directory = os.path.abspath(persist_directory or CHROMA_DB_DIR)
+    with _handles_lock:
+        if persist_directory not in _handles:
+            _handles[persist_directory] = VectorStoreHandle(persist_directory)
+        return _handles[persist_directory]
+
+def is_chroma(vector_store: "VectorStore") -> bool:
+    """Check if a vector store is a Chroma store, without importing Chroma for other backends"""
+    chroma = sys.modules.get("langchain_community.vectorstores.chroma")
+    return chroma is not None and isinstance(vector_store, chroma.Chroma)
+
+def query_vector_store(
+    query: str,
+    persist_directory: str,
+    num_results: int = 5,
+    filters: Optional[MetadataFilter] = None,
+    embedding: Optional[List[float]] = None
+) -> List["Document"]:
     """
     Query the vector store for relevant documents
     
@@ -290,49 +531,361 @@ def query_vector_store(query: str, persist_directory: str, num_results: int = 5)
         query: The query string
         persist_directory: Directory where the vector store is persisted
         num_results: Number of results to return
+        filters: Only consider chunks with these attributes
+        embedding: Embedding of the query, if already computed
         
     Returns:
         List of relevant documents
     """
-    vector_store = get_vector_store(persist_directory)
+    vector_store = get_vector_store_handle(persist_directory).get()
     if not vector_store:
         print(f"Vector store not found at {persist_directory}")
         return []
     
     try:
-        # Query the vector store
-        results = vector_store.similarity_search(query, k=num_results)
-        return results
+        # Query the vector store; filters narrow the candidates before scoring
+        kwargs = {}
+        if filters is not None:
+            kwargs["filter"] = filters.chroma_where() if is_chroma(vector_store) else filters
+        if embedding is not None:
+            return vector_store.similarity_search_by_vector(embedding, k=num_results, **kwargs)
+        return vector_store.similarity_search(query, k=num_results, **kwargs)
     except Exception as e:
         print(f"Error querying vector store: {str(e)}")
         return []
 
-def ingest_documents(documents_dir: str, persist_dir: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> None:
+def assign_chunk_ids(chunks: List["Document"], rel_path: str) -> List[str]:
+    """
+    Give the chunks of a file deterministic ids (also stored in their metadata)
+    
+    Args:
+        chunks: Chunks of one file, in order
+        rel_path: Path of the file relative to the documents directory
+        
+    Returns:
+        List of chunk ids
+    """
+    ids = []
+    for index, chunk in enumerate(chunks):
+        cid = chunk_id(rel_path, index, chunk.page_content)
+        chunk.metadata["chunk_id"] = cid
+        ids.append(cid)
+    return ids
+
+def open_vector_store(persist_directory: str) -> "VectorStore":
+    """
+    Open a persisted vector store for writing, creating it if needed
+    
+    Args:
+        persist_directory: Directory where the vector store is persisted
+        
+    Returns:
+        Vector store (Chroma or local index, depending on VECTOR_STORE_BACKEND)
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    if VECTOR_STORE_BACKEND == "local":
+        from app.utils.local_index import LocalVectorStore
+        return LocalVectorStore(persist_directory, create_openai_embeddings())
+    from langchain_community.vectorstores import Chroma
+    return Chroma(
+        persist_directory=persist_directory,
+        embedding_function=create_openai_embeddings()
+    )
+
+def delete_chunks(vector_store: "VectorStore", ids: List[str], lexical: Optional["LexicalIndex"] = None) -> None:
+    """Delete chunks from the vector store (and lexical index) by id, in batches"""
+    for i in range(0, len(ids), UPSERT_BATCH_SIZE):
+        vector_store.delete(ids=ids[i:i + UPSERT_BATCH_SIZE])
+    if lexical is not None:
+        lexical.delete(ids)
+
+def upsert_chunks(
+    vector_store: "VectorStore",
+    chunks: List["Document"],
+    ids: List[str],
+    embeddings: Optional[List[List[float]]] = None,
+    lexical: Optional["LexicalIndex"] = None
+) -> None:
+    """Insert or replace chunks in the vector store (and lexical index), in batches"""
+    if lexical is not None:
+        lexical.upsert(ids, [chunk.page_content for chunk in chunks], [chunk.metadata for chunk in chunks])
+    for i in range(0, len(chunks), UPSERT_BATCH_SIZE):
+        batch = slice(i, i + UPSERT_BATCH_SIZE)
+        if embeddings is None:
+            vector_store.add_documents(chunks[batch], ids=ids[batch])
+        elif not is_chroma(vector_store):
+            vector_store.upsert_embeddings(
+                ids[batch],
+                embeddings[batch],
+                [chunk.page_content for chunk in chunks[batch]],
+                [chunk.metadata for chunk in chunks[batch]]
+            )
+        else:
+            # Already embedded: write straight to the collection
+            vector_store._collection.upsert(
+                ids=ids[batch],
+                embeddings=embeddings[batch],
+                metadatas=[chunk.metadata for chunk in chunks[batch]],
+                documents=[chunk.page_content for chunk in chunks[batch]]
+            )
+
+@dataclass
+class IngestedFile:
+    """A file whose chunks have all been assigned to batches"""
+    rel_path: str
+    file_path: str
+    ids: List[str]
+
+@dataclass
+class IngestBatch:
+    """Chunks flowing through the ingest pipeline, written together"""
+    chunks: List["Document"] = field(default_factory=list)
+    ids: List[str] = field(default_factory=list)
+    embeddings: Optional[List[List[float]]] = None
+    # Files that are complete once this batch is written
+    completed: List[IngestedFile] = field(default_factory=list)
+
+class _Batcher:
+    """Splits loaded files into chunks and groups them into fixed-size batches"""
+    
+    def __init__(
+        self,
+        files: Dict[str, str],
+        chunk_size: int,
+        chunk_overlap: int,
+        batch_size: int,
+        skip_ids: Optional[set] = None,
+        attributes: Optional[Dict[str, Dict[str, Any]]] = None
+    ):
+        self.files = files
+        self.batch_size = batch_size
+        # Filterable attributes added to the metadata of each file's chunks
+        self.attributes = attributes or {}
+        # Chunks already written by an interrupted run
+        self.skip_ids = skip_ids or set()
+        self.skipped = 0
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+        )
+        self.paths = {file_path: rel_path for rel_path, file_path in files.items()}
+        self.errors: List[LoadError] = []
+        self.batch = IngestBatch()
+    
+    def process(self, result: LoadResult) -> Iterator[IngestBatch]:
+        if result.error is not None:
+            # Not recorded in the manifest, so the file is retried next run
+            self.errors.append(result.error)
+            logger.warning("Error loading %s: %s: %s", result.path, result.error.error_type, result.error.message)
+            return
+        
+        rel_path = self.paths[result.path]
+        for doc in result.documents:
+            doc.metadata.update(self.attributes.get(rel_path, {}))
+        chunks = self.text_splitter.split_documents(result.documents)
+        ids = assign_chunk_ids(chunks, rel_path)
+        for chunk, cid in zip(chunks, ids):
+            if cid in self.skip_ids:
+                self.skipped += 1
+                continue
+            self.batch.chunks.append(chunk)
+            self.batch.ids.append(cid)
+            if len(self.batch.chunks) >= self.batch_size:
+                yield self.batch
+                self.batch = IngestBatch()
+        # The file is complete once the batch holding its last chunk is written
+        self.batch.completed.append(IngestedFile(rel_path, result.path, ids))
+    
+    def finish(self) -> Iterator[IngestBatch]:
+        if self.batch.chunks or self.batch.completed:
+            yield self.batch
+
+def open_lexical_index(vector_store: "VectorStore", persist_directory: str) -> Optional["LexicalIndex"]:
+    """
+    Open the lexical index of a vector store for writing
+    
+    If the store was ingested before the lexical index existed, the index is
+    filled from the chunks already in the store.
+    
+    Args:
+        vector_store: The vector store being ingested into
+        persist_directory: Directory where the vector store is persisted
+        
+    Returns:
+        LexicalIndex, or None if LEXICAL_INDEX_ENABLED is off
+    """
+    if not LEXICAL_INDEX_ENABLED:
+        return None
+    
+    from app.utils.lexical_index import LexicalIndex, LEXICAL_INDEX_FILE
+    
+    exists = os.path.exists(os.path.join(persist_directory, LEXICAL_INDEX_FILE))
+    lexical = LexicalIndex(persist_directory)
+    if not exists:
+        existing = vector_store.get(include=["documents", "metadatas"])
+        if existing["ids"]:
+            print(f"Building the lexical index from {len(existing['ids'])} existing chunks...")
+            for i in range(0, len(existing["ids"]), UPSERT_BATCH_SIZE):
+                batch = slice(i, i + UPSERT_BATCH_SIZE)
+                lexical.upsert(existing["ids"][batch], existing["documents"][batch], existing["metadatas"][batch])
+    return lexical
+
+def ingest_documents(
+    documents_dir: str,
+    persist_dir: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    incremental: bool = False,
+    resume: bool = False
+) -> None:
     """
     Ingest documents into the vector store
     
+    A manifest next to the store records, for every file, its size, time,
+    content hash and chunk ids. Chunk ids are deterministic, so ingesting
+    the same file twice replaces its chunks instead of duplicating them, and
+    chunks of removed files are deleted. In incremental mode only new or
+    changed files are loaded, split and embedded.
+    
+    Loading, splitting, embedding and writing run as overlapping pipeline
+    stages over bounded queues, and chunks are written in batches of
+    UPSERT_BATCH_SIZE, so memory stays flat and an interrupted run loses at
+    most the batches in flight. Written batches are recorded in a journal;
+    resuming an interrupted run skips the files it completed and the chunks
+    it wrote.
+    
     Args:
         documents_dir: Directory containing documents to ingest
         persist_dir: Directory to persist the vector store
         chunk_size: Size of each chunk
         chunk_overlap: Overlap between chunks
+        incremental: Only process files that changed since the last run
+        resume: Continue an interrupted run instead of starting a new one
     """
-    print(f"Loading documents from {documents_dir}...")
-    documents = load_documents(documents_dir)
+    settings = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    
+    journal = IngestJournal.load(persist_dir)
+    if journal is not None and not resume:
+        print("Discarding the journal of an interrupted ingestion (use --resume to continue it).")
+        journal = None
+    elif journal is None and resume:
+        print("No interrupted ingestion to resume, starting a new one.")
+    elif journal is not None and journal.settings != settings:
+        print("The interrupted ingestion used different chunking settings, starting a new one.")
+        journal = None
+    
+    resuming = journal is not None
+    if resuming:
+        incremental = journal.incremental
+        print(f"Resuming: {len(journal.completed_files)} files and {len(journal.written_ids)} chunks already written.")
+    else:
+        journal = IngestJournal(persist_dir, settings, incremental)
+    
+    print(f"Scanning documents in {documents_dir}...")
+    files = scan_documents(documents_dir, LOADER_MAPPING)
     
-    if not documents:
+    vector_store = open_vector_store(persist_dir)
+    manifest = IngestManifest.load(persist_dir)
+    untracked = manifest is None
+    if untracked:
+        # Chunks written before manifests existed have random ids and can't be tracked
+        existing = vector_store.get(include=[])["ids"]
+        if existing:
+            print(f"No ingest manifest found, removing {len(existing)} untracked chunks.")
+            delete_chunks(vector_store, existing)
+        manifest = IngestManifest(persist_dir)
+    lexical = open_lexical_index(vector_store, persist_dir)
+    if untracked and lexical is not None:
+        lexical.clear()
+    
+    if not files and not manifest.files:
         print("No documents found.")
         return
     
-    print(f"Loaded {len(documents)} documents.")
+    # Changing the chunking settings changes every chunk
+    force = not incremental or settings_changed(manifest, settings)
+    attributes = load_document_attributes(documents_dir, files)
+    plan = manifest.plan(files, force=force, attributes=attributes)
+    print(f"{len(plan.to_process)} files to process, {len(plan.unchanged)} unchanged, {len(plan.removed)} removed.")
+    
+    # Delete the chunks of removed files
+    if plan.removed:
+        delete_chunks(vector_store, manifest.chunk_ids(plan.removed), lexical)
+        for rel_path in plan.removed:
+            del manifest.files[rel_path]
+        manifest.save()
+    
+    to_process = {}
+    for rel_path in plan.to_process:
+        record = manifest.files.get(rel_path)
+        if (
+            rel_path in journal.completed_files
+            and record is not None
+            and record.sha256 == plan.hashes[rel_path]
+        ):
+            # Completed by the interrupted run and not modified since
+            continue
+        to_process[rel_path] = files[rel_path]
+    if len(to_process) < len(plan.to_process):
+        print(f"{len(plan.to_process) - len(to_process)} files already completed by the interrupted run.")
+    
+    batcher = _Batcher(to_process, chunk_size, chunk_overlap, UPSERT_BATCH_SIZE, journal.written_ids, attributes)
+    embeddings = vector_store.embeddings
+    total_chunks = 0
+    
+    def embed(batch: IngestBatch) -> Iterator[IngestBatch]:
+        batch.embeddings = embeddings.embed_documents([chunk.page_content for chunk in batch.chunks]) if batch.chunks else []
+        yield batch
+    
+    def write(batch: IngestBatch) -> Iterator[IngestBatch]:
+        nonlocal total_chunks
+        upsert_chunks(vector_store, batch.chunks, batch.ids, batch.embeddings, lexical)
+        total_chunks += len(batch.ids)
+        
+        for done in batch.completed:
+            # Delete chunks the file no longer produces
+            stale = set(manifest.chunk_ids([done.rel_path])) - set(done.ids)
+            if stale:
+                delete_chunks(vector_store, sorted(stale), lexical)
+            manifest.record(
+                done.rel_path, done.file_path, plan.hashes[done.rel_path], done.ids, attributes.get(done.rel_path)
+            )
+        if batch.completed:
+            # Save as files complete so an interrupted run keeps its progress
+            manifest.save()
+        journal.record_batch(batch.ids, [done.rel_path for done in batch.completed])
+        
+        print(f"Wrote {len(batch.ids)} chunks, {len(batch.completed)} files completed | {pipeline.describe()}")
+        yield batch
+    
+    chunk_count = lambda batch: len(batch.ids)
+    pipeline = Pipeline([
+        Stage("load", lambda _: iter_load_files(list(to_process.values())), size=lambda result: 1, unit="files"),
+        Stage("split", batcher.process, finish=batcher.finish, size=chunk_count, unit="chunks"),
+        Stage("embed", embed, size=chunk_count, unit="chunks"),
+        Stage("write", write, size=chunk_count, unit="chunks"),
+    ])
+    if to_process:
+        journal.open(append=resuming)
+        try:
+            pipeline.run()
+        finally:
+            journal.close()
     
-    print("Splitting documents into chunks...")
-    chunks = split_documents(documents, chunk_size, chunk_overlap)
-    print(f"Split into {len(chunks)} chunks.")
+    if hasattr(vector_store, "optimize"):
+        # Compact the local index and build its HNSW graph if it is large enough
+        vector_store.optimize()
     
-    print("Creating vector store...")
-    create_vector_store(chunks, persist_dir)
-    print(f"Vector store created and persisted to {persist_dir}.")
+    manifest.settings = settings
+    manifest.save()
+    journal.finish()
+    if batcher.skipped:
+        print(f"Skipped {batcher.skipped} chunks already written by the interrupted run.")
+    print(f"Vector store updated at {persist_dir}: {total_chunks} chunks written, {len(batcher.errors)} files failed.")
+    if to_process:
+        print(pipeline.describe())
 
 if __name__ == "__main__":
     # Example usage:
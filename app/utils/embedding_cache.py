@@ -0,0 +1,238 @@
+"""
+Embedding Cache
+
+This module keeps embeddings on disk (SQLite) keyed by the SHA-256 of the
+model name and the text, so unchanged chunks and repeated questions are never
+sent to the embeddings API twice. A small in-memory LRU sits in front of the
+database for hot queries. The database is bounded by a maximum number of
+entries; the least recently used ones are evicted.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Cache settings
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200000))
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", 2048))
+
+# SQLite limits the number of parameters in a single statement
+_SQLITE_BATCH = 500
+
+def embedding_key(model: str, text: str) -> str:
+    """
+    Compute the cache key of a text
+
+    Args:
+        model: Embedding model name
+        text: Embedded text
+
+    Returns:
+        Hex SHA-256 of the model name and text
+    """
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+@dataclass
+class EmbeddingCacheStats:
+    """Counters describing the cache's behaviour"""
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+    entries: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": self.entries,
+        }
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache with an in-memory LRU front"""
+
+    def __init__(
+        self,
+        path: str = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_items = memory_items
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._stats = EmbeddingCacheStats()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._stats.entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        """Put a vector in the in-memory LRU"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Look up the embeddings of several texts
+
+        Args:
+            model: Embedding model name
+            texts: Texts to look up
+
+        Returns:
+            List with the cached embedding, or None, for each text
+        """
+        keys = [embedding_key(model, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        with self._lock:
+            missing: Dict[str, List[int]] = {}
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._stats.memory_hits += 1
+                    results[i] = vector
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            found = []
+            missing_keys = list(missing)
+            for start in range(0, len(missing_keys), _SQLITE_BATCH):
+                batch = missing_keys[start:start + _SQLITE_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    vector = vector.tolist()
+                    self._remember(key, vector)
+                    found.append(key)
+                    for i in missing[key]:
+                        results[i] = vector
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            found_keys = set(found)
+            for key, indices in missing.items():
+                if key in found_keys:
+                    self._stats.disk_hits += len(indices)
+                else:
+                    self._stats.misses += len(indices)
+
+        return results
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """
+        Store the embeddings of several texts
+
+        Args:
+            model: Embedding model name
+            texts: Embedded texts
+            vectors: Their embeddings
+        """
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            rows[embedding_key(model, text)] = (array("f", vector).tobytes(), list(vector))
+
+        with self._lock:
+            # Embeddings are deterministic per key, so existing rows are kept as they are
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, blob, now) for key, (blob, _) in rows.items()]
+            )
+            for key, (_, vector) in rows.items():
+                self._remember(key, vector)
+            self._stats.writes += cursor.rowcount
+            self._stats.entries += cursor.rowcount
+            if self._stats.entries > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries, keeping 90% of the budget"""
+        target = int(self.max_entries * 0.9)
+        excess = self._stats.entries - target
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN"
+            " (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+        self._stats.evictions += excess
+        self._stats.entries = target
+
+    def stats(self) -> Dict[str, float]:
+        """Get the cache's counters"""
+        return self._stats.as_dict()
+
+    def close(self) -> None:
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Get the process-wide embedding cache
+
+    Returns:
+        EmbeddingCache, or None if the cache is disabled
+    """
+    global _cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
+
+def embedding_cache_stats() -> Optional[Dict[str, float]]:
+    """Get the counters of the embedding cache, if it has been opened"""
+    return _cache.stats() if _cache is not None else None
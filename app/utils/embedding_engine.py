@@ -0,0 +1,232 @@
+"""
+Embedding Engine
+
+This module sends texts to the OpenAI embeddings API efficiently: texts are
+packed into batches by token count (up to the API's input limits), several
+batches are embedded concurrently over a pooled HTTP session, and rate-limit
+responses are retried with exponential backoff and jitter, honouring the
+`Retry-After` and `x-ratelimit-reset-*` headers. Results are returned in the
+same order as the input texts.
+"""
+
+import os
+import re
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from app.utils.prompts import count_tokens
+
+# Load environment variables
+load_dotenv()
+
+# Base URL of the OpenAI API
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+
+# Batch packing limits (the API accepts up to 2048 inputs of up to 8191 tokens each)
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", 8000))
+EMBEDDING_BATCH_MAX_INPUTS = int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", 256))
+
+# Number of batches embedded concurrently
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))
+
+# Retry settings for rate limits and transient errors
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 6))
+EMBEDDING_BACKOFF_BASE = float(os.getenv("EMBEDDING_BACKOFF_BASE", 1.0))
+EMBEDDING_BACKOFF_MAX = float(os.getenv("EMBEDDING_BACKOFF_MAX", 60.0))
+EMBEDDING_REQUEST_TIMEOUT = float(os.getenv("EMBEDDING_REQUEST_TIMEOUT", 60))
+
+# Status codes worth retrying
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a rate-limit reset header such as "20ms", "1s" or "6m0s"
+
+    Args:
+        value: Header value
+
+    Returns:
+        Number of seconds, or None if the value can't be parsed
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+def retry_delay(response: Optional[requests.Response], attempt: int) -> float:
+    """
+    Compute how long to wait before retrying a request
+
+    The server's hint (Retry-After or the rate-limit reset headers) is used
+    as a floor; on top of it an exponential backoff with full jitter spreads
+    out concurrent retries.
+
+    Args:
+        response: The failed response (None for connection errors)
+        attempt: Number of attempts made so far (starting at 1)
+
+    Returns:
+        Delay in seconds
+    """
+    hint = None
+    if response is not None:
+        hints = [
+            parse_reset_duration(response.headers.get("retry-after")),
+            parse_reset_duration(response.headers.get("x-ratelimit-reset-requests")),
+            parse_reset_duration(response.headers.get("x-ratelimit-reset-tokens")),
+        ]
+        hints = [h for h in hints if h is not None]
+        hint = max(hints) if hints else None
+
+    backoff = min(EMBEDDING_BACKOFF_MAX, EMBEDDING_BACKOFF_BASE * (2 ** (attempt - 1)))
+    jitter = random.uniform(0, backoff)
+    return min(EMBEDDING_BACKOFF_MAX, (hint or 0.0) + jitter)
+
+def pack_batches(
+    texts: Sequence[str],
+    max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+    max_inputs: int = EMBEDDING_BATCH_MAX_INPUTS,
+) -> List[List[int]]:
+    """
+    Group texts into batches bounded by token count and number of inputs
+
+    Args:
+        texts: Texts to embed
+        max_tokens: Maximum number of tokens per batch
+        max_inputs: Maximum number of texts per batch
+
+    Returns:
+        List of batches, each a list of indices into `texts` (in order)
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_inputs):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+class EmbeddingEngine:
+    """Concurrent, pooled, rate-limit-aware client for the embeddings API"""
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        base_url: str = OPENAI_API_BASE,
+        max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+    ):
+        self.model = model
+        self.url = base_url.rstrip("/") + "/embeddings"
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        })
+
+        # When one request is rate limited, every worker waits until this time
+        self._pause_until = 0.0
+        self._pause_lock = threading.Lock()
+
+    def _wait_if_paused(self) -> None:
+        delay = self._pause_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _pause(self, delay: float) -> None:
+        with self._pause_lock:
+            self._pause_until = max(self._pause_until, time.monotonic() + delay)
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch, retrying rate limits and transient errors"""
+        attempt = 0
+        while True:
+            attempt += 1
+            self._wait_if_paused()
+            response = None
+            try:
+                response = self.session.post(
+                    self.url,
+                    json={"model": self.model, "input": texts},
+                    timeout=EMBEDDING_REQUEST_TIMEOUT
+                )
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    response.raise_for_status()
+                    data = response.json()["data"]
+                    return [item["embedding"] for item in sorted(data, key=lambda item: item["index"])]
+                error = requests.HTTPError(f"{response.status_code} from embeddings API", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+
+            if attempt > self.max_retries:
+                raise error
+
+            delay = retry_delay(response, attempt)
+            if response is not None and response.status_code == 429:
+                self._pause(delay)
+            print(f"Embedding request failed ({error}), retrying in {delay:.1f}s (attempt {attempt}/{self.max_retries})")
+            time.sleep(delay)
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """
+        Embed texts, running batches concurrently
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Embeddings in the same order as `texts`
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+
+        batches = pack_batches(texts)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        def run(batch: List[int]) -> None:
+            vectors = self._embed_batch([texts[i] for i in batch])
+            for i, vector in zip(batch, vectors):
+                results[i] = vector
+
+        if len(batches) == 1 or self.max_concurrency == 1:
+            for batch in batches:
+                run(batch)
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+                # list() re-raises the first failure
+                list(executor.map(run, batches))
+
+        return results
+
+    def close(self) -> None:
+        """Close the pooled session"""
+        self.session.close()
@@ -0,0 +1,114 @@
+"""
+Shared HTTP Client
+
+This module owns the process-wide asynchronous HTTP client used to call the
+OpenAI API. The client is created once at application startup, keeps pooled
+keep-alive connections (HTTP/2 when the `h2` package is available) and is
+closed at shutdown. A semaphore bounds the number of in-flight upstream
+requests so a burst of chats cannot exhaust the connection pool.
+"""
+
+import os
+import asyncio
+from typing import Optional
+import httpx
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Base URL of the OpenAI API (override to point at a local stub server)
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+
+# Connection pool settings
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+
+# Maximum number of concurrent upstream requests per worker
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 32))
+
+# Per-request timeouts (seconds)
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 60))
+
+_client: Optional[httpx.AsyncClient] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+def _http2_available() -> bool:
+    """Check whether the optional `h2` package is installed"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _create_client() -> httpx.AsyncClient:
+    """
+    Create the pooled asynchronous HTTP client
+
+    Returns:
+        Configured httpx.AsyncClient
+    """
+    headers = {"Content-Type": "application/json"}
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+
+    return httpx.AsyncClient(
+        base_url=OPENAI_API_BASE,
+        headers=headers,
+        http2=_http2_available(),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    )
+
+async def init_http_client() -> httpx.AsyncClient:
+    """
+    Create the shared HTTP client (called at application startup)
+
+    Returns:
+        The shared httpx.AsyncClient
+    """
+    global _client, _semaphore
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+    _semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+    return _client
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client (called at application shutdown)"""
+    global _client, _semaphore
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _semaphore = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the shared HTTP client, creating it lazily if startup did not run
+    (e.g. when the utilities are used from a script)
+
+    Returns:
+        The shared httpx.AsyncClient
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+    return _client
+
+def get_request_slot() -> asyncio.Semaphore:
+    """
+    Get the semaphore that bounds concurrent upstream requests
+
+    Returns:
+        asyncio.Semaphore shared by all requests in this worker
+    """
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+    return _semaphore
@@ -0,0 +1,303 @@
+"""
+Ingest Manifest
+
+This module keeps a manifest next to the vector store describing what was
+ingested: for every source file its size, modification time, content hash
+and the ids of the chunks it produced. Comparing the manifest with the
+documents directory tells incremental ingestion which files are new, changed
+or removed, and deterministic chunk ids make re-ingesting a file an
+idempotent upsert.
+
+While a run is in progress a journal records every batch written to the
+store, so an interrupted run can be resumed without embedding or writing
+those chunks again.
+"""
+
+import os
+import json
+import hashlib
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Set
+from app.utils.metadata_filter import DOCUMENT_METADATA_FILE
+
+# Name of the manifest file inside the persist directory
+MANIFEST_FILE = "ingest_manifest.json"
+
+# Name of the journal of the ingestion in progress, inside the persist directory
+JOURNAL_FILE = "ingest_journal.jsonl"
+
+# Version of the manifest format
+MANIFEST_VERSION = 1
+
+@dataclass
+class FileRecord:
+    """What was ingested from one source file"""
+    path: str
+    size: int
+    mtime: float
+    sha256: str
+    chunk_ids: List[str] = field(default_factory=list)
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class IngestPlan:
+    """Files to process and to remove in an ingestion run"""
+    to_process: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    hashes: Dict[str, str] = field(default_factory=dict)
+
+def file_sha256(file_path: str) -> str:
+    """
+    Hash a file's content
+
+    Args:
+        file_path: Path to the file
+
+    Returns:
+        Hex SHA-256 of the file
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id(rel_path: str, index: int, content: str) -> str:
+    """
+    Compute the deterministic id of a chunk
+
+    Args:
+        rel_path: Path of the source file relative to the documents directory
+        index: Position of the chunk within the file
+        content: Chunk text
+
+    Returns:
+        Hex id, stable across runs for the same chunk
+    """
+    return hashlib.sha256(f"{rel_path}\0{index}\0{content}".encode("utf-8")).hexdigest()[:32]
+
+class IngestManifest:
+    """Manifest of the files ingested into a vector store"""
+
+    def __init__(self, persist_dir: str, files: Optional[Dict[str, FileRecord]] = None, settings: Optional[Dict] = None):
+        self.persist_dir = persist_dir
+        self.files: Dict[str, FileRecord] = files or {}
+        self.settings: Dict = settings or {}
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.persist_dir, MANIFEST_FILE)
+
+    @classmethod
+    def load(cls, persist_dir: str) -> Optional["IngestManifest"]:
+        """
+        Load the manifest of a vector store
+
+        Args:
+            persist_dir: Directory where the vector store is persisted
+
+        Returns:
+            IngestManifest, or None if the store has no manifest
+        """
+        path = os.path.join(persist_dir, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        files = {record["path"]: FileRecord(**record) for record in data.get("files", [])}
+        return cls(persist_dir, files, data.get("settings", {}))
+
+    def save(self) -> None:
+        """Write the manifest atomically"""
+        os.makedirs(self.persist_dir, exist_ok=True)
+        data = {
+            "version": MANIFEST_VERSION,
+            "settings": self.settings,
+            "files": [asdict(record) for _, record in sorted(self.files.items())],
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def plan(
+        self,
+        files: Dict[str, str],
+        force: bool = False,
+        attributes: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> IngestPlan:
+        """
+        Compare the manifest with the files currently in the documents directory
+
+        Size and modification time are checked first; the content hash is
+        only computed for files whose size or time changed. Files whose
+        attributes changed are processed again to update their chunks.
+
+        Args:
+            files: Mapping of relative path to absolute path of the current files
+            force: Process every file even if unchanged
+            attributes: Mapping of relative path to the file's chunk attributes
+
+        Returns:
+            IngestPlan
+        """
+        attributes = attributes or {}
+        plan = IngestPlan()
+        for rel_path, file_path in sorted(files.items()):
+            record = self.files.get(rel_path)
+            stat = os.stat(file_path)
+            if record is not None and record.attributes != attributes.get(rel_path, {}):
+                plan.hashes[rel_path] = file_sha256(file_path)
+                plan.to_process.append(rel_path)
+                continue
+            if not force and record is not None and record.size == stat.st_size and record.mtime == stat.st_mtime:
+                plan.unchanged.append(rel_path)
+                continue
+
+            sha256 = file_sha256(file_path)
+            plan.hashes[rel_path] = sha256
+            if not force and record is not None and record.sha256 == sha256:
+                # Touched but not modified: only refresh the recorded time
+                record.size, record.mtime = stat.st_size, stat.st_mtime
+                plan.unchanged.append(rel_path)
+            else:
+                plan.to_process.append(rel_path)
+
+        plan.removed = sorted(set(self.files) - set(files))
+        return plan
+
+    def record(
+        self,
+        rel_path: str,
+        file_path: str,
+        sha256: str,
+        chunk_ids: List[str],
+        attributes: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Record the chunks ingested from a file"""
+        stat = os.stat(file_path)
+        self.files[rel_path] = FileRecord(rel_path, stat.st_size, stat.st_mtime, sha256, chunk_ids, attributes or {})
+
+    def chunk_ids(self, rel_paths: List[str]) -> List[str]:
+        """Get the chunk ids recorded for some files"""
+        ids = []
+        for rel_path in rel_paths:
+            record = self.files.get(rel_path)
+            if record is not None:
+                ids.extend(record.chunk_ids)
+        return ids
+
+class IngestJournal:
+    """
+    Append-only log of the batches written by an ingestion run
+
+    The first line describes the run; every following line lists the chunk
+    ids of one written batch and the files it completed. The journal is
+    removed when the run finishes, so its presence means a run was
+    interrupted.
+    """
+
+    def __init__(self, persist_dir: str, settings: Optional[Dict] = None, incremental: bool = False):
+        self.persist_dir = persist_dir
+        self.settings: Dict = settings or {}
+        self.incremental = incremental
+        self.written_ids: Set[str] = set()
+        self.completed_files: Set[str] = set()
+        self._file = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.persist_dir, JOURNAL_FILE)
+
+    @classmethod
+    def load(cls, persist_dir: str) -> Optional["IngestJournal"]:
+        """
+        Load the journal of an interrupted run
+
+        Args:
+            persist_dir: Directory where the vector store is persisted
+
+        Returns:
+            IngestJournal, or None if no run was interrupted
+        """
+        path = os.path.join(persist_dir, JOURNAL_FILE)
+        if not os.path.exists(path):
+            return None
+        journal = None
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be cut short by the interruption
+                    break
+                if journal is None:
+                    journal = cls(persist_dir, entry.get("settings"), entry.get("incremental", False))
+                    continue
+                journal.written_ids.update(entry.get("ids", []))
+                journal.completed_files.update(entry.get("completed", []))
+        return journal
+
+    def open(self, append: bool = False) -> None:
+        """
+        Open the journal for writing
+
+        Args:
+            append: Continue the journal of an interrupted run instead of starting a new one
+        """
+        os.makedirs(self.persist_dir, exist_ok=True)
+        if append and os.path.exists(self.path):
+            self._file = open(self.path, "a", encoding="utf-8")
+        else:
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._write({"version": MANIFEST_VERSION, "settings": self.settings, "incremental": self.incremental})
+
+    def _write(self, entry: Dict) -> None:
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record_batch(self, ids: List[str], completed: List[str]) -> None:
+        """Record a batch written to the vector store and the files it completed"""
+        self._write({"ids": ids, "completed": completed})
+        self.written_ids.update(ids)
+        self.completed_files.update(completed)
+
+    def close(self) -> None:
+        """Close the journal, keeping it for a later resume"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def finish(self) -> None:
+        """Close and remove the journal once the run has completed"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def scan_documents(documents_dir: str, extensions) -> Dict[str, str]:
+    """
+    List the supported files of a documents directory
+
+    Args:
+        documents_dir: Directory containing documents
+        extensions: Supported file extensions
+
+    Returns:
+        Mapping of path relative to documents_dir to absolute path
+    """
+    files = {}
+    for root, _, names in os.walk(documents_dir):
+        for name in names:
+            file_path = os.path.join(root, name)
+            if name == DOCUMENT_METADATA_FILE and os.path.samefile(root, documents_dir):
+                continue
+            if os.path.splitext(name)[1].lower() in extensions:
+                rel_path = os.path.relpath(file_path, documents_dir).replace(os.sep, "/")
+                files[rel_path] = file_path
+    return files
+
+def settings_changed(manifest: IngestManifest, settings: Dict) -> bool:
+    """Check whether chunking settings differ from those of the last run"""
+    return bool(manifest.settings) and manifest.settings != settings
@@ -0,0 +1,162 @@
+"""
+JSON Streaming
+
+This module reads large JSON knowledge files without holding them in memory:
+the elements of a top-level array are decoded one at a time from a buffered
+file, and each record is flattened into text with an explicit stack instead
+of recursion. Peak memory is proportional to the largest record, not to the
+whole file.
+"""
+
+import json
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Number of characters read from the file at a time
+JSON_READ_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]}"
+
+_decoder = json.JSONDecoder()
+
+class _Reader:
+    """Buffered reader that keeps only the not yet decoded part of a file"""
+
+    def __init__(self, f, read_size: int = JSON_READ_SIZE):
+        self.f = f
+        self.read_size = read_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size: int) -> bool:
+        """Drop the decoded part of the buffer and read more; False at end of file"""
+        if self.eof:
+            return False
+        chunk = self.f.read(size)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        if not chunk:
+            self.eof = True
+        return bool(chunk)
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ("" at end of file)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill(self.read_size):
+                return ""
+
+    def expect(self, chars: str) -> str:
+        """Consume the next character, which must be one of `chars`"""
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def decode(self) -> Any:
+        """Decode the next JSON value, reading more of the file as needed"""
+        self.peek()
+        read_size = self.read_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill(read_size):
+                    raise
+            else:
+                # A number cut by the end of the buffer ("1." of "1.5") decodes early,
+                # so a value is only complete once a delimiter follows it
+                if (end < len(self.buffer) and self.buffer[end] in _DELIMITERS) or self.eof:
+                    self.pos = end
+                    return value
+                self.fill(read_size)
+            # Grow reads for large values so re-decoding stays linear overall
+            read_size *= 2
+
+def iter_json(f, read_size: int = JSON_READ_SIZE) -> Iterator[Tuple[bool, Any]]:
+    """
+    Decode a JSON file incrementally
+
+    If the file holds a top-level array, its elements are yielded one at a
+    time; any other value is yielded whole.
+
+    Args:
+        f: File opened in text mode
+        read_size: Number of characters read at a time
+
+    Returns:
+        Iterator of (is_array_element, value)
+    """
+    reader = _Reader(f, read_size)
+    if reader.peek() != "[":
+        yield False, reader.decode()
+        if reader.peek():
+            raise json.JSONDecodeError("Extra data", reader.buffer, reader.pos)
+        return
+
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+    else:
+        while True:
+            yield True, reader.decode()
+            if reader.expect(",]") == "]":
+                break
+
+    if reader.peek():
+        raise json.JSONDecodeError("Extra data", reader.buffer, reader.pos)
+
+def _fields(item: Dict[str, Any]) -> Iterator[Tuple[str, Any]]:
+    """Labelled values of a record, with list elements expanded"""
+    for key, value in item.items():
+        if isinstance(value, list):
+            for i, list_item in enumerate(value):
+                if isinstance(list_item, (str, dict)):
+                    yield f"{key}[{i}]", list_item
+        else:
+            yield key, value
+
+def flatten_json(item: Dict[str, Any]) -> str:
+    """
+    Flatten a JSON record into "key: value" lines
+
+    Nested objects are rendered inline after their key ("a: b: value") and
+    list elements get their index ("a[0]: value"). Only strings, numbers,
+    booleans and nested objects produce text.
+
+    Args:
+        item: The record
+
+    Returns:
+        The record's text (empty if it has no text values)
+    """
+    lines: List[str] = []
+    # Prefixes of the nested objects entered since the last line was written;
+    # they are prepended to the next line
+    pending: List[str] = []
+    stack = [(_fields(item), 0)]
+
+    while stack:
+        fields, depth = stack[-1]
+        field = next(fields, None)
+        if field is None:
+            stack.pop()
+            # An object without text values leaves no trace in the output
+            if stack and len(pending) == depth:
+                pending.pop()
+            continue
+
+        label, value = field
+        if isinstance(value, dict):
+            pending.append(f"{label}: ")
+            stack.append((_fields(value), len(pending)))
+        elif isinstance(value, (str, int, float, bool)):
+            lines.append("".join(pending) + f"{label}: {value}")
+            pending.clear()
+
+    return "\n".join(lines)
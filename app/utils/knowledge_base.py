@@ -0,0 +1,311 @@
+"""
+Knowledge Base
+
+This module manages the knowledge the assistant answers from as versioned,
+immutable snapshots. A snapshot holds the system prompt built from the
+knowledge files and identifies the state of the retrieval index. The first
+snapshot is built on first use; afterwards a background watcher polls the
+knowledge files and the index for changes (by size and modification time),
+builds the next snapshot off the request path and swaps it in with a single
+reference assignment. Requests already running keep the snapshot they
+started with, so nothing is dropped while the knowledge is reloaded.
+
+Snapshots are always built in worker threads. The request path uses
+`get_snapshot()`, which awaits the first snapshot (sharing one build between
+all the requests waiting for it) instead of blocking the event loop.
+
+In retrieval mode the watcher can also ingest changed documents
+(incrementally) before reopening the index, so publishing new policy text
+only requires copying the files into the documents directory.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import Dict, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+from app.utils.ingest_manifest import MANIFEST_FILE
+from app.utils.prompts import (
+    KNOWLEDGE_JSON_DIR,
+    SystemMessage,
+    build_system_prompt,
+    knowledge_fingerprint,
+    load_sample_knowledge,
+)
+from app.utils.retrieval import CHROMA_DB_DIR, retrieval_enabled, vector_search_enabled
+
+# Load environment variables
+load_dotenv()
+
+# Watch the knowledge files in the background, checking every interval (seconds)
+KNOWLEDGE_WATCH_ENABLED = os.getenv("KNOWLEDGE_WATCH_ENABLED", "true").lower() == "true"
+KNOWLEDGE_WATCH_INTERVAL = float(os.getenv("KNOWLEDGE_WATCH_INTERVAL", 2))
+
+# In retrieval mode, ingest changed documents from this directory before reloading
+KNOWLEDGE_AUTO_INGEST = os.getenv("KNOWLEDGE_AUTO_INGEST", "false").lower() == "true"
+KNOWLEDGE_DOCUMENTS_DIR = os.getenv("KNOWLEDGE_DOCUMENTS_DIR", KNOWLEDGE_JSON_DIR)
+
+def directory_fingerprint(directory: str) -> Tuple:
+    """
+    Fingerprint the files of a directory tree by path, size and modification time
+
+    Args:
+        directory: Directory to fingerprint
+
+    Returns:
+        Hashable tuple that changes whenever a file is added, removed or changed
+    """
+    entries = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((os.path.relpath(path, directory), stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(entries))
+
+def index_fingerprint(persist_directory: str) -> Optional[int]:
+    """Identify the state of the retrieval index by its ingest manifest, rewritten by every ingestion"""
+    try:
+        return os.stat(os.path.join(persist_directory, MANIFEST_FILE)).st_mtime_ns
+    except OSError:
+        return None
+
+class KnowledgeFingerprint(NamedTuple):
+    """What a snapshot was built from"""
+    # Knowledge files sampled into the system prompt
+    samples: Tuple
+    # Retrieval index (retrieval mode only)
+    index: Optional[int] = None
+    # Documents ingested into the index (automatic ingestion only)
+    documents: Optional[Tuple] = None
+
+@dataclass(frozen=True)
+class KnowledgeSnapshot:
+    """Immutable state of the knowledge base"""
+    version: int
+    fingerprint: KnowledgeFingerprint
+    # System prompt with a sample of each knowledge file
+    system_message: SystemMessage
+    built_at: float
+    build_seconds: float
+
+class KnowledgeBase:
+    """Builds knowledge snapshots and swaps them in when the knowledge changes"""
+
+    def __init__(
+        self,
+        json_dir: str = KNOWLEDGE_JSON_DIR,
+        persist_directory: str = CHROMA_DB_DIR,
+        documents_dir: str = KNOWLEDGE_DOCUMENTS_DIR,
+        auto_ingest: bool = KNOWLEDGE_AUTO_INGEST,
+        watch_interval: float = KNOWLEDGE_WATCH_INTERVAL,
+    ):
+        self.json_dir = json_dir
+        self.persist_directory = persist_directory
+        self.documents_dir = documents_dir
+        self.auto_ingest = auto_ingest and retrieval_enabled()
+        self.watch_interval = watch_interval
+        self._snapshot: Optional[KnowledgeSnapshot] = None
+        self._build_lock = threading.Lock()
+        self._last_check = 0.0
+        self._watch_task: Optional[asyncio.Task] = None
+        # Refresh running in a worker thread on behalf of requests
+        self._refresh_task: Optional[asyncio.Future] = None
+        self._failures = 0
+        # Fingerprint of the knowledge that last failed to load, not retried until it changes
+        self._failed: Optional[KnowledgeFingerprint] = None
+
+    def _fingerprint(self) -> KnowledgeFingerprint:
+        return KnowledgeFingerprint(
+            knowledge_fingerprint(self.json_dir),
+            index_fingerprint(self.persist_directory) if retrieval_enabled() else None,
+            directory_fingerprint(self.documents_dir) if self.auto_ingest else None,
+        )
+
+    def _build(self, previous: Optional[KnowledgeSnapshot]) -> KnowledgeSnapshot:
+        """Build the next snapshot (blocking)"""
+        start = time.perf_counter()
+        version = previous.version + 1 if previous else 1
+
+        # Documents may also have changed while the server was down; an
+        # incremental ingestion of unchanged documents only checks them
+        documents_changed = previous is None or previous.fingerprint.documents != directory_fingerprint(self.documents_dir)
+        if self.auto_ingest and documents_changed:
+            from app.utils.document_loader import ingest_documents
+            print(f"Ingesting changed documents from {self.documents_dir}")
+            ingest_documents(self.documents_dir, self.persist_directory, incremental=True)
+
+        # Fingerprint before reading, so a change made while building is seen by the next check
+        fingerprint = self._fingerprint()
+        if previous is not None and previous.fingerprint.samples == fingerprint.samples:
+            system_message = SystemMessage(
+                previous.system_message["content"], previous.system_message.token_count, version
+            )
+        else:
+            content = build_system_prompt(load_sample_knowledge(self.json_dir))
+            # Counted on first use, when refresh() logs the new snapshot
+            system_message = SystemMessage(content, None, version)
+
+        if previous is not None and vector_search_enabled() and previous.fingerprint.index != fingerprint.index:
+            # Reopen the index now rather than on the first request that notices the change
+            from app.utils.document_loader import get_vector_store_handle
+            get_vector_store_handle(self.persist_directory).reload()
+
+        return KnowledgeSnapshot(version, fingerprint, system_message, time.time(), time.perf_counter() - start)
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Build and swap in a new snapshot if the knowledge changed (blocking)
+
+        If building fails, the current snapshot stays in use.
+
+        Args:
+            force: Build a new snapshot even if nothing changed
+
+        Returns:
+            True if a new snapshot was swapped in
+        """
+        with self._build_lock:
+            self._last_check = time.monotonic()
+            previous = self._snapshot
+            if previous is not None and not force:
+                fingerprint = self._fingerprint()
+                if fingerprint == previous.fingerprint or fingerprint == self._failed:
+                    return False
+            try:
+                snapshot = self._build(previous)
+            except Exception as e:
+                self._failures += 1
+                if previous is None:
+                    raise
+                self._failed = self._fingerprint()
+                print(f"Error reloading the knowledge base, keeping v{previous.version}: {str(e)}")
+                return False
+            self._snapshot = snapshot
+            print(
+                f"Knowledge base v{snapshot.version} loaded in {snapshot.build_seconds:.2f}s"
+                f" (system prompt: {snapshot.system_message.token_count} tokens)"
+            )
+            return True
+
+    def current(self) -> Optional[KnowledgeSnapshot]:
+        """Get the published snapshot, without building or checking anything"""
+        return self._snapshot
+
+    def _check_due(self) -> bool:
+        # Without the background watcher, the knowledge is checked on use
+        return self._watch_task is None and time.monotonic() - self._last_check >= self.watch_interval
+
+    def snapshot(self) -> KnowledgeSnapshot:
+        """
+        Get the current snapshot, building the first one if needed (blocking,
+        for worker threads; the event loop uses get_snapshot)
+
+        Without the background watcher, the knowledge is checked for changes
+        here, at most every watch interval.
+
+        Returns:
+            KnowledgeSnapshot
+        """
+        if self._snapshot is None or self._check_due():
+            self.refresh()
+        return self._snapshot
+
+    def _refresh_in_thread(self) -> asyncio.Future:
+        """Start a refresh in a worker thread, or join the one running"""
+        task = self._refresh_task
+        if task is None or task.done():
+            task = asyncio.ensure_future(asyncio.to_thread(self.refresh))
+            # Failures are reported to the requests awaiting the first snapshot
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._refresh_task = task
+        return task
+
+    async def get_snapshot(self) -> KnowledgeSnapshot:
+        """
+        Get the current snapshot without blocking the event loop
+
+        The first snapshot is awaited while a worker thread builds it (or
+        while the watcher or the warm-up does). Without the watcher, a
+        periodic check for changes is started in the background and the
+        request goes on with the current snapshot.
+
+        Returns:
+            KnowledgeSnapshot
+
+        Raises:
+            Exception: If the first snapshot could not be built
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            # Shielded so a cancelled request does not cancel the shared build
+            await asyncio.shield(self._refresh_in_thread())
+            return self._snapshot
+        if self._check_due():
+            self._refresh_in_thread()
+        return snapshot
+
+    async def _watch(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                print(f"Error checking the knowledge base: {str(e)}")
+            await asyncio.sleep(self.watch_interval)
+
+    def start_watching(self) -> None:
+        """Build the first snapshot and watch for changes in the background"""
+        if self._watch_task is None:
+            self._watch_task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop_watching(self) -> None:
+        """Stop the background watcher"""
+        task, self._watch_task = self._watch_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, object]:
+        """Describe the current snapshot"""
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "built_at": snapshot.built_at if snapshot else None,
+            "build_seconds": round(snapshot.build_seconds, 3) if snapshot else None,
+            "watching": self._watch_task is not None,
+            "auto_ingest": self.auto_ingest,
+            "failures": self._failures,
+        }
+
+_knowledge_base: Optional[KnowledgeBase] = None
+_knowledge_base_lock = threading.Lock()
+
+def get_knowledge_base() -> KnowledgeBase:
+    """
+    Get the process-wide knowledge base
+
+    Returns:
+        KnowledgeBase shared by all requests
+    """
+    global _knowledge_base
+    with _knowledge_base_lock:
+        if _knowledge_base is None:
+            _knowledge_base = KnowledgeBase()
+        return _knowledge_base
+
+async def get_system_message() -> SystemMessage:
+    """
+    Get the system message of the current knowledge snapshot
+
+    Returns:
+        The shared SystemMessage
+    """
+    return (await get_knowledge_base().get_snapshot()).system_message
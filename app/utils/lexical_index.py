@@ -0,0 +1,279 @@
+"""
+Lexical Index
+
+This module keeps a keyword (BM25) index of the ingested chunks next to the
+vector store, so questions about exact terms ("SIEE", "Magis XXI", article
+numbers) can be answered locally, without an embedding call. Text is
+tokenized for Spanish: lowercased, accents folded, stopwords removed and
+words reduced with a light stemmer (plural and gender endings). The stemmed
+terms are stored in an SQLite FTS5 table, which maintains the inverted index
+incrementally and ranks matches with BM25. The filterable attributes of each
+chunk are kept in an indexed table, so filtered searches only rank chunks
+with matching attributes.
+
+Results are plain (text, metadata, score) tuples, so keyword searches never
+load langchain.
+"""
+
+import os
+import re
+import json
+import sqlite3
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from app.utils.metadata_filter import FILTER_FIELDS, MetadataFilter
+
+# Name of the index database inside the persist directory
+LEXICAL_INDEX_FILE = "lexical_index.db"
+
+# SQLite limits the number of parameters in a single statement
+_SQLITE_BATCH = 500
+
+_TOKEN = re.compile(r"[a-z0-9ñ]+")
+
+SPANISH_STOPWORDS = frozenset("""
+a al algo algunas algunos ante antes como con contra cual cuando de del desde donde durante e el
+ella ellas ellos en entre era eran es esa esas ese eso esos esta estaba estado estan estar este
+esto estos fue fueron ha han hasta hay la las le les lo los mas me mi mis mucho muy nada ni no nos
+nosotros o os otra otras otro otros para pero poco por porque que quien quienes se sea sean segun
+ser si sido sin sobre son su sus tambien tanto te tiene tienen todo todos tu tus un una unas uno
+unos y ya yo
+""".split())
+
+def fold_accents(text: str) -> str:
+    """Remove accents and diacritics, keeping ñ"""
+    text = text.replace("ñ", "\0")
+    folded = "".join(
+        char for char in unicodedata.normalize("NFKD", text)
+        if not unicodedata.combining(char)
+    )
+    return folded.replace("\0", "ñ")
+
+def stem(word: str) -> str:
+    """
+    Reduce a Spanish word to its stem by removing plural and gender endings
+
+    This is the light stemmer of J. Savoy (as used by Lucene's
+    SpanishLightStemmer); words shorter than five letters are kept as they
+    are, so acronyms and numbers are never changed.
+    """
+    if len(word) < 5:
+        return word
+    if word[-1] in "oae":
+        return word[:-1]
+    if word[-1] == "s":
+        if word.endswith("eses"):
+            return word[:-2]
+        if word.endswith("ces"):
+            return word[:-3] + "z"
+        if word[-2] in "oae":
+            return word[:-2]
+    return word
+
+def tokenize(text: str) -> List[str]:
+    """
+    Turn text into index terms
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        Stemmed, accent-folded terms without stopwords, in order
+    """
+    words = _TOKEN.findall(fold_accents(text.lower()))
+    return [stem(word) for word in words if word not in SPANISH_STOPWORDS]
+
+def _match_expression(terms: Sequence[str]) -> str:
+    """Build an FTS5 query matching any of the terms"""
+    return " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+
+class LexicalIndex:
+    """BM25 keyword index of chunks, stored in SQLite FTS5"""
+
+    def __init__(self, persist_directory: str):
+        self.path = os.path.join(persist_directory, LEXICAL_INDEX_FILE)
+        os.makedirs(persist_directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " rowid INTEGER PRIMARY KEY,"
+            " id TEXT UNIQUE NOT NULL,"
+            " text TEXT NOT NULL,"
+            " metadata TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(terms)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_attributes ("
+            " rowid INTEGER NOT NULL,"
+            " name TEXT NOT NULL,"
+            " value TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_chunk_attributes ON chunk_attributes (name, value, rowid)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_chunk_attributes_rowid ON chunk_attributes (rowid)")
+        self._conn.commit()
+
+    def _delete_ids(self, ids: Sequence[str]) -> None:
+        for start in range(0, len(ids), _SQLITE_BATCH):
+            batch = list(ids[start:start + _SQLITE_BATCH])
+            placeholders = ",".join("?" * len(batch))
+            for table in ("chunks_fts", "chunk_attributes"):
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM chunks WHERE id IN ({placeholders}))",
+                    batch
+                )
+            self._conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+
+    def upsert(self, ids: Sequence[str], texts: Sequence[str], metadatas: Sequence[Dict]) -> None:
+        """
+        Insert or replace chunks
+
+        Args:
+            ids: Chunk ids
+            texts: Their texts
+            metadatas: Their metadata
+        """
+        with self._lock:
+            self._delete_ids(ids)
+            for cid, text, metadata in zip(ids, texts, metadatas):
+                cursor = self._conn.execute(
+                    "INSERT INTO chunks (id, text, metadata) VALUES (?, ?, ?)",
+                    (cid, text, json.dumps(metadata, ensure_ascii=False))
+                )
+                self._conn.execute(
+                    "INSERT INTO chunks_fts (rowid, terms) VALUES (?, ?)",
+                    (cursor.lastrowid, " ".join(tokenize(text)))
+                )
+                attributes = [(name, metadata.get(name)) for name in FILTER_FIELDS + ("date_key",)]
+                self._conn.executemany(
+                    "INSERT INTO chunk_attributes (rowid, name, value) VALUES (?, ?, ?)",
+                    [(cursor.lastrowid, name, str(value)) for name, value in attributes if value is not None]
+                )
+            self._conn.commit()
+
+    def delete(self, ids: Sequence[str]) -> None:
+        """Delete chunks by id"""
+        with self._lock:
+            self._delete_ids(ids)
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Delete every chunk"""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks_fts")
+            self._conn.execute("DELETE FROM chunk_attributes")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+
+    def count(self) -> int:
+        """Number of indexed chunks"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        filters: Optional[MetadataFilter] = None
+    ) -> List[Tuple[str, Dict[str, Any], float]]:
+        """
+        Find the chunks that best match the words of a query
+
+        Args:
+            query: The query text
+            k: Number of results to return
+            filters: Only consider chunks with these attributes
+
+        Returns:
+            (chunk text, chunk metadata, BM25 score) tuples, best first
+            (higher is better)
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        conditions = []
+        params: List = [_match_expression(terms)]
+        if filters is not None:
+            for name, allowed in filters.values.items():
+                conditions.append(
+                    "chunks_fts.rowid IN (SELECT rowid FROM chunk_attributes"
+                    f" WHERE name = ? AND value IN ({','.join('?' * len(allowed))}))"
+                )
+                params.extend([name, *allowed])
+            if filters.date_from is not None or filters.date_to is not None:
+                # Dates are stored as YYYYMMDD, so they compare as integers
+                conditions.append(
+                    "chunks_fts.rowid IN (SELECT rowid FROM chunk_attributes"
+                    " WHERE name = 'date_key' AND CAST(value AS INTEGER) BETWEEN ? AND ?)"
+                )
+                params.extend([filters.date_from or 0, filters.date_to or 99991231])
+        params.append(k)
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT c.text, c.metadata, bm25(chunks_fts) AS score"
+                " FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid"
+                " WHERE chunks_fts MATCH ?"
+                + "".join(f" AND {condition}" for condition in conditions)
+                + " ORDER BY score LIMIT ?",
+                params
+            ).fetchall()
+        # FTS5 reports BM25 as a negative number (lower is better)
+        return [(text, json.loads(metadata), -score) for text, metadata, score in rows]
+
+    def close(self) -> None:
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+_indexes: Dict[str, LexicalIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_lexical_index(persist_directory: str) -> Optional[LexicalIndex]:
+    """
+    Get the process-wide lexical index of a vector store directory
+
+    Args:
+        persist_directory: Directory where the vector store is persisted
+
+    Returns:
+        LexicalIndex, or None if no index was built there
+    """
+    persist_directory = os.path.abspath(persist_directory)
+    with _indexes_lock:
+        if persist_directory not in _indexes:
+            if not os.path.exists(os.path.join(persist_directory, LEXICAL_INDEX_FILE)):
+                return None
+            _indexes[persist_directory] = LexicalIndex(persist_directory)
+        return _indexes[persist_directory]
+
+def lexical_search(
+    query: str,
+    persist_directory: str,
+    num_results: int = 5,
+    filters: Optional[MetadataFilter] = None
+) -> List[Tuple[str, Dict[str, Any], float]]:
+    """
+    Search the lexical index of a vector store directory
+
+    Args:
+        query: The query string
+        persist_directory: Directory where the vector store is persisted
+        num_results: Number of results to return
+        filters: Only consider chunks with these attributes
+
+    Returns:
+        (chunk text, chunk metadata, BM25 score) tuples, best first (empty
+        if there is no index)
+    """
+    index = get_lexical_index(persist_directory)
+    if index is None:
+        return []
+    try:
+        return index.search(query, num_results, filters)
+    except Exception as e:
+        print(f"Error querying lexical index: {str(e)}")
+        return []
@@ -0,0 +1,723 @@
+"""
+Local Vector Index
+
+This module implements a lightweight, in-process alternative to Chroma. The
+embeddings are kept as a contiguous float32 matrix on disk with L2-normalized
+rows, memory-mapped on load, so opening the index takes milliseconds and
+only the pages touched by a query are read. Queries are answered with
+blocked matrix products and `argpartition` top-k; above a size threshold an
+HNSW graph (optional `hnswlib` package) is built to avoid the full scan.
+
+Files in the index directory:
+    vectors.f32      N x D float32 matrix, appended on write
+    offsets.i64      offset of each row's record in documents.jsonl
+    documents.jsonl  one JSON record (id, text, metadata) per row
+    index.json       committed row count, dimension and deleted rows
+    hnsw.bin         optional HNSW graph over the live rows
+    facets.npz       rows of each filterable attribute value, and row dates
+
+Rows are only ever appended; replacing or deleting a chunk marks its old row
+as deleted. Writes become visible when index.json is replaced, so a reader
+(or a crashed writer) never sees a partial batch. The files are compacted
+when deleted rows outnumber live ones: the live rows are written to data
+files with a new name (e.g. vectors.<generation>.f32), which index.json
+then points to, so readers switch from the old files to the new ones in a
+single step.
+
+Queries read a snapshot of the committed rows (the maps of the data files
+and the deleted rows). A commit publishes a new snapshot rather than
+changing the current one, so a query never mixes rows of two commits, and
+the maps of a replaced snapshot are closed once no query uses them.
+
+Metadata filters are answered from the facet index (built when the index is
+optimized, or on the first filtered query), which narrows the candidate rows
+before any similarity is computed.
+"""
+
+import os
+import re
+import json
+import mmap
+import uuid
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from langchain.docstore.document import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from app.utils.metadata_filter import FILTER_FIELDS, MetadataFilter
+
+# Load environment variables
+load_dotenv()
+
+# Name of the index directory inside the persist directory
+LOCAL_INDEX_DIR = "local_index"
+
+# Build an HNSW graph (if hnswlib is installed) for indexes with at least this many rows
+LOCAL_INDEX_HNSW_THRESHOLD = int(os.getenv("LOCAL_INDEX_HNSW_THRESHOLD", 50000))
+
+# Number of rows scored at a time by a brute-force search
+LOCAL_INDEX_BLOCK_ROWS = int(os.getenv("LOCAL_INDEX_BLOCK_ROWS", 65536))
+
+# Version of the index format
+LOCAL_INDEX_VERSION = 1
+
+def local_index_exists(persist_directory: str) -> bool:
+    """Check whether a persist directory holds a local index"""
+    return os.path.exists(os.path.join(persist_directory, LOCAL_INDEX_DIR, "index.json"))
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so inner products are cosine similarities"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class _Facets:
+    """Rows holding each value of the filterable attributes"""
+
+    def __init__(self, count: int, values: Dict[str, Dict[str, np.ndarray]], date_keys: np.ndarray, generation: str = ""):
+        self.count = count
+        # Commit of the index the facets were built for
+        self.generation = generation
+        self.values = values
+        self.date_keys = date_keys
+
+    @classmethod
+    def build(cls, count: int, metadatas: Iterable[Dict[str, Any]], generation: str = "") -> "_Facets":
+        rows: Dict[str, Dict[str, List[int]]] = {name: {} for name in FILTER_FIELDS}
+        date_keys = np.zeros(count, dtype=np.int32)
+        for row, metadata in enumerate(metadatas):
+            for name in FILTER_FIELDS:
+                value = metadata.get(name)
+                if value is not None:
+                    rows[name].setdefault(str(value), []).append(row)
+            date_keys[row] = metadata.get("date_key", 0)
+        values = {
+            name: {value: np.asarray(value_rows, dtype=np.int64) for value, value_rows in by_value.items()}
+            for name, by_value in rows.items()
+        }
+        return cls(count, values, date_keys, generation)
+
+    def save(self, path: str) -> None:
+        arrays = {"date_keys": self.date_keys, "count": np.asarray([self.count]), "generation": np.asarray([self.generation])}
+        for name, by_value in self.values.items():
+            for value, value_rows in by_value.items():
+                arrays[f"{name}/{value}"] = value_rows
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "_Facets":
+        with np.load(path) as data:
+            values: Dict[str, Dict[str, np.ndarray]] = {name: {} for name in FILTER_FIELDS}
+            for key in data.files:
+                if "/" in key:
+                    name, value = key.split("/", 1)
+                    values.setdefault(name, {})[value] = data[key]
+            return cls(int(data["count"][0]), values, data["date_keys"], str(data["generation"][0]))
+
+    def mask(self, filters: MetadataFilter, live_mask: np.ndarray) -> np.ndarray:
+        """Rows that are live and satisfy the filter"""
+        mask = live_mask.copy()
+        for name, allowed in filters.values.items():
+            field_mask = np.zeros(self.count, dtype=bool)
+            for value in allowed:
+                value_rows = self.values.get(name, {}).get(value)
+                if value_rows is not None:
+                    field_mask[value_rows] = True
+            mask &= field_mask
+        if filters.date_from is not None or filters.date_to is not None:
+            mask &= self.date_keys > 0
+            if filters.date_from is not None:
+                mask &= self.date_keys >= filters.date_from
+            if filters.date_to is not None:
+                mask &= self.date_keys <= filters.date_to
+        return mask
+
+def _top_k(scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Keep the k best scores of each query (unordered)"""
+    if scores.shape[1] <= k:
+        return scores, rows
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(scores, best, axis=1), np.take_along_axis(rows, best, axis=1)
+
+def _data_file(name: str, data: str) -> str:
+    """Name of a data file of a compaction generation ("" for the original files)"""
+    if not data:
+        return name
+    base, extension = name.split(".", 1)
+    return f"{base}.{data}.{extension}"
+
+DATA_FILES = ("vectors.f32", "offsets.i64", "documents.jsonl")
+
+# Data files of any generation, e.g. vectors.f32 or vectors.1a2b3c4d5e6f.f32
+DATA_FILE_PATTERN = re.compile(r"^(vectors|offsets|documents)(\.[0-9a-f]+)?\.(f32|i64|jsonl)$")
+
+class _Snapshot:
+    """Committed rows as seen by queries; never modified once published"""
+
+    def __init__(
+        self,
+        count: int = 0,
+        vectors: Optional[np.ndarray] = None,
+        offsets: Optional[np.ndarray] = None,
+        documents: Optional[mmap.mmap] = None,
+        live_mask: Optional[np.ndarray] = None,
+        hnsw=None,
+        generation: str = ""
+    ):
+        self.count = count
+        self.vectors = vectors
+        self.offsets = offsets
+        self.documents = documents
+        self.live_mask = live_mask
+        self.hnsw = hnsw
+        # Commit the snapshot was read from
+        self.generation = generation
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """Read the stored record of a row"""
+        start = int(self.offsets[row])
+        end = self.documents.find(b"\n", start)
+        return json.loads(self.documents[start:end])
+
+    def document(self, row: int) -> Document:
+        record = self.record(row)
+        return Document(page_content=record["text"], metadata=record["metadata"])
+
+class LocalVectorStore(VectorStore):
+    """Memory-mapped vector index with brute-force or HNSW search"""
+
+    def __init__(self, persist_directory: str, embedding_function: Optional[Embeddings] = None):
+        self.persist_directory = persist_directory
+        self.directory = os.path.join(persist_directory, LOCAL_INDEX_DIR)
+        self._embedding_function = embedding_function
+        self._lock = threading.RLock()
+
+        self.dim: Optional[int] = None
+        self.count = 0
+        self._documents_size = 0
+        self._dead: set = set()
+        self._hnsw_state: Optional[Dict] = None
+        self._generation = ""
+        # Name of the current data files ("" until the first compaction)
+        self._data = ""
+
+        self._snapshot = _Snapshot()
+        self._facets: Optional[_Facets] = None
+        # Map of chunk id to row, only built when writing
+        self._rows: Optional[Dict[str, int]] = None
+
+        self._load()
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding_function
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _data_path(self, name: str) -> str:
+        return self._path(_data_file(name, self._data))
+
+    # ---------------------------------------------------------------- reading
+
+    def _read_state(self) -> Optional[Dict[str, Any]]:
+        index_path = self._path("index.json")
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _load(self) -> None:
+        """Read the committed state and publish a snapshot of it"""
+        state = self._read_state()
+        while True:
+            try:
+                snapshot = self._open_snapshot(state)
+                break
+            except FileNotFoundError:
+                # A compaction replaced the data files after index.json was read
+                latest = self._read_state()
+                if latest == state:
+                    raise
+                state = latest
+
+        if state is not None:
+            self.dim = state["dim"]
+            self.count = state["count"]
+            self._documents_size = state["documents_size"]
+            self._dead = set(state.get("dead", []))
+            self._hnsw_state = state.get("hnsw")
+            self._generation = state.get("generation", "")
+            self._data = state.get("data", "")
+        self._snapshot = snapshot
+
+        facets_path = self._path("facets.npz")
+        if os.path.exists(facets_path) and (self._facets is None or self._facets.generation != self._generation):
+            facets = _Facets.load(facets_path)
+            if facets.generation == self._generation:
+                self._facets = facets
+
+    def _open_snapshot(self, state: Optional[Dict[str, Any]]) -> _Snapshot:
+        """Map the data files of a committed state"""
+        if state is None or not state["count"]:
+            return _Snapshot(generation="" if state is None else state.get("generation", ""))
+        count, dim, data = state["count"], state["dim"], state.get("data", "")
+        vectors = np.memmap(self._path(_data_file("vectors.f32", data)), dtype=np.float32, mode="r", shape=(count, dim))
+        offsets = np.memmap(self._path(_data_file("offsets.i64", data)), dtype=np.int64, mode="r", shape=(count,))
+        # The map keeps its own handle on the file
+        with open(self._path(_data_file("documents.jsonl", data)), "rb") as f:
+            documents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        dead = state.get("dead", [])
+        live_mask = np.ones(count, dtype=bool)
+        if dead:
+            live_mask[dead] = False
+        hnsw = self._load_hnsw(state.get("hnsw"), count, len(dead), dim)
+        return _Snapshot(count, vectors, offsets, documents, live_mask, hnsw, state.get("generation", ""))
+
+    def _load_hnsw(self, state: Optional[Dict], count: int, dead: int, dim: int):
+        """Load the HNSW graph if it is up to date with the committed rows"""
+        if not state or state.get("count") != count or state.get("dead") != dead:
+            return None
+        try:
+            import hnswlib
+        except ImportError:
+            return None
+        index = hnswlib.Index(space="ip", dim=dim)
+        index.load_index(self._path("hnsw.bin"), max_elements=state["elements"])
+        return index
+
+    def _record(self, row: int) -> Dict[str, Any]:
+        """Read the stored record of a row of the current snapshot"""
+        return self._snapshot.record(row)
+
+    @property
+    def live_count(self) -> int:
+        return self.count - len(self._dead)
+
+    def _get_facets(self, snapshot: Optional[_Snapshot] = None) -> _Facets:
+        """Get the facet index of a snapshot, building it from the stored records if needed"""
+        snapshot = snapshot or self._snapshot
+        facets = self._facets
+        if facets is not None and facets.generation == snapshot.generation:
+            return facets
+        with self._lock:
+            if self._facets is not None and self._facets.generation == snapshot.generation:
+                return self._facets
+            metadatas = (snapshot.record(row)["metadata"] for row in range(snapshot.count))
+            facets = _Facets.build(snapshot.count, metadatas, snapshot.generation)
+            if snapshot is self._snapshot:
+                self._facets = facets
+            return facets
+
+    def filter_mask(self, filters: MetadataFilter, snapshot: Optional[_Snapshot] = None) -> np.ndarray:
+        """
+        Get the live rows whose metadata satisfies a filter
+
+        Args:
+            filters: The filter
+            snapshot: Snapshot to filter (the current one if None)
+
+        Returns:
+            Boolean mask over the rows
+        """
+        snapshot = snapshot or self._snapshot
+        if not snapshot.count:
+            return np.zeros(0, dtype=bool)
+        return self._get_facets(snapshot).mask(filters, snapshot.live_mask)
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        mask: Optional[np.ndarray] = None,
+        snapshot: Optional[_Snapshot] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Find the rows most similar to several query vectors
+
+        Args:
+            queries: Q x D matrix of query embeddings
+            k: Number of results per query
+            mask: Only consider these rows (e.g. from `filter_mask`)
+            snapshot: Snapshot to search (the current one if None); rows
+                are numbered within it
+
+        Returns:
+            For each query, (row, cosine similarity) pairs, best first
+        """
+        # Queries don't take the lock: they read the snapshot current when they start
+        snapshot = snapshot or self._snapshot
+        vectors, live_mask, hnsw = snapshot.vectors, snapshot.live_mask, snapshot.hnsw
+        count = snapshot.count
+        candidates = None if mask is None else np.flatnonzero(mask)
+        if candidates is not None:
+            k = min(k, len(candidates))
+        else:
+            k = min(k, count if live_mask is None else int(live_mask.sum()))
+        if k <= 0:
+            return [[] for _ in range(len(queries))]
+        queries = _normalize(np.asarray(queries, dtype=np.float32).reshape(len(queries), vectors.shape[1]))
+
+        # Small candidate sets are cheaper to score directly than to search in the graph
+        if hnsw is not None and (candidates is None or len(candidates) >= LOCAL_INDEX_BLOCK_ROWS):
+            hnsw.set_ef(max(64, 2 * k))
+            if candidates is None:
+                labels, distances = hnsw.knn_query(queries, k=k)
+            else:
+                labels, distances = hnsw.knn_query(queries, k=k, filter=lambda label: bool(mask[label]))
+            # hnswlib's inner product distance is 1 - similarity
+            return [
+                [(int(row), float(1.0 - distance)) for row, distance in zip(row_labels, row_distances)]
+                for row_labels, row_distances in zip(labels, distances)
+            ]
+
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        total = count if candidates is None else len(candidates)
+        for start in range(0, total, LOCAL_INDEX_BLOCK_ROWS):
+            end = min(start + LOCAL_INDEX_BLOCK_ROWS, total)
+            if candidates is None:
+                block_rows = np.arange(start, end)
+                scores = queries @ vectors[start:end].T
+                scores[:, ~live_mask[start:end]] = -np.inf
+            else:
+                # Only the candidate rows are read and scored
+                block_rows = candidates[start:end]
+                scores = queries @ vectors[block_rows].T
+            rows = np.broadcast_to(block_rows, scores.shape)
+            best_scores, best_rows = _top_k(
+                np.concatenate([best_scores, scores], axis=1),
+                np.concatenate([best_rows, rows], axis=1),
+                k
+            )
+
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            results.append([(int(rows[i]), float(scores[i])) for i in order if np.isfinite(scores[i])])
+        return results
+
+    def similarity_search_by_vector_with_score(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[MetadataFilter] = None
+    ) -> List[Tuple[Document, float]]:
+        # The rows, the filter and the records all come from the same snapshot
+        snapshot = self._snapshot
+        mask = self.filter_mask(filter, snapshot) if filter is not None else None
+        hits = self.search(np.asarray([embedding], dtype=np.float32), k, mask, snapshot)[0]
+        return [(snapshot.document(row), score) for row, score in hits]
+
+    def similarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[MetadataFilter] = None,
+        **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[MetadataFilter] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        if filter is not None and not self.filter_mask(filter).any():
+            # Nothing can match: skip the embedding call
+            return []
+        return self.similarity_search_by_vector_with_score(self._embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[MetadataFilter] = None,
+        **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities in [-1, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None) -> Dict[str, List]:
+        """
+        Get stored chunks, in the format of Chroma's `get`
+
+        Args:
+            ids: Chunk ids to get (all live chunks if None)
+            include: Fields to include besides ids ("documents", "metadatas")
+
+        Returns:
+            Dict with "ids" and the requested fields
+        """
+        include = ["documents", "metadatas"] if include is None else include
+        with self._lock:
+            rows = self._id_rows()
+            if ids is None:
+                selected = sorted(rows.items(), key=lambda item: item[1])
+            else:
+                selected = [(cid, rows[cid]) for cid in ids if cid in rows]
+            result: Dict[str, List] = {"ids": [cid for cid, _ in selected]}
+            records = [self._record(row) for _, row in selected] if include else []
+            if "documents" in include:
+                result["documents"] = [record["text"] for record in records]
+            if "metadatas" in include:
+                result["metadatas"] = [record["metadata"] for record in records]
+            return result
+
+    # ---------------------------------------------------------------- writing
+
+    def _id_rows(self) -> Dict[str, int]:
+        """Map chunk ids to their live rows (scans the records once)"""
+        if self._rows is None:
+            rows = {}
+            for row in range(self.count):
+                if row not in self._dead:
+                    rows[self._record(row)["id"]] = row
+            self._rows = rows
+        return self._rows
+
+    def _truncate_uncommitted(self) -> None:
+        """Drop data appended by a write that was never committed"""
+        sizes = {
+            "vectors.f32": self.count * (self.dim or 0) * 4,
+            "offsets.i64": self.count * 8,
+            "documents.jsonl": self._documents_size,
+        }
+        for name, size in sizes.items():
+            path = self._data_path(name)
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def _commit(self) -> None:
+        """Atomically publish the current state and remap the files"""
+        state = {
+            "version": LOCAL_INDEX_VERSION,
+            "dim": self.dim,
+            "count": self.count,
+            "documents_size": self._documents_size,
+            "dead": sorted(self._dead),
+            "hnsw": self._hnsw_state,
+            "generation": uuid.uuid4().hex,
+            "data": self._data,
+        }
+        tmp_path = self._path("index.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._path("index.json"))
+        self._load()
+
+    def upsert_embeddings(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: Optional[List[Dict]] = None
+    ) -> None:
+        """
+        Insert or replace chunks whose embeddings are already computed
+
+        Args:
+            ids: Chunk ids
+            embeddings: Their embeddings
+            documents: Their texts
+            metadatas: Their metadata
+        """
+        if not ids:
+            return
+        metadatas = metadatas or [{} for _ in ids]
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected embeddings of dimension {self.dim}, got {vectors.shape[1]}")
+
+            rows = self._id_rows()
+            self._truncate_uncommitted()
+
+            # Re-ingesting an unchanged chunk leaves its row as it is
+            changed = []
+            for i, (cid, text, metadata) in enumerate(zip(ids, documents, metadatas)):
+                row = rows.get(cid)
+                if row is not None:
+                    record = self._record(row)
+                    if (
+                        record["text"] == text
+                        and record["metadata"] == metadata
+                        and np.allclose(self._snapshot.vectors[row], vectors[i], atol=1e-6)
+                    ):
+                        continue
+                changed.append(i)
+            if not changed:
+                return
+            ids = [ids[i] for i in changed]
+            documents = [documents[i] for i in changed]
+            metadatas = [metadatas[i] for i in changed]
+            vectors = vectors[changed]
+
+            offsets = []
+            with open(self._data_path("documents.jsonl"), "ab") as f:
+                for cid, text, metadata in zip(ids, documents, metadatas):
+                    offsets.append(self._documents_size)
+                    line = json.dumps({"id": cid, "text": text, "metadata": metadata}, ensure_ascii=False).encode("utf-8") + b"\n"
+                    f.write(line)
+                    self._documents_size += len(line)
+            with open(self._data_path("vectors.f32"), "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._data_path("offsets.i64"), "ab") as f:
+                f.write(np.asarray(offsets, dtype=np.int64).tobytes())
+
+            for i, cid in enumerate(ids):
+                old = rows.get(cid)
+                if old is not None:
+                    self._dead.add(old)
+                rows[cid] = self.count + i
+            self.count += len(ids)
+            self._commit()
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        """Embed texts and add them to the index"""
+        texts = list(texts)
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        embeddings = self._embedding_function.embed_documents(texts)
+        self.upsert_embeddings(ids, embeddings, texts, metadatas)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete chunks by id"""
+        if not ids:
+            return False
+        with self._lock:
+            rows = self._id_rows()
+            deleted = False
+            for cid in ids:
+                row = rows.pop(cid, None)
+                if row is not None:
+                    self._dead.add(row)
+                    deleted = True
+            if deleted:
+                self._truncate_uncommitted()
+                self._commit()
+            return deleted
+
+    def optimize(self, hnsw_threshold: int = LOCAL_INDEX_HNSW_THRESHOLD) -> None:
+        """
+        Compact deleted rows away, (re)build the HNSW graph if the index is
+        large enough and save the facet index, e.g. at the end of an
+        ingestion run
+        """
+        with self._lock:
+            if self._dead and len(self._dead) >= self.live_count:
+                self._compact()
+            if self.live_count >= hnsw_threshold:
+                self._build_hnsw()
+            elif self._hnsw_state is not None:
+                self._hnsw_state = None
+                self._commit()
+            if self.count:
+                self._get_facets().save(self._path("facets.npz"))
+
+    def _compact(self) -> None:
+        """Rewrite the live rows to new data files and switch to them"""
+        snapshot = self._snapshot
+        live = [row for row in range(self.count) if row not in self._dead]
+        data = uuid.uuid4().hex[:12]
+        paths = {name: self._path(_data_file(name, data)) for name in DATA_FILES}
+        size = 0
+        with open(paths["vectors.f32"], "wb") as vf, open(paths["offsets.i64"], "wb") as of, open(paths["documents.jsonl"], "wb") as df:
+            for start in range(0, len(live), LOCAL_INDEX_BLOCK_ROWS):
+                block = live[start:start + LOCAL_INDEX_BLOCK_ROWS]
+                vf.write(np.asarray(snapshot.vectors[block]).tobytes())
+                offsets = []
+                for row in block:
+                    begin = int(snapshot.offsets[row])
+                    line = snapshot.documents[begin:snapshot.documents.find(b"\n", begin) + 1]
+                    offsets.append(size)
+                    df.write(line)
+                    size += len(line)
+                of.write(np.asarray(offsets, dtype=np.int64).tobytes())
+
+        # Readers switch to the new files when index.json is replaced
+        self._data = data
+        self.count = len(live)
+        self._documents_size = size
+        self._dead = set()
+        self._hnsw_state = None
+        self._rows = None
+        self._commit()
+        self._remove_stale_data_files()
+        print(f"Compacted local index to {self.count} rows")
+
+    def _remove_stale_data_files(self) -> None:
+        """
+        Remove the data files of earlier compactions (and of interrupted
+        ones). Queries still reading them keep their maps; on platforms that
+        refuse to remove mapped files they are removed by a later compaction.
+        """
+        current = {_data_file(name, self._data) for name in DATA_FILES}
+        for entry in os.listdir(self.directory):
+            if DATA_FILE_PATTERN.match(entry) and entry not in current:
+                try:
+                    os.remove(self._path(entry))
+                except OSError:
+                    pass
+
+    def _build_hnsw(self) -> None:
+        try:
+            import hnswlib
+        except ImportError:
+            print("hnswlib is not installed, the local index will use brute-force search")
+            return
+
+        snapshot = self._snapshot
+        live = np.flatnonzero(snapshot.live_mask)
+        index = hnswlib.Index(space="ip", dim=self.dim)
+        index.init_index(max_elements=len(live), ef_construction=200, M=16)
+        for start in range(0, len(live), LOCAL_INDEX_BLOCK_ROWS):
+            labels = live[start:start + LOCAL_INDEX_BLOCK_ROWS]
+            index.add_items(np.asarray(snapshot.vectors[labels]), labels)
+        index.save_index(self._path("hnsw.bin"))
+        self._hnsw_state = {"count": self.count, "dead": len(self._dead), "elements": len(live)}
+        self._commit()
+        print(f"Built HNSW graph over {len(live)} rows")
+
+    def close(self) -> None:
+        """Release the index files (queries still running keep their snapshot)"""
+        with self._lock:
+            self._snapshot = _Snapshot(generation=self._generation)
+            self._facets = None
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        persist_directory: Optional[str] = None,
+        **kwargs: Any
+    ) -> "LocalVectorStore":
+        """Create an index from texts"""
+        if persist_directory is None:
+            raise ValueError("The local index needs a persist directory")
+        store = cls(persist_directory, embedding)
+        store.add_texts(texts, metadatas, ids)
+        store.optimize()
+        return store
@@ -0,0 +1,154 @@
+"""
+Metadata Filters
+
+This module describes the document attributes retrieval can be filtered by
+and the filters themselves. Every chunk carries the `file_name` of its
+source; the `pillar`, `document_type` and `date` of a file come from an
+optional `_metadata.json` file in the documents directory, e.g.
+
+    {
+        "Afectividad.json": {"pillar": "formacion", "document_type": "programa", "date": "2021-02-01"}
+    }
+
+When a file has no entry, its pillar is the sub-directory it is in (if any)
+and its document type is its extension.
+"""
+
+import os
+import json
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, Optional, Tuple
+
+# Name of the file describing document attributes, inside the documents directory
+DOCUMENT_METADATA_FILE = "_metadata.json"
+
+# Attributes that can be filtered by exact value
+FILTER_FIELDS = ("file_name", "pillar", "document_type")
+
+def date_key(value: str) -> int:
+    """
+    Turn an ISO date into a sortable integer (YYYYMMDD)
+
+    Args:
+        value: Date as "YYYY-MM-DD"
+
+    Returns:
+        Integer such as 20210201
+
+    Raises:
+        ValueError: If the date is not valid
+    """
+    parsed = date.fromisoformat(value)
+    return parsed.year * 10000 + parsed.month * 100 + parsed.day
+
+def load_document_attributes(documents_dir: str, files: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Get the filterable attributes of the files of a documents directory
+
+    Args:
+        documents_dir: Directory containing documents
+        files: Mapping of relative path to absolute path of the files
+
+    Returns:
+        Mapping of relative path to chunk metadata attributes
+    """
+    described = {}
+    metadata_path = os.path.join(documents_dir, DOCUMENT_METADATA_FILE)
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            described = json.load(f)
+
+    attributes = {}
+    for rel_path in files:
+        entry = described.get(rel_path) or described.get(os.path.basename(rel_path)) or {}
+        folder = rel_path.split("/")[0] if "/" in rel_path else None
+        extension = os.path.splitext(rel_path)[1].lstrip(".").lower()
+
+        values = {
+            "pillar": entry.get("pillar") or folder,
+            "document_type": entry.get("document_type") or extension,
+        }
+        if entry.get("date"):
+            try:
+                values["date_key"] = date_key(entry["date"])
+                values["date"] = entry["date"]
+            except ValueError:
+                print(f"Ignoring invalid date {entry['date']!r} of {rel_path} in {DOCUMENT_METADATA_FILE}")
+        # Vector stores reject None metadata values
+        attributes[rel_path] = {key: value for key, value in values.items() if value is not None}
+    return attributes
+
+def _as_tuple(value) -> Tuple[str, ...]:
+    if value is None:
+        return ()
+    if isinstance(value, str):
+        return (value,)
+    return tuple(value)
+
+@dataclass(frozen=True)
+class MetadataFilter:
+    """
+    Restriction of retrieval to chunks with given attributes
+
+    A chunk matches when, for every field given, its value is one of the
+    allowed values, and its date is within the range (if one is given).
+    """
+    values: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+    date_from: Optional[int] = None
+    date_to: Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, filters: Optional[Dict[str, Any]]) -> Optional["MetadataFilter"]:
+        """
+        Build a filter from request parameters
+
+        Args:
+            filters: Mapping with any of FILTER_FIELDS (a value or a list of
+                values) and "date_from" / "date_to" (ISO dates)
+
+        Returns:
+            MetadataFilter, or None if nothing is filtered
+
+        Raises:
+            ValueError: If a field is unknown or a date is invalid
+        """
+        if not filters:
+            return None
+        unknown = set(filters) - set(FILTER_FIELDS) - {"date_from", "date_to"}
+        if unknown:
+            raise ValueError(f"Unknown filter fields: {', '.join(sorted(unknown))}")
+
+        values = {name: _as_tuple(filters.get(name)) for name in FILTER_FIELDS if filters.get(name)}
+        date_from = date_key(filters["date_from"]) if filters.get("date_from") else None
+        date_to = date_key(filters["date_to"]) if filters.get("date_to") else None
+        result = cls(values, date_from, date_to)
+        return None if result.is_empty else result
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.values and self.date_from is None and self.date_to is None
+
+    def matches(self, metadata: Dict[str, Any]) -> bool:
+        """Check whether a chunk's metadata satisfies the filter"""
+        for name, allowed in self.values.items():
+            if metadata.get(name) not in allowed:
+                return False
+        if self.date_from is not None or self.date_to is not None:
+            key = metadata.get("date_key")
+            if key is None:
+                return False
+            if self.date_from is not None and key < self.date_from:
+                return False
+            if self.date_to is not None and key > self.date_to:
+                return False
+        return True
+
+    def chroma_where(self) -> Dict[str, Any]:
+        """Express the filter as a Chroma `where` clause"""
+        conditions = [{name: {"$in": list(allowed)}} for name, allowed in self.values.items()]
+        if self.date_from is not None:
+            conditions.append({"date_key": {"$gte": self.date_from}})
+        if self.date_to is not None:
+            conditions.append({"date_key": {"$lte": self.date_to}})
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
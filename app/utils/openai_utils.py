@@ -1,9 +1,28 @@
 import os
 import sys
+import asyncio
 import json
 import traceback
-import requests
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Tuple
 from dotenv import load_dotenv
+from app.utils.http_client import get_http_client, get_request_slot
+from app.utils.prompts import get_retrieval_system_message
+from app.utils.knowledge_base import get_knowledge_base, get_system_message
+from app.utils.conversation_store import create_conversation_store
+from app.utils.context_window import (
+    CONTEXT_SUMMARY_ENABLED,
+    CONTEXT_TOKEN_BUDGET,
+    build_summary_request,
+    count_message_tokens,
+    fit_to_budget,
+    make_message,
+    make_summary_message,
+)
+from app.utils.metadata_filter import MetadataFilter
+from app.utils.response_cache import CacheQuery, get_response_cache
+from app.utils.retrieval import retrieval_enabled, retrieve_context
+from app.utils.single_flight import SharedStreams, SingleFlight, request_key
 
 # Load environment variables
 load_dotenv()
@@ -15,187 +34,343 @@ if not api_key:
 else:
     print(f"API key loaded: {api_key[:5]}...{api_key[-5:]}")
 
-# Dictionary to store conversation history by conversation ID
-conversation_history = {}
+# Store with the conversation history by conversation ID
+conversation_store = create_conversation_store()
 
-# Load sample knowledge from JSON files
-def load_sample_knowledge():
+# Identical requests in flight share one upstream call
+_completions = SingleFlight()
+_streams = SharedStreams()
+
+# Conversations with a summary in progress, and the background tasks running them
+_summarizing = set()
+_background_tasks = set()
+
+async def _load_history(conversation_id: str = None, new_conversation: bool = False) -> Optional[list]:
     """
-    Load sample knowledge from JSON files
+    Get the turns of a conversation, once per turn
     
+    Args:
+        conversation_id: Optional conversation ID for continuing a conversation
+        new_conversation: Whether the server just started the conversation,
+            so there is no history to look up (in memory or in the database)
+        
     Returns:
-        Dictionary with file names as keys and content as values
+        List of messages or None for a new conversation
     """
-    knowledge = {}
-    json_dir = "./documents/json"
-    
-    if not os.path.exists(json_dir):
-        print(f"JSON directory {json_dir} does not exist.")
-        return knowledge
-    
-    # Load a sample of each JSON file
-    for file_name in os.listdir(json_dir):
-        if file_name.endswith(".json"):
-            file_path = os.path.join(json_dir, file_name)
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                # Extract a sample of the content
-                if isinstance(data, list) and len(data) > 0:
-                    # Take first 3 items if it's a list
-                    sample = data[:min(3, len(data))]
-                    content = json.dumps(sample, ensure_ascii=False, indent=2)
-                elif isinstance(data, dict):
-                    # Take the dictionary as is
-                    content = json.dumps(data, ensure_ascii=False, indent=2)
-                else:
-                    content = str(data)
-                
-                # Limit content length
-                if len(content) > 2000:
-                    content = content[:2000] + "...(truncated)"
-                
-                knowledge[file_name] = content
-                print(f"Loaded sample from {file_name}")
-            except Exception as e:
-                print(f"Error loading {file_path}: {str(e)}")
+    if not conversation_id or new_conversation:
+        return None
+    return await conversation_store.get(conversation_id)
+
+async def _prepare_messages(
+    message: str,
+    history: Optional[list] = None,
+    filters: Optional[MetadataFilter] = None,
+    query: Optional[CacheQuery] = None
+) -> Tuple[list, dict, list]:
+    """
+    Build the messages to send to the API: the shared system message, the
+    most recent conversation turns that fit the token budget, the retrieved
+    knowledge (in retrieval mode) and the user's message
+    
+    Args:
+        message: The user's message
+        history: Turns of the conversation so far, if any
+        filters: Optional restriction of the retrieved chunks (retrieval mode only)
+        query: The response cache lookup of the message, whose embedding (if
+            any) is reused to search the vector store
+        
+    Returns:
+        Tuple of (messages to send, the user's message, history turns left out)
+    """
+    user_message = make_message("user", message)
+    
+    # In retrieval mode only the chunks relevant to this question are sent;
+    # fall back to the sampled knowledge if an unfiltered search finds nothing
+    # (the index is empty), never when the question has filters
+    embedding = query.embedding.tolist() if query is not None and query.embedding is not None else None
+    context = await retrieve_context(message, filters=filters, embedding=embedding) if retrieval_enabled() else None
+    if context is None:
+        messages, dropped = fit_to_budget(await get_system_message(), history or [], user_message)
+        return messages, user_message, dropped
+    
+    budget = CONTEXT_TOKEN_BUDGET - count_message_tokens(context)
+    messages, dropped = fit_to_budget(get_retrieval_system_message(), history or [], user_message, budget)
+    messages.insert(-1, context)
+    return messages, user_message, dropped
+
+async def _lookup_response(
+    message: str,
+    history: Optional[list] = None,
+    filters: Optional[MetadataFilter] = None
+) -> Tuple[Optional[str], Optional[CacheQuery]]:
+    """
+    Look up the answer to the first question of a conversation in the
+    response cache (later turns depend on the history and are not cached)
+    
+    Args:
+        message: The user's message
+        history: Turns of the conversation so far, if any
+        filters: Optional restriction of the retrieved chunks
+        
+    Returns:
+        Tuple of (cached answer or None, query to store the answer under or
+        None if the answer must not be cached)
+    """
+    # Answers are cached per knowledge snapshot (and the prompt is built from
+    # it), so wait for the first one, built off the event loop
+    await get_knowledge_base().get_snapshot()
+    
+    cache = get_response_cache()
+    if cache is None:
+        return None, None
+    if history:
+        return None, None
+    
+    # Embedding the question (on an exact-match miss, in vector or hybrid mode) is blocking
+    return await asyncio.to_thread(cache.lookup, message, filters)
+
+async def _summarize_dropped_turns(conversation_id: str, dropped: list) -> None:
+    """
+    Replace turns that left the context window with a rolling summary
+    
+    Args:
+        conversation_id: The conversation ID
+        dropped: The oldest history messages (may start with a previous summary)
+    """
+    try:
+        data = {
+            "model": "gpt-3.5-turbo-16k",
+            "messages": build_summary_request(dropped),
+            "temperature": 0.2,
+            "max_tokens": 300
+        }
+        client = get_http_client()
+        async with get_request_slot():
+            response = await client.post("/chat/completions", json=data)
+        response.raise_for_status()
+        
+        summary = response.json()['choices'][0]['message']['content']
+        if await conversation_store.compact(conversation_id, dropped, make_summary_message(summary)):
+            print(f"Summarized {len(dropped)} messages of conversation {conversation_id}")
+    except Exception as e:
+        print(f"Error summarizing conversation {conversation_id}: {str(e)}")
+    finally:
+        _summarizing.discard(conversation_id)
+
+async def _record_turn(
+    conversation_id: str,
+    user_message: dict,
+    content: str,
+    dropped: list,
+    user_id: Optional[str] = None
+) -> None:
+    """
+    Add a completed turn to the conversation history and, if turns fell out
+    of the context window, summarize them in the background
+    
+    Args:
+        conversation_id: The conversation ID
+        user_message: The user's message
+        content: The AI's response
+        dropped: History turns that were left out of the request
+        user_id: Optional user the conversation is saved under
+    """
+    if not conversation_id:
+        return
+    
+    await conversation_store.append(
+        conversation_id, user_message, make_message("assistant", content), user_id=user_id
+    )
     
-    return knowledge
+    if CONTEXT_SUMMARY_ENABLED and dropped and conversation_id not in _summarizing:
+        _summarizing.add(conversation_id)
+        task = asyncio.create_task(_summarize_dropped_turns(conversation_id, dropped))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+def _build_request_data(messages: list, stream: bool = False) -> dict:
+    """Build the Chat Completions request payload"""
+    data = {
+        "model": "gpt-3.5-turbo-16k",  # Using a model with larger context window
+        "messages": messages,
+        "temperature": 0.7,
+        "max_tokens": 1000
+    }
+    if stream:
+        data["stream"] = True
+    return data
+
+async def _complete(data: dict) -> str:
+    """Send a completion request and return the response text"""
+    client = get_http_client()
+    async with get_request_slot():
+        response = await client.post("/chat/completions", json=data)
+    response.raise_for_status()  # Raise an exception for 4XX/5XX responses
+    
+    result = response.json()
+    return result['choices'][0]['message']['content']
+
+async def _stream_completion(data: dict) -> AsyncIterator[str]:
+    """Send a streaming completion request and yield the text deltas"""
+    client = get_http_client()
+    async with get_request_slot():
+        async with client.stream("POST", "/chat/completions", json=data) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                
+                chunk = json.loads(payload)
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
 
-# Load sample knowledge
-SAMPLE_KNOWLEDGE = load_sample_knowledge()
+@asynccontextmanager
+async def _turn_lock(conversation_id: str = None) -> AsyncIterator[None]:
+    """Hold the lock of a conversation (nothing to lock without one)"""
+    if not conversation_id:
+        yield
+        return
+    async with conversation_store.lock(conversation_id):
+        yield
 
-async def get_openai_response(message: str, conversation_id: str = None) -> str:
+def request_coalescing_stats() -> dict:
+    """Get the counters of the shared upstream requests"""
+    return {"completions": _completions.stats(), "streams": _streams.stats()}
+
+async def get_openai_response(
+    message: str,
+    conversation_id: str = None,
+    filters: Optional[MetadataFilter] = None,
+    new_conversation: bool = False,
+    user_id: Optional[str] = None
+) -> str:
     """
-    Get a response from OpenAI Chat Completions API using requests.
+    Get a response from OpenAI Chat Completions API using the shared
+    asynchronous HTTP client.
+    
+    The first question of a conversation is answered from the response
+    cache when the same or a very similar question was answered before.
+    Concurrent requests with identical messages share one upstream call.
     
     Args:
         message: The user's message
         conversation_id: Optional conversation ID for continuing a conversation
+        filters: Optional restriction of the retrieved chunks (retrieval mode only)
+        new_conversation: Whether conversation_id was just generated for this
+            request (its history is not looked up)
+        user_id: Optional user the conversation is saved under
         
     Returns:
         The AI's response
     """
-    try:
-        # Get or initialize conversation history
-        if conversation_id and conversation_id in conversation_history:
-            messages = conversation_history[conversation_id]
-        else:
-            # Create system message with sample knowledge
-            system_content = """
-# Instrucciones para el Asistente Educativo - Magis XXI
-
-## 🎯 Propósito
-Eres un asistente especializado en pedagogía ignaciana del Colegio San Bartolomé La Merced, diseñado para apoyar a profesores nuevos y experimentados. Tu misión es proporcionar información clara, concisa y práctica sobre cuatro pilares fundamentales:
-
-1. Pedagogía Ignaciana
-2. Propuesta educativa Magis XXI
-3. Programa de Afectividad
-4. Sistema Integrado de Evaluación Escolar (SIEE)
-
-## 📚 Base de Conocimiento
-A continuación se presenta una muestra de la información disponible en los documentos:
-"""
+    # Turns of the same conversation are processed one at a time
+    async with _turn_lock(conversation_id):
+        try:
+            history = await _load_history(conversation_id, new_conversation)
+            cached, query = await _lookup_response(message, history, filters)
+            if cached is not None:
+                await _record_turn(conversation_id, make_message("user", message), cached, [], user_id)
+                print(f"Answered from the response cache: {message[:50]}...")
+                return cached
             
-            # Add sample knowledge to system message
-            for file_name, content in SAMPLE_KNOWLEDGE.items():
-                system_content += f"\n\n### {file_name}:\n{content}\n"
+            messages, user_message, dropped = await _prepare_messages(message, history, filters, query)
             
-            system_content += """
-## 🔍 Principios de Respuesta
-
-1. **Precisión Documental**:
-   - Responde ÚNICAMENTE con información contenida en la base de conocimiento
-   - NUNCA incluyas referencias numéricas como [1], [2], [3], etc. en ninguna parte de tus respuestas
-   - Si la información no está disponible, indica: "Esta pregunta requiere consulta adicional con el equipo de Formación en Pedagogía Ignaciana"
-
-2. **Claridad y Accesibilidad**:
-   - Utiliza lenguaje sencillo y directo
-   - Explica términos técnicos cuando sea necesario
-   - Estructura tus respuestas de forma lógica y fácil de seguir
-
-3. **Orientación Práctica**:
-   - Proporciona ejemplos concretos de aplicación en el aula
-   - Ofrece sugerencias implementables y orientadas a soluciones
-   - Relaciona los conceptos teóricos con situaciones reales de enseñanza
-
-4. **Equilibrio Pedagógico**:
-   - Honra la tradición ignaciana mientras destacas la innovación de Magis XXI
-   - Mantén la confidencialidad institucional (sin revelar información no autorizada)
-   - Asegura que tus respuestas reflejen los valores del colegio
-
-## 📝 Formato de Respuesta
-
-Estructura tus respuestas de forma fluida y natural, incluyendo los siguientes elementos sin usar subtítulos, numeración explícita o cualquier tipo de referencia numérica:
-
-- Comienza con una respuesta directa y clara a la pregunta planteada (2-3 oraciones)
-- Continúa explicando los conceptos relevantes basándote en los documentos oficiales
-- Incluye un ejemplo concreto de aplicación en el aula o en la práctica educativa
-- Concluye con un consejo práctico o sugerencia que pueda implementarse inmediatamente
-
-## ⚠️ Limitaciones Importantes
-
-- No generes información que no esté explícitamente en los documentos
-- No menciones fuentes externas no incluidas en la base de conocimiento
-- No compartas opiniones personales sobre las políticas o prácticas del colegio
-- No reveles información confidencial sobre estudiantes, profesores o directivos
-- NUNCA incluyas referencias numéricas como [1], [2], [3], etc. al final de tus párrafos o respuestas
-- NO utilices notas al pie, superíndices, o cualquier notación similar que indique una referencia
-"""
+            print(f"Sending message to OpenAI: {message[:50]}...")
             
-            # Start with system message
-            messages = [
-                {"role": "system", "content": system_content}
-            ]
+            # Make API request, or join the identical one in flight
+            data = _build_request_data(messages)
+            content = await _completions.do(request_key(data), lambda: _complete(data))
             
-            if conversation_id:
-                conversation_history[conversation_id] = messages
-        
-        # Add user message to history
-        messages.append({"role": "user", "content": message})
-        
-        print(f"Sending message to OpenAI: {message[:50]}...")
-        
-        # Make API request
-        url = "https://api.openai.com/v1/chat/completions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        data = {
-            "model": "gpt-3.5-turbo-16k",  # Using a model with larger context window
-            "messages": messages,
-            "temperature": 0.7,
-            "max_tokens": 1000
-        }
-        
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()  # Raise an exception for 4XX/5XX responses
-        
-        result = response.json()
-        content = result['choices'][0]['message']['content']
-        
-        # Add assistant response to history
-        messages.append({"role": "assistant", "content": content})
-        
-        # Update conversation history
-        if conversation_id:
-            conversation_history[conversation_id] = messages
+            # Add the turn to the conversation history
+            await _record_turn(conversation_id, user_message, content, dropped, user_id)
+            if query is not None:
+                get_response_cache().put(query, content)
+            
+            print(f"Received response from OpenAI: {content[:50]}...")
+            return content
+            
+        except Exception as e:
+            print(f"Error calling OpenAI API: {str(e)}")
+            print("Exception type:", type(e).__name__)
+            print("Exception traceback:")
+            traceback.print_exc(file=sys.stdout)
+            
+            # If we have response details, print them
+            response = getattr(e, "response", None)
+            if response is not None:
+                print(f"Response status code: {response.status_code}")
+                print(f"Response text: {response.text}")
+            
+            # Return a fallback response instead of raising the exception
+            return "I'm sorry, I encountered an error while processing your request. Please try again later."
+
+async def stream_openai_response(
+    message: str,
+    conversation_id: str = None,
+    filters: Optional[MetadataFilter] = None,
+    new_conversation: bool = False,
+    user_id: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Stream a response from OpenAI Chat Completions API as it is generated.
+    
+    Completion deltas are yielded as they arrive and the full text is stored
+    in the conversation history once the upstream stream finishes. If the
+    consumer stops early (e.g. the client disconnected), the upstream request
+    is closed and the unanswered turn is not recorded. A cached answer to
+    the first question of a conversation is yielded as a single delta.
+    Concurrent requests with identical messages share one upstream stream
+    (closed when the last of them disconnects).
+    
+    Args:
+        message: The user's message
+        conversation_id: Optional conversation ID for continuing a conversation
+        filters: Optional restriction of the retrieved chunks (retrieval mode only)
+        new_conversation: Whether conversation_id was just generated for this
+            request (its history is not looked up)
+        user_id: Optional user the conversation is saved under
         
-        print(f"Received response from OpenAI: {content[:50]}...")
-        return content
+    Yields:
+        Text deltas of the AI's response
+    """
+    # Turns of the same conversation are processed one at a time
+    async with _turn_lock(conversation_id):
+        history = await _load_history(conversation_id, new_conversation)
+        cached, query = await _lookup_response(message, history, filters)
+        if cached is not None:
+            print(f"Answered from the response cache: {message[:50]}...")
+            yield cached
+            await _record_turn(conversation_id, make_message("user", message), cached, [], user_id)
+            return
         
-    except Exception as e:
-        print(f"Error calling OpenAI API: {str(e)}")
-        print("Exception type:", type(e).__name__)
-        print("Exception traceback:")
-        traceback.print_exc(file=sys.stdout)
+        messages, user_message, dropped = await _prepare_messages(message, history, filters, query)
+        parts = []
         
-        # If we have response details, print them
-        if 'response' in locals():
-            print(f"Response status code: {response.status_code}")
-            print(f"Response text: {response.text}")
+        print(f"Streaming message to OpenAI: {message[:50]}...")
         
-        # Return a fallback response instead of raising the exception
-        return "I'm sorry, I encountered an error while processing your request. Please try again later."
+        data = _build_request_data(messages, stream=True)
+        stream = _streams.subscribe(request_key(data), lambda: _stream_completion(data))
+        try:
+            async for delta in stream:
+                parts.append(delta)
+                yield delta
+            
+            content = "".join(parts)
+            
+            # Add the turn to the conversation history
+            await _record_turn(conversation_id, user_message, content, dropped, user_id)
+            if query is not None:
+                get_response_cache().put(query, content)
+            
+            print(f"Streamed response from OpenAI: {content[:50]}...")
+        except Exception as e:
+            print(f"Error streaming from OpenAI API: {str(e)}")
+            traceback.print_exc(file=sys.stdout)
+            raise
+        finally:
+            await stream.aclose()
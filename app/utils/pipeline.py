@@ -0,0 +1,176 @@
+"""
+Pipeline
+
+This module runs a sequence of processing stages as overlapping threads
+connected by bounded queues. Each stage turns an input item into zero or more
+output items; when a downstream stage falls behind its queue fills up and the
+upstream stages block, so memory stays bounded by the queue sizes no matter
+how many items flow through. The first failure stops every stage and is
+re-raised to the caller.
+"""
+
+import os
+import time
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Maximum number of items waiting between two stages
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 4))
+
+# Marks the end of a stage's output
+_DONE = object()
+
+@dataclass
+class Stage:
+    """A processing step of a pipeline"""
+    name: str
+    # Turns one input item into output items
+    process: Callable[[Any], Iterable[Any]]
+    # Emits the remaining output items after the last input (e.g. a partial batch)
+    finish: Optional[Callable[[], Iterable[Any]]] = None
+    # Number of units (files, chunks...) in an output item, for throughput
+    size: Callable[[Any], int] = lambda item: 1
+    unit: str = "items"
+
+@dataclass
+class StageStats:
+    """Counters of one stage"""
+    name: str
+    unit: str = "items"
+    items: int = 0
+    units: int = 0
+    busy_seconds: float = 0.0
+    blocked_seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Units produced per second of work"""
+        return self.units / self.busy_seconds if self.busy_seconds else 0.0
+
+    def describe(self) -> str:
+        return f"{self.name}: {self.units} {self.unit} ({self.throughput:.1f}/s, blocked {self.blocked_seconds:.1f}s)"
+
+class PipelineStopped(Exception):
+    """Raised inside a stage when another stage has failed"""
+
+class Pipeline:
+    """Stages running concurrently over bounded queues"""
+
+    def __init__(self, stages: List[Stage], queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.stats = [StageStats(stage.name, stage.unit) for stage in stages]
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+
+    def _put(self, outbox: Optional[queue.Queue], item: Any, stats: StageStats) -> None:
+        if outbox is None:
+            return
+        start = time.perf_counter()
+        while True:
+            if self._stop.is_set():
+                raise PipelineStopped()
+            try:
+                outbox.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.blocked_seconds += time.perf_counter() - start
+
+    def _get(self, inbox: queue.Queue, stats: StageStats) -> Any:
+        start = time.perf_counter()
+        while True:
+            if self._stop.is_set():
+                raise PipelineStopped()
+            try:
+                item = inbox.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        stats.blocked_seconds += time.perf_counter() - start
+        return item
+
+    def _emit(self, stage: Stage, outputs: Iterable[Any], outbox: Optional[queue.Queue], stats: StageStats) -> None:
+        """Forward a stage's outputs, counting only the time spent producing them as work"""
+        iterator = iter(outputs)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                stats.busy_seconds += time.perf_counter() - start
+                return
+            stats.busy_seconds += time.perf_counter() - start
+            stats.items += 1
+            stats.units += stage.size(item)
+            self._put(outbox, item, stats)
+
+    def _run_stage(self, stage: Stage, stats: StageStats, inbox: Optional[queue.Queue], outbox: Optional[queue.Queue]) -> None:
+        try:
+            if inbox is None:
+                # The first stage is the source: it is called once with no input
+                self._emit(stage, stage.process(None), outbox, stats)
+            else:
+                while True:
+                    item = self._get(inbox, stats)
+                    if item is _DONE:
+                        break
+                    self._emit(stage, stage.process(item), outbox, stats)
+            if stage.finish is not None:
+                self._emit(stage, stage.finish(), outbox, stats)
+            self._put(outbox, _DONE, stats)
+        except PipelineStopped:
+            pass
+        except BaseException as e:
+            with self._error_lock:
+                if self._error is None:
+                    self._error = e
+            self._stop.set()
+
+    def run(self) -> List[StageStats]:
+        """
+        Run the pipeline to completion
+
+        The first stage is the source (its `process` is called once with
+        None); the last stage's outputs are discarded.
+
+        Returns:
+            Counters of every stage
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages[1:]]
+        threads = []
+        for i, (stage, stats) in enumerate(zip(self.stages, self.stats)):
+            inbox = queues[i - 1] if i > 0 else None
+            outbox = queues[i] if i < len(queues) else None
+            thread = threading.Thread(
+                target=self._run_stage,
+                args=(stage, stats, inbox, outbox),
+                name=f"pipeline-{stage.name}",
+                daemon=True
+            )
+            threads.append(thread)
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except BaseException:
+            # e.g. KeyboardInterrupt: let the stages wind down
+            self._stop.set()
+            raise
+
+        if self._error is not None:
+            raise self._error
+        return self.stats
+
+    def describe(self) -> str:
+        """One-line summary of every stage's progress"""
+        return " | ".join(stats.describe() for stats in self.stats)
@@ -0,0 +1,302 @@
+"""
+System Prompt
+
+This module assembles the system prompt for the Teacher's AI Assistant. The
+prompt (instructions plus a sample of the knowledge files) is shared, as a
+single immutable message, by every conversation; the knowledge base
+(app.utils.knowledge_base) rebuilds it when the knowledge files change, and
+its token count is computed once, with the tokenizer's encoding. The event
+loop never loads the encoding itself: it starts loading it in a background
+thread and estimates token counts until it is ready.
+"""
+
+import os
+import json
+import asyncio
+import threading
+from itertools import islice
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+from app.utils.json_stream import iter_json
+
+# Load environment variables
+load_dotenv()
+
+# Directory with the JSON knowledge files sampled into the prompt
+KNOWLEDGE_JSON_DIR = os.getenv("KNOWLEDGE_JSON_DIR", "./documents/json")
+
+# Model used to count prompt tokens
+TOKENIZER_MODEL = "gpt-3.5-turbo-16k"
+
+SYSTEM_PROMPT_HEADER = """
+# Instrucciones para el Asistente Educativo - Magis XXI
+
+## 🎯 Propósito
+Eres un asistente especializado en pedagogía ignaciana del Colegio San Bartolomé La Merced, diseñado para apoyar a profesores nuevos y experimentados. Tu misión es proporcionar información clara, concisa y práctica sobre cuatro pilares fundamentales:
+
+1. Pedagogía Ignaciana
+2. Propuesta educativa Magis XXI
+3. Programa de Afectividad
+4. Sistema Integrado de Evaluación Escolar (SIEE)
+
+## 📚 Base de Conocimiento
+"""
+
+# Introduction to the knowledge section when a sample of each file is included
+SAMPLE_KNOWLEDGE_INTRO = """A continuación se presenta una muestra de la información disponible en los documentos:
+"""
+
+# Introduction to the knowledge section when fragments are retrieved per question
+RETRIEVAL_KNOWLEDGE_INTRO = """Con cada pregunta recibirás los fragmentos de los documentos más relevantes para responderla. Considéralos tu base de conocimiento.
+"""
+
+SYSTEM_PROMPT_FOOTER = """
+## 🔍 Principios de Respuesta
+
+1. **Precisión Documental**:
+   - Responde ÚNICAMENTE con información contenida en la base de conocimiento
+   - NUNCA incluyas referencias numéricas como [1], [2], [3], etc. en ninguna parte de tus respuestas
+   - Si la información no está disponible, indica: "Esta pregunta requiere consulta adicional con el equipo de Formación en Pedagogía Ignaciana"
+
+2. **Claridad y Accesibilidad**:
+   - Utiliza lenguaje sencillo y directo
+   - Explica términos técnicos cuando sea necesario
+   - Estructura tus respuestas de forma lógica y fácil de seguir
+
+3. **Orientación Práctica**:
+   - Proporciona ejemplos concretos de aplicación en el aula
+   - Ofrece sugerencias implementables y orientadas a soluciones
+   - Relaciona los conceptos teóricos con situaciones reales de enseñanza
+
+4. **Equilibrio Pedagógico**:
+   - Honra la tradición ignaciana mientras destacas la innovación de Magis XXI
+   - Mantén la confidencialidad institucional (sin revelar información no autorizada)
+   - Asegura que tus respuestas reflejen los valores del colegio
+
+## 📝 Formato de Respuesta
+
+Estructura tus respuestas de forma fluida y natural, incluyendo los siguientes elementos sin usar subtítulos, numeración explícita o cualquier tipo de referencia numérica:
+
+- Comienza con una respuesta directa y clara a la pregunta planteada (2-3 oraciones)
+- Continúa explicando los conceptos relevantes basándote en los documentos oficiales
+- Incluye un ejemplo concreto de aplicación en el aula o en la práctica educativa
+- Concluye con un consejo práctico o sugerencia que pueda implementarse inmediatamente
+
+## ⚠️ Limitaciones Importantes
+
+- No generes información que no esté explícitamente en los documentos
+- No menciones fuentes externas no incluidas en la base de conocimiento
+- No compartas opiniones personales sobre las políticas o prácticas del colegio
+- No reveles información confidencial sobre estudiantes, profesores o directivos
+- NUNCA incluyas referencias numéricas como [1], [2], [3], etc. al final de tus párrafos o respuestas
+- NO utilices notas al pie, superíndices, o cualquier notación similar que indique una referencia
+"""
+
+class SystemMessage(dict):
+    """
+    Immutable system message shared by all conversations
+    
+    Behaves like the plain `{"role": "system", "content": ...}` dict sent to
+    the API, but cannot be modified and carries its token count (counted on
+    first use if not given, and recounted until the encoding is loaded).
+    """
+    
+    __slots__ = ("_token_count", "version")
+    
+    def __init__(self, content: str, token_count: Optional[int], version: int):
+        dict.__init__(self, role="system", content=content)
+        self._token_count = token_count
+        self.version = version
+    
+    @property
+    def token_count(self) -> int:
+        if self._token_count is None:
+            final = encoding_loaded()
+            tokens = count_tokens(self["content"])
+            if not final:
+                return tokens
+            self._token_count = tokens
+        return self._token_count
+    
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("The shared system message cannot be modified")
+    
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    
+    def __copy__(self):
+        return self
+    
+    def __deepcopy__(self, memo):
+        return self
+
+# Load sample knowledge from JSON files
+def load_sample_knowledge(json_dir: Optional[str] = None) -> Dict[str, str]:
+    """
+    Load sample knowledge from JSON files
+    
+    Args:
+        json_dir: Directory with the JSON files (defaults to KNOWLEDGE_JSON_DIR)
+    
+    Returns:
+        Dictionary with file names as keys and content as values
+    """
+    knowledge = {}
+    json_dir = json_dir or KNOWLEDGE_JSON_DIR
+    
+    if not os.path.exists(json_dir):
+        print(f"JSON directory {json_dir} does not exist.")
+        return knowledge
+    
+    # Load a sample of each JSON file
+    for file_name in sorted(os.listdir(json_dir)):
+        if file_name.endswith(".json"):
+            file_path = os.path.join(json_dir, file_name)
+            try:
+                # Only the first items of a list are sampled, so the rest of the file is never parsed
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    items = iter_json(f)
+                    first = next(items, None)
+                    if first is None:
+                        data = []
+                    elif first[0]:
+                        data = [first[1]] + [value for _, value in islice(items, 2)]
+                    else:
+                        data = first[1]
+                
+                # Extract a sample of the content
+                if isinstance(data, list) and len(data) > 0:
+                    # Take first 3 items if it's a list
+                    sample = data[:min(3, len(data))]
+                    content = json.dumps(sample, ensure_ascii=False, indent=2)
+                elif isinstance(data, dict):
+                    # Take the dictionary as is
+                    content = json.dumps(data, ensure_ascii=False, indent=2)
+                else:
+                    content = str(data)
+                
+                # Limit content length
+                if len(content) > 2000:
+                    content = content[:2000] + "...(truncated)"
+                
+                knowledge[file_name] = content
+                print(f"Loaded sample from {file_name}")
+            except Exception as e:
+                print(f"Error loading {file_path}: {str(e)}")
+    
+    return knowledge
+
+def build_system_prompt(knowledge: Dict[str, str], intro: str = SAMPLE_KNOWLEDGE_INTRO) -> str:
+    """
+    Assemble the system prompt from the instructions and the sample knowledge
+    
+    Args:
+        knowledge: Dictionary with file names as keys and content as values
+        intro: Introduction to the knowledge section
+        
+    Returns:
+        The system prompt text
+    """
+    parts = [SYSTEM_PROMPT_HEADER, intro]
+    for file_name, content in knowledge.items():
+        parts.append(f"\n\n### {file_name}:\n{content}\n")
+    parts.append(SYSTEM_PROMPT_FOOTER)
+    return "".join(parts)
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_loader: Optional[threading.Thread] = None
+_encoding_loader_lock = threading.Lock()
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+def _load_encoding() -> None:
+    """Load the tiktoken encoding, once (blocking: it may be downloaded)"""
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+            except Exception as e:
+                print(f"Could not load tiktoken encoding, estimating tokens: {str(e)}")
+                _encoding = False
+
+def _load_encoding_in_background() -> None:
+    global _encoding_loader
+    with _encoding_loader_lock:
+        if _encoding_loader is None:
+            _encoding_loader = threading.Thread(target=_load_encoding, name="encoding-loader", daemon=True)
+            _encoding_loader.start()
+
+def encoding_loaded() -> bool:
+    """Check whether token counts are final (the encoding was loaded, or failed to)"""
+    return _encoding is not None
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens in a text with tiktoken, falling back to an estimate
+    (4 characters per token) if the encoding is not available
+    
+    On the event loop the encoding is never loaded: it is loaded in a
+    background thread and tokens are estimated until it is ready, so counts
+    made before encoding_loaded() must not be cached.
+    
+    Args:
+        text: The text to count
+        
+    Returns:
+        Number of tokens
+    """
+    if _encoding is None:
+        if _on_event_loop():
+            _load_encoding_in_background()
+            return len(text) // 4 + 1
+        _load_encoding()
+    
+    if _encoding is False:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text))
+
+def knowledge_fingerprint(json_dir: Optional[str] = None) -> Tuple:
+    """
+    Fingerprint the knowledge files by name, size and modification time
+    
+    Args:
+        json_dir: Directory with the JSON files (defaults to KNOWLEDGE_JSON_DIR)
+        
+    Returns:
+        Hashable tuple that changes whenever a knowledge file changes
+    """
+    json_dir = json_dir or KNOWLEDGE_JSON_DIR
+    if not os.path.exists(json_dir):
+        return ()
+    
+    entries = []
+    for file_name in sorted(os.listdir(json_dir)):
+        if file_name.endswith(".json"):
+            stat = os.stat(os.path.join(json_dir, file_name))
+            entries.append((file_name, stat.st_size, stat.st_mtime_ns))
+    return tuple(entries)
+
+_retrieval_system_message: Optional[SystemMessage] = None
+
+def get_retrieval_system_message() -> SystemMessage:
+    """
+    Get the shared system message used when knowledge is retrieved per
+    question (no samples are included, so it never needs rebuilding)
+    
+    Returns:
+        The shared SystemMessage
+    """
+    global _retrieval_system_message
+    if _retrieval_system_message is None:
+        # Counted on first use (estimated on the event loop until the encoding is loaded)
+        content = build_system_prompt({}, intro=RETRIEVAL_KNOWLEDGE_INTRO)
+        _retrieval_system_message = SystemMessage(content, None, 1)
+    return _retrieval_system_message
@@ -0,0 +1,358 @@
+"""
+Response Cache
+
+This module caches the answers to first-turn questions, which new teachers
+ask over and over. A question is first looked up by its normalized text
+(case, accents, punctuation and spacing ignored); if that misses, its
+embedding is compared with those of the cached questions and the answer of
+the most similar one is reused when the cosine similarity is above a
+threshold. Questions are only embedded when the retrieval mode embeds them
+anyway (vector or hybrid), and that embedding is then reused to search the
+vector store, so the cache never adds an embeddings call to a request.
+
+Answers depend on the knowledge they were generated from, so every entry
+belongs to a knowledge snapshot version (see app.utils.knowledge_base) and
+to the retrieval filters of the request; reloading the knowledge base
+empties the cache. Entries expire after a
+TTL and the least recently used ones are evicted when the cache is full.
+"""
+
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.utils.knowledge_base import get_knowledge_base
+from app.utils.metadata_filter import MetadataFilter
+from app.utils.retrieval import vector_search_enabled
+
+# NumPy is only imported once a question is embedded
+if TYPE_CHECKING:
+    import numpy as np
+
+# Load environment variables
+load_dotenv()
+
+# Cache settings
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 24 * 60 * 60))
+
+# Match questions by embedding when the normalized text differs, reusing an
+# answer when the cosine similarity reaches the threshold (only in the vector
+# and hybrid retrieval modes, which embed the question anyway)
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "true").lower() == "true"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", 0.95))
+
+def semantic_matching_enabled() -> bool:
+    """Check whether questions are matched by embedding"""
+    return RESPONSE_CACHE_SEMANTIC and vector_search_enabled()
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+def normalize_question(text: str) -> str:
+    """
+    Normalize a question for exact matching
+
+    Args:
+        text: The question
+
+    Returns:
+        Lowercased text without accents, punctuation or repeated spaces
+    """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = _PUNCTUATION.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+def filter_key(filters: Optional[MetadataFilter]) -> str:
+    """Canonical text of retrieval filters, so equal filters share entries"""
+    if filters is None:
+        return ""
+    values = ";".join(f"{name}={','.join(sorted(allowed))}" for name, allowed in sorted(filters.values.items()))
+    return f"{values};{filters.date_from}-{filters.date_to}"
+
+def knowledge_version() -> Tuple:
+    """
+    Identify the knowledge answers are generated from
+
+    Returns:
+        The version of the published knowledge snapshot (None before the
+        first one), which changes with the sampled knowledge files and with
+        every ingestion into the index
+    """
+    snapshot = get_knowledge_base().current()
+    return ("knowledge", snapshot.version if snapshot is not None else None)
+
+# Embeddings client used for questions, created on first use
+_embeddings = None
+
+def get_question_embeddings():
+    """
+    Get the embeddings client used for questions, creating it on first use
+
+    Returns:
+        Embeddings client (with the embedding cache)
+    """
+    global _embeddings
+    if _embeddings is None:
+        # Imported here so the chat path does not load langchain unless needed
+        from app.utils.document_loader import create_openai_embeddings
+        _embeddings = create_openai_embeddings()
+    return _embeddings
+
+def embed_question(question: str) -> Optional["np.ndarray"]:
+    """
+    Embed a question for semantic matching (blocking)
+
+    The embedding goes through the embedding cache, so retrieving chunks for
+    the same question afterwards does not embed it again.
+
+    Args:
+        question: The user's question
+
+    Returns:
+        Unit-length embedding, or None if embedding failed
+    """
+    import numpy as np
+    try:
+        vector = np.asarray(get_question_embeddings().embed_query(question), dtype=np.float32)
+    except Exception as e:
+        print(f"Error embedding question for the response cache: {str(e)}")
+        return None
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else None
+
+@dataclass
+class CacheQuery:
+    """A question prepared for lookup"""
+    question: str
+    text: str
+    filters: str
+    # Knowledge version when the question was asked
+    version: Tuple = ()
+    embedding: Optional["np.ndarray"] = None
+
+@dataclass
+class _Entry:
+    answer: str
+    created: float
+    slot: Optional[int] = None
+
+@dataclass
+class ResponseCacheStats:
+    """Counters describing the cache's behaviour"""
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    expirations: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    entries: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "writes": self.writes,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": self.entries,
+        }
+
+class ResponseCache:
+    """In-memory cache of answers, matched by normalized text or embedding"""
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+        embed: Optional[Callable[[str], Optional["np.ndarray"]]] = embed_question if semantic_matching_enabled() else None,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.embed = embed
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._stats = ResponseCacheStats()
+        self._version: Optional[Tuple] = None
+
+        # Unit-length question embeddings, one row per slot; a row is only
+        # compared while `_slot_keys` maps it to a live entry
+        self._vectors: Optional["np.ndarray"] = None
+        self._slot_keys: List[Optional[Tuple[str, str]]] = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key)
+        if entry.slot is not None:
+            self._slot_keys[entry.slot] = None
+            self._free_slots.append(entry.slot)
+        self._stats.entries = len(self._entries)
+
+    def _check_version(self, version: Tuple) -> None:
+        """Drop every entry if the knowledge changed"""
+        if version != self._version:
+            if self._entries:
+                self._stats.invalidations += 1
+                print(f"Knowledge changed, clearing {len(self._entries)} cached responses")
+            for key in list(self._entries):
+                self._remove(key)
+            self._version = version
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return now - entry.created > self.ttl_seconds
+
+    def _nearest(self, query: CacheQuery) -> Optional[Tuple[str, str]]:
+        """Find the live cached question most similar to the query, above the threshold"""
+        if self._vectors is None or query.embedding is None or len(query.embedding) != self._vectors.shape[1]:
+            return None
+        import numpy as np
+        now = time.monotonic()
+        scores = self._vectors @ query.embedding
+        for slot in np.argsort(-scores):
+            if scores[slot] < self.similarity:
+                return None
+            key = self._slot_keys[slot]
+            if key is None or key[1] != query.filters:
+                continue
+            # Expired entries are dropped (freeing their slot) and the next
+            # most similar question is tried
+            if self._expired(self._entries[key], now):
+                self._remove(key)
+                self._stats.expirations += 1
+                continue
+            return key
+        return None
+
+    def _take(self, key: Optional[Tuple[str, str]]) -> Optional[str]:
+        """Get the answer of an entry unless it expired"""
+        entry = self._entries.get(key) if key is not None else None
+        if entry is None:
+            return None
+        if self._expired(entry, time.monotonic()):
+            self._remove(key)
+            self._stats.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry.answer
+
+    def lookup(self, question: str, filters: Optional[MetadataFilter] = None) -> Tuple[Optional[str], CacheQuery]:
+        """
+        Look up the answer to a question (blocking)
+
+        The normalized text is matched first; the question is only embedded
+        (outside the lock) if that misses.
+
+        Args:
+            question: The user's question
+            filters: Retrieval filters of the request
+
+        Returns:
+            Tuple of (cached answer or None, query to store the answer under)
+        """
+        query = CacheQuery(question, normalize_question(question), filter_key(filters), knowledge_version())
+        with self._lock:
+            self._check_version(query.version)
+            answer = self._take((query.text, query.filters))
+            if answer is not None:
+                self._stats.exact_hits += 1
+                return answer, query
+
+        if self.embed is not None:
+            query.embedding = self.embed(question)
+        with self._lock:
+            answer = self._take(self._nearest(query)) if query.version == self._version else None
+            if answer is not None:
+                self._stats.semantic_hits += 1
+            else:
+                self._stats.misses += 1
+            return answer, query
+
+    def put(self, query: CacheQuery, answer: str) -> None:
+        """
+        Store the answer to a question
+
+        Answers generated from knowledge that has changed since the question
+        was asked are not stored.
+
+        Args:
+            query: The prepared question
+            answer: The generated answer
+        """
+        with self._lock:
+            self._check_version(knowledge_version())
+            if query.version != self._version:
+                return
+            key = (query.text, query.filters)
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats.evictions += 1
+
+            entry = _Entry(answer, time.monotonic())
+            if query.embedding is not None:
+                if self._vectors is None or self._vectors.shape[1] != len(query.embedding):
+                    # First embedding, or the embedding model changed
+                    import numpy as np
+                    for slot_key in self._slot_keys:
+                        if slot_key is not None:
+                            self._entries[slot_key].slot = None
+                    self._slot_keys = [None] * self.max_entries
+                    self._free_slots = list(range(self.max_entries - 1, -1, -1))
+                    self._vectors = np.zeros((self.max_entries, len(query.embedding)), dtype=np.float32)
+                entry.slot = self._free_slots.pop()
+                self._vectors[entry.slot] = query.embedding
+                self._slot_keys[entry.slot] = key
+            self._entries[key] = entry
+            self._stats.writes += 1
+            self._stats.entries = len(self._entries)
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self) -> Dict[str, float]:
+        """Get the cache's counters"""
+        return self._stats.as_dict()
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Get the process-wide response cache
+
+    Returns:
+        ResponseCache, or None if the cache is disabled
+    """
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+def response_cache_stats() -> Optional[Dict[str, float]]:
+    """Get the counters of the response cache, if it has been used"""
+    return _cache.stats() if _cache is not None else None
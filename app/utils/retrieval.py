@@ -0,0 +1,203 @@
+"""
+Retrieval
+
+This module implements the retrieval-augmented mode of the chat path: the
+user's question is embedded, the most similar chunks are pulled from the
+persisted vector store and only those chunks (up to a token budget) are
+added to the request, instead of a fixed sample of every knowledge file.
+
+Chunks can be found by meaning (embedding similarity), by keywords (BM25 over
+the lexical index built during ingestion, with no network call) or by both,
+merging the two rankings with reciprocal rank fusion. A question can be
+restricted to chunks with given attributes (file, pillar, document type,
+date); both retrievers apply the filter before scoring.
+"""
+
+import os
+import asyncio
+from typing import Any, Dict, List, NamedTuple, Optional
+from dotenv import load_dotenv
+from app.utils.context_window import make_message, CountedMessage
+from app.utils.metadata_filter import MetadataFilter
+from app.utils.prompts import count_tokens
+
+# Load environment variables
+load_dotenv()
+
+# "sample" sends a fixed sample of each knowledge file; "vector", "lexical" and
+# "hybrid" retrieve chunks per question by embedding similarity, BM25 or both
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "sample").lower()
+
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+
+# Number of chunks to retrieve per question
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 5))
+
+# Maximum number of tokens of retrieved chunks added to a request
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", 2000))
+
+# Number of candidates each ranking contributes to hybrid fusion, per chunk returned
+RETRIEVAL_HYBRID_CANDIDATES = int(os.getenv("RETRIEVAL_HYBRID_CANDIDATES", 4))
+
+# Rank offset of reciprocal rank fusion (60 is the usual choice)
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# Directory where the vector store is persisted
+CHROMA_DB_DIR = os.getenv("CHROMA_DB_DIR", "./chroma_db")
+
+def retrieval_enabled() -> bool:
+    """Check whether the chat path retrieves chunks per question"""
+    return RETRIEVAL_MODE in RETRIEVAL_MODES
+
+def vector_search_enabled() -> bool:
+    """Check whether retrieval needs the vector store"""
+    return RETRIEVAL_MODE in ("vector", "hybrid")
+
+def lexical_search_enabled() -> bool:
+    """Check whether retrieval needs the lexical index"""
+    return RETRIEVAL_MODE in ("lexical", "hybrid")
+
+class Chunk(NamedTuple):
+    """
+    A chunk found by the lexical index, with the attributes of a langchain
+    Document so both retrievers' results are handled alike (without loading
+    langchain in lexical mode)
+    """
+    page_content: str
+    metadata: Dict[str, Any]
+
+def _lexical_search(question: str, k: int, filters: Optional[MetadataFilter]) -> List[Chunk]:
+    from app.utils.lexical_index import lexical_search
+    return [Chunk(text, metadata) for text, metadata, _ in lexical_search(question, CHROMA_DB_DIR, k, filters)]
+
+def _document_key(doc) -> str:
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+def reciprocal_rank_fusion(rankings: List[List], k: int = RRF_K) -> List:
+    """
+    Merge several rankings of documents
+
+    Each document scores the sum of 1 / (k + rank) over the rankings it
+    appears in, so documents ranked high by either retriever, and above all
+    by both, come first.
+
+    Args:
+        rankings: Lists of documents, best first
+        k: Rank offset damping the weight of the top positions
+
+    Returns:
+        Documents ordered by fused score
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, object] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = _document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(key, doc)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+def search_documents(
+    question: str,
+    k: int = RETRIEVAL_TOP_K,
+    mode: Optional[str] = None,
+    filters: Optional[MetadataFilter] = None,
+    embedding: Optional[List[float]] = None
+) -> List:
+    """
+    Find the chunks most relevant to a question (blocking)
+
+    Args:
+        question: The user's question
+        k: Number of chunks to return
+        mode: "vector", "lexical" or "hybrid" (defaults to RETRIEVAL_MODE)
+        filters: Only consider chunks with these attributes
+        embedding: Embedding of the question, if already computed
+
+    Returns:
+        List of documents, most relevant first
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode == "lexical":
+        return _lexical_search(question, k, filters)
+
+    # Imported here so the chat path does not load langchain unless retrieval is used
+    from app.utils.document_loader import query_vector_store
+    if mode == "vector":
+        return query_vector_store(question, CHROMA_DB_DIR, k, filters, embedding)
+
+    candidates = k * RETRIEVAL_HYBRID_CANDIDATES
+    fused = reciprocal_rank_fusion([
+        query_vector_store(question, CHROMA_DB_DIR, candidates, filters, embedding),
+        _lexical_search(question, candidates, filters),
+    ])
+    return fused[:k]
+
+# Heading of the retrieved chunks in the prompt
+CONTEXT_HEADING = "## 📚 Fragmentos relevantes de la base de conocimiento"
+
+# Sent instead of the chunks when no chunk matches the question's filters
+NO_MATCHING_CONTEXT = (
+    f"{CONTEXT_HEADING}\n\n"
+    "Ningún fragmento de la base de conocimiento coincide con los filtros de esta consulta "
+    "(archivo, pilar, tipo de documento o fechas). No respondas con información de otros documentos."
+)
+
+def format_context(documents: List, token_budget: int = RETRIEVAL_TOKEN_BUDGET) -> Optional[str]:
+    """
+    Format retrieved chunks for the prompt, most relevant first, stopping
+    when the token budget is spent
+
+    Args:
+        documents: Retrieved documents (most relevant first)
+        token_budget: Maximum number of tokens of chunk text
+
+    Returns:
+        The context text, or None if no chunk fits
+    """
+    parts = []
+    used = 0
+    for doc in documents:
+        file_name = doc.metadata.get("file_name", "documento")
+        part = f"### {file_name}:\n{doc.page_content}\n"
+        tokens = count_tokens(part)
+        if used + tokens > token_budget:
+            break
+        parts.append(part)
+        used += tokens
+
+    if not parts:
+        return None
+    return f"{CONTEXT_HEADING}\n\n" + "\n".join(parts)
+
+async def retrieve_context(
+    question: str,
+    k: int = RETRIEVAL_TOP_K,
+    filters: Optional[MetadataFilter] = None,
+    embedding: Optional[List[float]] = None
+) -> Optional[CountedMessage]:
+    """
+    Retrieve the chunks most relevant to a question as a system message
+
+    Args:
+        question: The user's question
+        k: Number of chunks to retrieve
+        filters: Only consider chunks with these attributes
+        embedding: Embedding of the question, if already computed (e.g. by
+            the response cache)
+
+    Returns:
+        System message with the retrieved chunks (saying that nothing matched
+        when filters were given), or None if an unfiltered search found nothing
+    """
+    # The vector store client, embedding call and index lookups are blocking
+    documents = await asyncio.to_thread(search_documents, question, k, None, filters, embedding)
+
+    # A filtered question must not be answered from unfiltered knowledge
+    if not documents and filters is not None and not filters.is_empty:
+        return make_message("system", NO_MATCHING_CONTEXT)
+
+    context = format_context(documents)
+    if context is None:
+        return None
+    return make_message("system", context)
@@ -0,0 +1,211 @@
+"""
+Single Flight
+
+This module deduplicates identical upstream requests that are in flight at
+the same time. The first caller with a given key starts the request; callers
+arriving with the same key before it finishes share its result instead of
+sending their own. Streams are shared the same way: every subscriber
+receives all the chunks from the start (chunks that arrived before it joined
+are replayed), and the upstream stream is closed when the last subscriber
+leaves. Only requests in flight are shared; nothing is kept once they finish.
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Share identical concurrent upstream requests
+REQUEST_COALESCING_ENABLED = os.getenv("REQUEST_COALESCING_ENABLED", "true").lower() == "true"
+
+def request_key(data: Dict[str, Any]) -> str:
+    """
+    Compute the key of an upstream request
+
+    Args:
+        data: Request payload (model, messages and parameters)
+
+    Returns:
+        Hex SHA-256 of the canonical JSON of the payload
+    """
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+@dataclass
+class SingleFlightStats:
+    """Counters describing how many requests were shared"""
+    started: int = 0
+    coalesced: int = 0
+    in_flight: int = 0
+
+    @property
+    def coalesced_rate(self) -> float:
+        total = self.started + self.coalesced
+        return self.coalesced / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced_rate, 4),
+            "in_flight": self.in_flight,
+        }
+
+@dataclass
+class _Call:
+    task: asyncio.Task
+    waiters: int = 0
+
+class SingleFlight:
+    """Shares the result of identical concurrent calls"""
+
+    def __init__(self, enabled: bool = REQUEST_COALESCING_ENABLED):
+        self.enabled = enabled
+        self._calls: Dict[str, _Call] = {}
+        self._stats = SingleFlightStats()
+
+    def _finished(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+            self._stats.in_flight = len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run a call, or wait for the identical one already in flight
+
+        A caller that gives up (e.g. its client disconnected) does not
+        cancel the call for the others; the call is cancelled only when
+        every caller waiting for it has given up.
+
+        Args:
+            key: Key identifying identical calls
+            fn: Starts the call
+
+        Returns:
+            The call's result (its exception is raised to every caller)
+        """
+        if not self.enabled:
+            return await fn()
+
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._finished(key, call))
+            self._stats.started += 1
+            self._stats.in_flight = len(self._calls)
+        else:
+            self._stats.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def stats(self) -> Dict[str, float]:
+        """Get the counters"""
+        return self._stats.as_dict()
+
+class _Broadcast:
+    """An upstream stream read once and replayed to every subscriber"""
+
+    def __init__(self, source: AsyncIterator[Any], on_finished: Callable[[], None]):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_finished = on_finished
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    def _notify(self) -> None:
+        # Wake the subscribers waiting now; later waits use a new event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, source: AsyncIterator[Any]) -> None:
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._on_finished()
+            self._notify()
+            await source.aclose()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Nobody is listening: stop new subscribers from joining and close the upstream
+                self._on_finished()
+                self.task.cancel()
+
+class SharedStreams:
+    """Shares identical concurrent upstream streams"""
+
+    def __init__(self, enabled: bool = REQUEST_COALESCING_ENABLED):
+        self.enabled = enabled
+        self._streams: Dict[str, _Broadcast] = {}
+        self._stats = SingleFlightStats()
+
+    def _finished(self, key: str, broadcast: _Broadcast) -> None:
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+            self._stats.in_flight = len(self._streams)
+
+    def subscribe(self, key: str, open_stream: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """
+        Subscribe to a stream, joining the identical one already in flight
+
+        Args:
+            key: Key identifying identical streams
+            open_stream: Starts the stream (an async generator)
+
+        Returns:
+            Async iterator over every chunk of the stream, from the start
+        """
+        if not self.enabled:
+            return open_stream()
+
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast(open_stream(), lambda: self._finished(key, broadcast))
+            self._streams[key] = broadcast
+            self._stats.started += 1
+            self._stats.in_flight = len(self._streams)
+        else:
+            self._stats.coalesced += 1
+        return broadcast.subscribe()
+
+    def stats(self) -> Dict[str, float]:
+        """Get the counters"""
+        return self._stats.as_dict()
@@ -0,0 +1,143 @@
+"""
+Warm-up
+
+This module initializes the slow parts of the application (the tokenizer,
+the knowledge snapshot, the vector store and lexical index, the embeddings
+client of the response cache, the database modules used to persist
+conversations) in a background task once the server has
+started, so it accepts requests right away and the first requests usually
+find everything ready. Each part is still initialized lazily on first use,
+so a request that arrives before the warm-up reaches it does the work itself
+in a worker thread, or awaits the build already running (the knowledge
+snapshot), without blocking the event loop for other requests.
+"""
+
+import os
+import time
+import asyncio
+import importlib
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.utils.conversation_store import CONVERSATION_PERSIST_ENABLED
+from app.utils.knowledge_base import get_knowledge_base
+from app.utils.prompts import count_tokens
+from app.utils.response_cache import RESPONSE_CACHE_ENABLED, get_question_embeddings, semantic_matching_enabled
+from app.utils.retrieval import CHROMA_DB_DIR, lexical_search_enabled, vector_search_enabled
+
+# Load environment variables
+load_dotenv()
+
+# Initialize the slow parts in the background after startup
+STARTUP_WARMUP_ENABLED = os.getenv("STARTUP_WARMUP_ENABLED", "true").lower() == "true"
+
+def _open_vector_store() -> None:
+    from app.utils.document_loader import get_vector_store_handle
+    get_vector_store_handle(CHROMA_DB_DIR).get()
+
+def _open_lexical_index() -> None:
+    from app.utils.lexical_index import get_lexical_index
+    get_lexical_index(CHROMA_DB_DIR)
+
+def _load_question_embeddings() -> None:
+    import numpy  # noqa: F401
+    get_question_embeddings()
+
+def _import_database_modules() -> None:
+    from app.utils.conversation_writer import DATABASE_MODULES
+    for name in DATABASE_MODULES:
+        importlib.import_module(name)
+
+def warmup_steps() -> List[Tuple[str, Callable[[], object]]]:
+    """
+    List what to initialize for the current configuration, in order
+
+    Returns:
+        (name, blocking function) pairs
+    """
+    steps = [
+        ("tokenizer", lambda: count_tokens("")),
+        ("knowledge_base", lambda: get_knowledge_base().snapshot()),
+    ]
+    if vector_search_enabled():
+        steps.append(("vector_store", _open_vector_store))
+    if lexical_search_enabled():
+        steps.append(("lexical_index", _open_lexical_index))
+    if RESPONSE_CACHE_ENABLED and semantic_matching_enabled():
+        steps.append(("response_cache", _load_question_embeddings))
+    if CONVERSATION_PERSIST_ENABLED:
+        steps.append(("database", _import_database_modules))
+    return steps
+
+@dataclass
+class WarmupStep:
+    """Outcome of one warm-up step"""
+    seconds: float
+    error: Optional[str] = None
+
+class Warmup:
+    """Runs the warm-up steps in a background task"""
+
+    def __init__(self):
+        self.steps: Dict[str, WarmupStep] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._started = 0.0
+        self._seconds: Optional[float] = None
+
+    async def _run(self) -> None:
+        self._started = time.perf_counter()
+        for name, step in warmup_steps():
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(step)
+                self.steps[name] = WarmupStep(time.perf_counter() - start)
+            except Exception as e:
+                # The request that needs it will try again
+                self.steps[name] = WarmupStep(time.perf_counter() - start, str(e))
+                print(f"Error warming up {name}: {str(e)}")
+        self._seconds = time.perf_counter() - self._started
+        print(f"Warm-up finished in {self._seconds:.2f}s")
+
+    def start(self) -> None:
+        """Start warming up in the background"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop warming up (the step running in a thread still finishes)"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    @property
+    def state(self) -> str:
+        if self._task is None:
+            return "pending"
+        if not self._task.done():
+            return "running"
+        return "cancelled" if self._task.cancelled() else "done"
+
+    def stats(self) -> Dict[str, object]:
+        """Describe the warm-up"""
+        return {
+            "state": self.state,
+            "seconds": round(self._seconds, 3) if self._seconds is not None else None,
+            "steps": {
+                name: {"seconds": round(step.seconds, 3), "error": step.error}
+                for name, step in self.steps.items()
+            },
+        }
+
+_warmup = Warmup()
+
+def get_warmup() -> Warmup:
+    """
+    Get the process-wide warm-up
+
+    Returns:
+        Warmup started by the application
+    """
+    return _warmup
@@ -0,0 +1,57 @@
+"""
+Shared pytest fixtures for the test scripts
+"""
+
+import asyncio
+import pytest
+from sqlalchemy import event
+
+# Scripts that call the live OpenAI API or a running server when imported or
+# run; they are run by hand (python <script>), not collected by pytest
+collect_ignore = [
+    "test_openai_api.py",
+    "test_openai_requests.py",
+    "test_server.py",
+    "test_vector_store.py",
+]
+
+def _enforce_foreign_keys(dbapi_connection, connection_record) -> None:
+    # SQLite only checks foreign keys when asked to, unlike PostgreSQL
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA foreign_keys=ON")
+    finally:
+        cursor.close()
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """
+    Point the async engine at an empty SQLite database (test.db in tmp_path)
+    that enforces foreign keys
+
+    Returns:
+        Function running a coroutine and then closing the database connections
+    """
+    from app.db import session
+    create_async_db_engine = session.create_async_db_engine
+
+    def create_engine(url: str):
+        engine = create_async_db_engine(url)
+        event.listen(engine.sync_engine, "connect", _enforce_foreign_keys)
+        return engine
+
+    monkeypatch.setattr(session, "DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(session, "create_async_db_engine", create_engine)
+    monkeypatch.setattr(session, "_engine", None)
+    monkeypatch.setattr(session, "_initialized", False)
+    monkeypatch.setattr(session, "_init_lock", None)
+
+    def run(coroutine):
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                await session.close_async_engine()
+        return asyncio.run(main())
+
+    return run
@@ -7,6 +7,7 @@ for the Teacher's AI Assistant application.
 """
 
 import os
+import logging
 import argparse
 from dotenv import load_dotenv
 from app.utils.document_loader import ingest_documents
@@ -48,8 +49,23 @@ def main():
         help="Overlap between document chunks (default: 200)"
     )
     
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only process new or changed files and remove chunks of deleted files"
+    )
+    
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted ingestion without re-embedding the chunks it already wrote"
+    )
+    
     args = parser.parse_args()
     
+    # Show per-file progress and loading errors
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    
     # Create documents directory if it doesn't exist
     if not os.path.exists(args.documents_dir):
         print(f"Creating documents directory: {args.documents_dir}")
@@ -78,7 +94,9 @@ def main():
         documents_dir=args.documents_dir,
         persist_dir=args.persist_dir,
         chunk_size=args.chunk_size,
-        chunk_overlap=args.chunk_overlap
+        chunk_overlap=args.chunk_overlap,
+        incremental=args.incremental,
+        resume=args.resume
     )
     
     print("\n✅ Document ingestion complete!")
@@ -1,10 +1,15 @@
 import os
+import sys
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from app.api.routes import router as api_router
+from app.utils.http_client import init_http_client, close_http_client
+from app.utils.openai_utils import conversation_store
+from app.utils.knowledge_base import KNOWLEDGE_WATCH_ENABLED, get_knowledge_base
+from app.utils.warmup import STARTUP_WARMUP_ENABLED, get_warmup
 
 # Load environment variables
 load_dotenv()
@@ -16,6 +21,29 @@ app = FastAPI(
     version="0.1.0",
 )
 
+# Create the shared HTTP client on startup, then start watching the
+# knowledge base and warming up the slow parts (tokenizer, knowledge, vector
+# store) in the background so requests are accepted right away; stop
+# everything on shutdown
+@app.on_event("startup")
+async def startup():
+    await init_http_client()
+    if KNOWLEDGE_WATCH_ENABLED:
+        get_knowledge_base().start_watching()
+    if STARTUP_WARMUP_ENABLED:
+        get_warmup().start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await get_warmup().stop()
+    await get_knowledge_base().stop_watching()
+    await conversation_store.close()
+    # Close the pooled database connections, if the database was used
+    if "app.db.session" in sys.modules:
+        from app.db.session import close_async_engine
+        await close_async_engine()
+    await close_http_client()
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
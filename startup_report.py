@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Startup Report for the Teacher's AI Assistant
+
+This script measures how long the application takes to start: the slowest
+modules imported by `main` (from `python -X importtime`), and the time from
+launching the server until it answers its first request, which is compared
+with a target. With --chat it also sends a chat request as soon as the
+server answers, while the background warm-up is still running, times it,
+and checks that other requests are still answered promptly meanwhile.
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import subprocess
+from typing import Dict, List, Optional, Tuple
+import httpx
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Seconds from launching the server until it answers its first request
+STARTUP_TARGET_SECONDS = float(os.getenv("STARTUP_TARGET_SECONDS", 2))
+
+def import_times(module: str = "main") -> List[Tuple[str, int, int]]:
+    """
+    Import a module in a fresh interpreter with -X importtime
+
+    Args:
+        module: Module to import
+
+    Returns:
+        (module, self microseconds, cumulative microseconds) for every module imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+def print_import_report(module: str, top: int) -> None:
+    """Print the total import time of a module and its slowest imports"""
+    times = import_times(module)
+    total = next((cumulative for name, _, cumulative in reversed(times) if name == module), 0)
+    print(f"Importing {module}: {total / 1000:.0f} ms ({len(times)} modules)")
+
+    print("\nSlowest imports (cumulative, including their own imports):")
+    for name, _, cumulative in sorted(times, key=lambda t: -t[2])[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    print("\nSlowest imports (self):")
+    for name, self_us, _ in sorted(times, key=lambda t: -t[1])[:top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def time_chat_during_warmup(client: httpx.Client, base_url: str) -> Dict:
+    """
+    Send a first chat request and poll /api/stats while it runs
+
+    Args:
+        client: HTTP client
+        base_url: Base URL of the API
+
+    Returns:
+        Dict with the chat's seconds, the state of the warm-up when it was
+        sent, and the slowest /api/stats response meanwhile
+    """
+    warmup_state = client.get(f"{base_url}/stats").json().get("warmup", {}).get("state")
+    done = threading.Event()
+    latencies: List[float] = []
+
+    def poll():
+        with httpx.Client(timeout=client.timeout) as poller:
+            while not done.is_set():
+                start = time.perf_counter()
+                poller.get(f"{base_url}/stats")
+                latencies.append(time.perf_counter() - start)
+                time.sleep(0.02)
+
+    poller = threading.Thread(target=poll)
+    poller.start()
+    start = time.perf_counter()
+    try:
+        response = client.post(f"{base_url}/chat", json={"message": "¿Qué es el SIEE?"})
+    finally:
+        seconds = time.perf_counter() - start
+        done.set()
+        poller.join()
+    if response.status_code != 200 or not response.json().get("success"):
+        print(f"First chat request failed: {response.text[:200]}")
+    return {
+        "seconds": seconds,
+        "warmup_state": warmup_state,
+        "max_stats_seconds": max(latencies) if latencies else None,
+    }
+
+def time_to_first_request(timeout: float, chat: bool) -> Tuple[float, Optional[Dict], Dict]:
+    """
+    Launch the server and time its first responses
+
+    Args:
+        timeout: Seconds to wait for the server
+        chat: Also time a first chat request, sent during the warm-up
+
+    Returns:
+        Tuple of (seconds to first response, timings of the first chat
+        request or None, /api/stats once the warm-up finished)
+    """
+    port = _free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}/api"
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            first_response = None
+            while first_response is None:
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError(f"The server did not answer within {timeout:.0f}s")
+                if server.poll() is not None:
+                    raise RuntimeError(f"The server exited with code {server.returncode}")
+                try:
+                    if client.get(f"{base_url}/stats").status_code == 200:
+                        first_response = time.perf_counter() - start
+                except httpx.TransportError:
+                    time.sleep(0.02)
+
+            first_chat = time_chat_during_warmup(client, base_url) if chat else None
+
+            # Wait for the background warm-up to report its steps
+            stats = client.get(f"{base_url}/stats").json()
+            while stats.get("warmup", {}).get("state") == "running" and time.perf_counter() - start < timeout:
+                time.sleep(0.1)
+                stats = client.get(f"{base_url}/stats").json()
+            return first_response, first_chat, stats
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description="Report the import time and the time to first request of the Teacher's AI Assistant"
+    )
+
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=15,
+        help="Number of slowest imports to list (default: 15)"
+    )
+
+    parser.add_argument(
+        "--target",
+        type=float,
+        default=STARTUP_TARGET_SECONDS,
+        help="Maximum seconds to first response (default: from STARTUP_TARGET_SECONDS env var or 2)"
+    )
+
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60,
+        help="Seconds to wait for the server (default: 60)"
+    )
+
+    parser.add_argument(
+        "--chat",
+        action="store_true",
+        help="Also time a first chat request (calls the OpenAI API)"
+    )
+
+    parser.add_argument(
+        "--imports-only",
+        action="store_true",
+        help="Only report import times, without launching the server"
+    )
+
+    args = parser.parse_args()
+
+    print_import_report("main", args.top)
+    if args.imports_only:
+        return
+
+    first_response, first_chat, stats = time_to_first_request(args.timeout, args.chat)
+    print(f"\nTime to first response: {first_response:.2f}s (target {args.target:.2f}s)")
+    if first_chat is not None:
+        sent = {
+            "running": "during the warm-up",
+            "pending": "with the warm-up disabled",
+        }.get(first_chat["warmup_state"], "after the warm-up finished")
+        print(f"First chat request ({sent}): {first_chat['seconds']:.2f}s")
+        if first_chat["max_stats_seconds"] is not None:
+            print(f"Slowest /api/stats response meanwhile: {first_chat['max_stats_seconds'] * 1000:.0f} ms")
+
+    warmup = stats.get("warmup") or {}
+    if warmup.get("state") == "pending":
+        print("Background warm-up: disabled")
+    elif warmup:
+        print(f"Background warm-up ({warmup.get('state')}): {warmup.get('seconds')}s")
+        for name, step in warmup.get("steps", {}).items():
+            outcome = f"{step['seconds']:.2f}s" if step.get("error") is None else f"failed: {step['error']}"
+            print(f"  {name}: {outcome}")
+
+    if first_response > args.target:
+        print("\n❌ Startup is slower than the target")
+        sys.exit(1)
+    print("\n✅ Startup is within the target")
+
+if __name__ == "__main__":
+    main()
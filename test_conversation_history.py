@@ -0,0 +1,116 @@
+"""
+Test script for the conversation history API
+
+Chats as a user (with the OpenAI call replaced by a canned answer) and
+checks that the conversation is listed under that user, and only that user,
+in a temporary SQLite database.
+
+Run with `python -m pytest test_conversation_history.py`
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+import main
+from app.api import routes
+from app.utils import conversation_store, openai_utils, response_cache, retrieval
+
+async def _canned_completion(data: dict) -> str:
+    return "Respuesta de prueba"
+
+@pytest.fixture
+def client(database, monkeypatch):
+    """API client persisting conversations to the test database, with canned answers"""
+    monkeypatch.setattr(conversation_store, "CONVERSATION_PERSIST_ENABLED", True)
+    store = conversation_store.create_conversation_store()
+    for module in (openai_utils, routes, main):
+        monkeypatch.setattr(module, "conversation_store", store)
+    monkeypatch.setattr(openai_utils, "_complete", _canned_completion)
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_ENABLED", False)
+    monkeypatch.setattr(retrieval, "RETRIEVAL_MODE", "sample")
+    monkeypatch.setattr(main, "STARTUP_WARMUP_ENABLED", False)
+    monkeypatch.setattr(main, "KNOWLEDGE_WATCH_ENABLED", False)
+
+    # The client runs the startup and shutdown handlers, which close the
+    # database connections
+    with TestClient(main.app) as client:
+        yield client
+
+def test_list_user_conversations(client):
+    """A conversation started by a user is listed under that user"""
+    response = client.post("/api/chat", json={"message": "¿Qué es el SIEE?", "user_id": "teacher-1"})
+    assert response.status_code == 200
+    conversation_id = response.json()["conversation_id"]
+
+    response = client.get("/api/conversations", params={"user_id": "teacher-1"})
+    assert response.status_code == 200
+    conversations = response.json()["conversations"]
+    assert [c["id"] for c in conversations] == [conversation_id]
+    assert conversations[0]["title"] == "¿Qué es el SIEE?"
+
+    response = client.get("/api/conversations", params={"user_id": "teacher-2"})
+    assert response.json()["conversations"] == []
+
+    response = client.get(f"/api/conversations/{conversation_id}/messages")
+    assert [m["role"] for m in response.json()["messages"]] == ["user", "assistant"]
+
+def test_save_conversations_of_unregistered_users(database):
+    """Conversations of users without a `users` row, and anonymous ones, are saved"""
+    from app.utils.conversation_writer import ConversationWriter
+
+    async def scenario():
+        writer = ConversationWriter()
+        writer.save("c1", [{"role": "user", "content": "Hola"}], "teacher-1")
+        writer.save("c2", [{"role": "user", "content": "Buenas"}])
+        await writer.close()
+        return writer.stats()
+
+    stats = database(scenario())
+    assert stats["written_messages"] == 2
+    assert stats["dropped_messages"] == 0
+
+# Schema created by the first version of app.db.models
+BASELINE_SCHEMA = [
+    """CREATE TABLE users (
+        id VARCHAR NOT NULL, name VARCHAR NOT NULL, email VARCHAR NOT NULL, created_at DATETIME,
+        PRIMARY KEY (id), UNIQUE (email))""",
+    """CREATE TABLE conversations (
+        id VARCHAR NOT NULL, user_id VARCHAR NOT NULL, title VARCHAR NOT NULL,
+        created_at DATETIME, updated_at DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))""",
+    """CREATE TABLE messages (
+        id VARCHAR NOT NULL, conversation_id VARCHAR NOT NULL, role VARCHAR NOT NULL,
+        content TEXT NOT NULL, created_at DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(conversation_id) REFERENCES conversations (id))""",
+]
+
+def test_migrate_baseline_database(database, tmp_path):
+    """A database created by the first version accepts anonymous conversations and keeps its rows"""
+    import sqlite3
+    from sqlalchemy import text
+    from app.db.session import get_async_engine, init_async_db
+    from app.utils.conversation_writer import ConversationWriter
+
+    db = sqlite3.connect(tmp_path / "test.db")
+    for statement in BASELINE_SCHEMA:
+        db.execute(statement)
+    db.execute("INSERT INTO users VALUES ('u1', 'Ana', 'ana@example.com', '2024-01-01 00:00:00')")
+    db.execute("INSERT INTO conversations VALUES ('c0', 'u1', 'Antes', '2024-01-01 00:00:00', '2024-01-01 00:00:00')")
+    db.execute("INSERT INTO messages VALUES ('m0', 'c0', 'user', 'Hola', '2024-01-01 00:00:00')")
+    db.commit()
+    db.close()
+
+    async def scenario():
+        await init_async_db()
+        writer = ConversationWriter()
+        writer.save("c1", [{"role": "user", "content": "Anónimo"}])
+        await writer.close()
+        async with get_async_engine().connect() as conn:
+            foreign_keys = (await conn.execute(text("PRAGMA foreign_keys"))).scalar()
+            versions = (await conn.execute(text("SELECT version FROM schema_version"))).scalars().all()
+        return writer.stats(), foreign_keys, versions, await writer.load("c0")
+
+    stats, foreign_keys, versions, old_messages = database(scenario())
+    assert foreign_keys == 1
+    assert versions == [1, 2]
+    assert stats["written_messages"] == 1
+    assert [m["content"] for m in old_messages] == ["Hola"]
@@ -0,0 +1,126 @@
+"""
+Test script for the conversation writer
+
+Persists turns through ConversationWriter to a temporary SQLite database and
+checks what is read back while turns are still queued, deletes of pending
+conversations, and the turns dropped when the queue is full or the database
+keeps failing.
+
+Run with `python -m pytest test_conversation_writer.py`
+"""
+
+import time
+from app.utils.conversation_store import MemoryConversationStore
+from app.utils.conversation_writer import ConversationWriter
+
+def _turn(question: str, answer: str):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+def _contents(messages):
+    return [m["content"] for m in messages] if messages is not None else None
+
+def test_load_sees_queued_turns(database):
+    """A load returns the turns already written followed by those still queued"""
+    async def scenario():
+        writer = ConversationWriter(interval=0.05)
+        writer.save("c1", _turn("Hola", "Buenos días"))
+        writer.save("c2", _turn("Otra", "Conversación"))
+        await writer.flush()
+        written = writer.stats()
+
+        writer.save("c1", _turn("¿Qué es el SIEE?", "El sistema de evaluación"))
+        messages = await writer.load("c1")
+        await writer.close()
+        return written, messages
+
+    written, messages = database(scenario())
+    assert written["batches"] == 1
+    assert written["written_messages"] == 4
+    assert _contents(messages) == ["Hola", "Buenos días", "¿Qué es el SIEE?", "El sistema de evaluación"]
+
+def test_load_of_unknown_conversation_does_not_wait_for_the_queue(database):
+    """Reading a conversation without pending turns goes straight to the database"""
+    async def scenario():
+        writer = ConversationWriter(interval=2.0)
+        writer.save("c1", _turn("Hola", "Buenos días"))
+        start = time.perf_counter()
+        messages = await writer.load("c2")
+        seconds = time.perf_counter() - start
+        await writer.close()
+        return messages, seconds
+
+    messages, seconds = database(scenario())
+    assert messages is None
+    assert seconds < 1.0
+
+def test_delete_with_pending_turns(database):
+    """Deleting a conversation removes the turns still queued for it, and only those"""
+    async def scenario():
+        writer = ConversationWriter(interval=0.05)
+        writer.save("c1", _turn("Hola", "Buenos días"))
+        writer.save("c2", _turn("Otra", "Conversación"))
+        await writer.delete("c1")
+        await writer.close()
+        return await writer.load("c1"), await writer.load("c2")
+
+    deleted, kept = database(scenario())
+    assert deleted is None
+    assert _contents(kept) == ["Otra", "Conversación"]
+
+def test_full_queue_drops_turns(database):
+    """Turns arriving while the queue is full are dropped and counted"""
+    async def scenario():
+        writer = ConversationWriter(queue_size=2)
+        for i in range(3):
+            writer.save("c1", _turn(f"Pregunta {i}", f"Respuesta {i}"))
+        dropped = writer.stats()
+        await writer.close()
+        return dropped, writer.stats(), await writer.load("c1")
+
+    dropped, stats, messages = database(scenario())
+    assert dropped["queued_messages"] == 4
+    assert dropped["dropped_messages"] == 2
+    assert stats["written_messages"] == 4
+    assert _contents(messages) == ["Pregunta 0", "Respuesta 0", "Pregunta 1", "Respuesta 1"]
+
+def test_failing_batch_is_retried_then_dropped(database):
+    """A batch is retried while the database fails, then dropped and counted"""
+    async def scenario():
+        writer = ConversationWriter(retries=2)
+        attempts = []
+
+        async def failing_write(turns):
+            attempts.append(len(turns))
+            raise RuntimeError("database unavailable")
+
+        writer._write = failing_write
+        writer.save("c1", _turn("Hola", "Buenos días"))
+        await writer.flush()
+        stats = writer.stats()
+        # Nothing is pending anymore, so the load does not wait for the queue
+        messages = await writer.load("c1")
+        await writer.close()
+        return attempts, stats, messages
+
+    attempts, stats, messages = database(scenario())
+    assert attempts == [1, 1]
+    assert stats["retries"] == 1
+    assert stats["dropped_messages"] == 2
+    assert stats["written_messages"] == 0
+    assert messages is None
+
+def test_store_rehydrates_evicted_conversation(database):
+    """A conversation evicted from memory is reloaded through the writer"""
+    async def scenario():
+        store = MemoryConversationStore(max_conversations=1, database=ConversationWriter(interval=0.05))
+        await store.append("c1", *_turn("Hola", "Buenos días"))
+        await store.append("c2", *_turn("Otra", "Conversación"))
+        messages = await store.get("c1")
+        stats = store.stats()
+        await store.close()
+        return messages, stats
+
+    messages, stats = database(scenario())
+    assert _contents(messages) == ["Hola", "Buenos días"]
+    assert stats["lru_evictions"] >= 1
+    assert stats["rehydrations"] == 1
@@ -0,0 +1,168 @@
+"""
+Test script for the shared HTTP client
+
+Points OPENAI_API_BASE at a local stub of the Chat Completions API (served
+by uvicorn in a background thread) and checks the connection pooling, the
+bound on concurrent upstream requests, the timeouts and the parsing of
+streamed (SSE) completions.
+
+Run with `python -m pytest test_http_client.py`
+"""
+
+import json
+import socket
+import asyncio
+import threading
+import time
+import httpx
+import pytest
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from app.utils import http_client
+from app.utils.openai_utils import _complete, _stream_completion
+
+class StubState:
+    """What the stub server saw"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.client_ports = set()
+        self.delay = 0.0
+
+def create_stub_app(state: StubState) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        with state.lock:
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            state.client_ports.add(request.client.port)
+        try:
+            await asyncio.sleep(state.delay)
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+        if not body.get("stream"):
+            return {"choices": [{"message": {"content": "respuesta"}}]}
+
+        def event(payload) -> str:
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def stream():
+            yield ": keep-alive\n\n"
+            yield event({"choices": [{"delta": {"role": "assistant"}}]})
+            yield event({"choices": [{"delta": {"content": "Hola"}}]})
+            yield event({"choices": []})
+            yield event({"choices": [{"delta": {"content": ", docente"}}]})
+            yield "data: [DONE]\n\n"
+            yield event({"choices": [{"delta": {"content": "después del final"}}]})
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+@pytest.fixture(scope="module")
+def stub():
+    """Local stub server, with the state it records"""
+    state = StubState()
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(create_stub_app(state), port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}/v1", state
+    server.should_exit = True
+    thread.join()
+
+@pytest.fixture
+def configure(stub, monkeypatch):
+    """Point the shared client at the stub, with the given settings"""
+    base_url, state = stub
+    state.reset()
+    monkeypatch.setattr(http_client, "OPENAI_API_BASE", base_url)
+    monkeypatch.setattr(http_client, "_client", None)
+    monkeypatch.setattr(http_client, "_semaphore", None)
+
+    def configure(**settings):
+        for name, value in settings.items():
+            monkeypatch.setattr(http_client, name, value)
+        return state
+
+    return configure
+
+def _run(scenario):
+    async def main():
+        await http_client.init_http_client()
+        try:
+            return await scenario()
+        finally:
+            await http_client.close_http_client()
+    return asyncio.run(main())
+
+def test_keepalive_connection_is_reused(configure):
+    """Sequential requests share one pooled connection"""
+    state = configure()
+
+    async def scenario():
+        return [await _complete({"messages": []}) for _ in range(5)]
+
+    assert _run(scenario) == ["respuesta"] * 5
+    assert len(state.client_ports) == 1
+
+def test_semaphore_bounds_concurrent_requests(configure):
+    """No more than OPENAI_MAX_CONCURRENCY requests are in flight at once"""
+    state = configure(OPENAI_MAX_CONCURRENCY=2)
+    state.delay = 0.1
+
+    async def scenario():
+        return await asyncio.gather(*[_complete({"messages": []}) for _ in range(6)])
+
+    assert _run(scenario) == ["respuesta"] * 6
+    assert state.max_in_flight == 2
+
+def test_pool_bounds_connections(configure):
+    """The pool never opens more than HTTP_MAX_CONNECTIONS connections"""
+    state = configure(OPENAI_MAX_CONCURRENCY=10, HTTP_MAX_CONNECTIONS=3, HTTP_MAX_KEEPALIVE_CONNECTIONS=3)
+    state.delay = 0.1
+
+    async def scenario():
+        return await asyncio.gather(*[_complete({"messages": []}) for _ in range(9)])
+
+    assert _run(scenario) == ["respuesta"] * 9
+    assert state.max_in_flight == 3
+    assert len(state.client_ports) == 3
+
+def test_read_timeout(configure):
+    """A response slower than HTTP_READ_TIMEOUT fails instead of hanging"""
+    state = configure(HTTP_READ_TIMEOUT=0.2, OPENAI_MAX_CONCURRENCY=1)
+    state.delay = 1.0
+
+    async def scenario():
+        with pytest.raises(httpx.ReadTimeout):
+            await _complete({"messages": []})
+        # The slot is released, so the next request goes through
+        state.delay = 0.0
+        return await _complete({"messages": []})
+
+    assert _run(scenario) == "respuesta"
+
+def test_stream_parses_sse_deltas(configure):
+    """Only the content deltas are yielded, up to [DONE]"""
+    configure()
+
+    async def scenario():
+        return [delta async for delta in _stream_completion({"messages": [], "stream": True})]
+
+    assert _run(scenario) == ["Hola", ", docente"]
@@ -0,0 +1,74 @@
+"""
+Test script for the token counting of the prompts
+
+Checks that the event loop never loads the tokenizer's encoding (it is
+loaded in a background thread while tokens are estimated), and that the
+estimates made meanwhile are not kept.
+
+Run with `python -m pytest test_prompts.py`
+"""
+
+import time
+import asyncio
+import threading
+from app.utils import prompts
+from app.utils.context_window import TOKENS_PER_MESSAGE, count_message_tokens, make_message
+
+class _WordEncoding:
+    """Stand-in encoding with one token per word"""
+
+    def encode(self, text: str):
+        return text.split()
+
+def test_event_loop_estimates_while_the_encoding_loads(monkeypatch):
+    """Counting on the event loop starts the load in a thread and returns an estimate"""
+    release = threading.Event()
+    loaded = threading.Event()
+
+    def slow_load():
+        release.wait(5)
+        prompts._encoding = _WordEncoding()
+        loaded.set()
+
+    monkeypatch.setattr(prompts, "_encoding", None)
+    monkeypatch.setattr(prompts, "_encoding_loader", None)
+    monkeypatch.setattr(prompts, "_load_encoding", slow_load)
+    system_message = prompts.SystemMessage("uno dos tres cuatro cinco seis", None, 1)
+    user_message = make_message("user", "siete ocho")
+
+    async def count_on_loop():
+        start = time.perf_counter()
+        counts = (
+            prompts.count_tokens("uno dos tres"),
+            system_message.token_count,
+            count_message_tokens(user_message),
+        )
+        return counts, time.perf_counter() - start
+
+    (text_tokens, system_tokens, user_tokens), seconds = asyncio.run(count_on_loop())
+    assert seconds < 0.5
+    assert text_tokens == len("uno dos tres") // 4 + 1
+    assert system_tokens == len(system_message["content"]) // 4 + 1
+    assert user_tokens == len("siete ocho") // 4 + 1 + TOKENS_PER_MESSAGE
+    assert not prompts.encoding_loaded()
+
+    release.set()
+    assert loaded.wait(5)
+
+    # The estimates were not kept: the shared messages are recounted
+    assert system_message.token_count == 6
+    assert user_message.token_count is None
+    assert count_message_tokens(user_message) == 2 + TOKENS_PER_MESSAGE
+    assert user_message.token_count == 2
+
+def test_threads_load_the_encoding(monkeypatch):
+    """Outside the event loop the encoding is loaded before counting"""
+    monkeypatch.setattr(prompts, "_encoding", None)
+    monkeypatch.setattr(prompts, "_encoding_loader", None)
+
+    def load():
+        prompts._encoding = _WordEncoding()
+
+    monkeypatch.setattr(prompts, "_load_encoding", load)
+    assert prompts.count_tokens("uno dos tres") == 3
+    assert prompts.encoding_loaded()
@@ -0,0 +1,56 @@
+"""
+Test script for the response cache
+
+Matches questions by embedding (with fixed vectors instead of the embeddings
+API) and checks that expired answers are never returned, even when they are
+the most similar ones.
+
+Run with `python -m pytest test_response_cache.py`
+"""
+
+import numpy as np
+import pytest
+from app.utils import response_cache
+from app.utils.response_cache import ResponseCache
+
+# Angles of the question embeddings: the two stored questions are not similar
+# to each other, but both are to the new one, which is closest to "expirada"
+ANGLES = {
+    "pregunta expirada": 0.0,
+    "pregunta vigente": 0.35,
+    "pregunta nueva": 0.17,
+}
+
+def _embed(question: str):
+    angle = ANGLES[question]
+    return np.asarray([np.cos(angle), np.sin(angle)], dtype=np.float32)
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(response_cache, "knowledge_version", lambda: ("knowledge", 1))
+    return ResponseCache(ttl_seconds=60, similarity=0.95, embed=_embed)
+
+def _store(cache: ResponseCache, question: str, answer: str) -> None:
+    _, query = cache.lookup(question)
+    cache.put(query, answer)
+
+def test_semantic_match(cache):
+    """A similar question gets the cached answer"""
+    _store(cache, "pregunta vigente", "respuesta vigente")
+
+    answer, _ = cache.lookup("pregunta nueva")
+    assert answer == "respuesta vigente"
+    assert cache.stats()["semantic_hits"] == 1
+
+def test_semantic_match_skips_expired_entries(cache):
+    """An expired nearest question is dropped and the next live one is returned"""
+    _store(cache, "pregunta expirada", "respuesta expirada")
+    _store(cache, "pregunta vigente", "respuesta vigente")
+    cache._entries[("pregunta expirada", response_cache.filter_key(None))].created -= 120
+
+    answer, _ = cache.lookup("pregunta nueva")
+    stats = cache.stats()
+    assert answer == "respuesta vigente"
+    assert stats["semantic_hits"] == 1
+    assert stats["expirations"] == 1
+    assert stats["entries"] == 1
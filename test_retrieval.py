@@ -0,0 +1,45 @@
+"""
+Test script for the retrieval context
+
+Checks what is sent to the model when the search for a question finds no
+chunks, with and without filters (the search itself is replaced, so no index
+is needed).
+
+Run with `python -m pytest test_retrieval.py`
+"""
+
+import asyncio
+from langchain.docstore.document import Document
+from app.utils import retrieval
+from app.utils.metadata_filter import MetadataFilter
+
+def _search_returning(documents):
+    def search_documents(question, k, mode, filters, embedding):
+        return documents
+    return search_documents
+
+def test_filtered_question_without_matches_says_so(monkeypatch):
+    """A filtered question matching nothing gets an explicit "no matching fragments" context"""
+    monkeypatch.setattr(retrieval, "search_documents", _search_returning([]))
+    filters = MetadataFilter.from_dict({"pillar": "Inexistente"})
+
+    context = asyncio.run(retrieval.retrieve_context("¿Qué es el SIEE?", filters=filters))
+
+    assert context is not None
+    assert context["content"] == retrieval.NO_MATCHING_CONTEXT
+
+def test_unfiltered_question_without_matches_falls_back(monkeypatch):
+    """An unfiltered search finding nothing (empty index) leaves the fallback to the caller"""
+    monkeypatch.setattr(retrieval, "search_documents", _search_returning([]))
+
+    assert asyncio.run(retrieval.retrieve_context("¿Qué es el SIEE?")) is None
+
+def test_filtered_question_with_matches(monkeypatch):
+    """Matching chunks are sent as usual"""
+    chunk = Document(page_content="El SIEE es el sistema de evaluación", metadata={"file_name": "siee.json"})
+    monkeypatch.setattr(retrieval, "search_documents", _search_returning([chunk]))
+    filters = MetadataFilter.from_dict({"file_name": "siee.json"})
+
+    context = asyncio.run(retrieval.retrieve_context("¿Qué es el SIEE?", filters=filters))
+
+    assert "### siee.json:\nEl SIEE es el sistema de evaluación" in context["content"]